@@ -0,0 +1,198 @@
+"""
+Admission control and load shedding.
+
+Three signals are checked against the budget for a route's priority
+class:
+
+* the worker's own in-flight requests (useful with gthread and gevent;
+  a sync worker only ever has the one request it is serving)
+* how many connections wait in the listen socket's accept queue, shared
+  by every worker on the host. gunicorn.conf.py hands the listening
+  sockets to watch() in each worker; the depth is read with TCP_INFO
+  (Linux only)
+* how long the request waited before reaching the app, from the
+  ``X-Request-Start`` header a proxy such as nginx adds (see
+  DEPLOYMENT.md)
+
+When any signal is over budget the request is answered immediately with
+``503`` and ``Retry-After`` instead of joining the queue, so catalog
+browsing is shed well before checkout is. If neither queue signal is
+available only the in-flight limit applies; a warning is logged once per
+process and /api/metrics counts the requests that came without the header.
+"""
+import logging
+import socket
+import struct
+import threading
+import time
+
+from flask import current_app, jsonify, request
+
+PRIORITIES = ('low', 'normal', 'critical')
+
+logger = logging.getLogger(__name__)
+
+# struct tcp_info starts with 8 bytes of flags then __u32 fields; for a
+# listening socket tcpi_unacked is the accept queue length
+_TCP_INFO = struct.Struct('8B6I')
+
+
+def accept_queue_depth(sock):
+    """Connections waiting to be accepted on a listening TCP socket, or None"""
+    if not hasattr(socket, 'TCP_INFO') or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO.size)
+    except OSError:
+        return None
+    return _TCP_INFO.unpack_from(info)[12]
+
+
+def parse_request_start(header, now):
+    """Return seconds since the X-Request-Start timestamp, or None.
+
+    Accepts ``t=<epoch>`` or a bare epoch in seconds, milliseconds or
+    microseconds, as emitted by nginx, Heroku and Railway style routers.
+    """
+    if not header:
+        return None
+    value = header[2:] if header.startswith('t=') else header
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, now - started)
+
+
+class AdmissionController:
+    """Flask extension shedding low-priority work when a worker is overloaded"""
+
+    def __init__(self, app=None):
+        self.priorities = {}
+        self.default_priority = 'normal'
+        self.inflight_limits = {}
+        self.backlog_limits = {}
+        self.queue_budgets = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._queue_delay_ewma = 0.0
+        self._backlog = None
+        self._without_request_start = 0
+        self._warned = False
+        self._admitted = dict.fromkeys(PRIORITIES, 0)
+        self._shed = dict.fromkeys(PRIORITIES, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_ENABLED', True)
+        app.config.setdefault('ADMISSION_MAX_INFLIGHT', 32)
+        # Connections queued in the listen socket, host-wide
+        app.config.setdefault('ADMISSION_MAX_BACKLOG', 64)
+        app.config.setdefault('ADMISSION_PRIORITIES', {})
+        app.config.setdefault('ADMISSION_DEFAULT_PRIORITY', 'normal')
+        # Fraction of ADMISSION_MAX_INFLIGHT (and ADMISSION_MAX_BACKLOG) each class may use
+        app.config.setdefault('ADMISSION_INFLIGHT_SHARE', {'low': 0.5, 'normal': 0.8, 'critical': 1.0})
+        # Longest queue wait (seconds) each class will still be served after
+        app.config.setdefault('ADMISSION_QUEUE_BUDGET', {'low': 0.5, 'normal': 2.0, 'critical': 10.0})
+        app.config.setdefault('ADMISSION_RETRY_AFTER', 1)
+
+        max_inflight = app.config['ADMISSION_MAX_INFLIGHT']
+        share = app.config['ADMISSION_INFLIGHT_SHARE']
+        self.priorities = dict(app.config['ADMISSION_PRIORITIES'])
+        self.default_priority = app.config['ADMISSION_DEFAULT_PRIORITY']
+        self.inflight_limits = {p: max(1, int(max_inflight * share[p])) for p in PRIORITIES}
+        max_backlog = app.config['ADMISSION_MAX_BACKLOG']
+        self.backlog_limits = {p: max(1, int(max_backlog * share[p])) for p in PRIORITIES}
+        self.queue_budgets = dict(app.config['ADMISSION_QUEUE_BUDGET'])
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+        app.extensions['admission'] = self
+
+    def priority_for(self, rule):
+        return self.priorities.get(rule, self.default_priority)
+
+    def watch(self, sockets):
+        """Shed on the accept queue of these listening sockets (one per bind)"""
+        self.listeners = [sock for sock in sockets if accept_queue_depth(sock) is not None]
+
+    def backlog(self):
+        """Connections waiting on the watched sockets, or None if none are watched"""
+        if not self.listeners:
+            return None
+        return sum(accept_queue_depth(sock) or 0 for sock in self.listeners)
+
+    def decide(self, priority, queue_delay, backlog=None):
+        """Admit or shed one request; returns the reason when shedding"""
+        with self._lock:
+            if backlog is not None:
+                self._backlog = backlog
+                if backlog >= self.backlog_limits[priority]:
+                    self._shed[priority] += 1
+                    return 'backlog'
+            if queue_delay is not None:
+                self._queue_delay_ewma += 0.2 * (queue_delay - self._queue_delay_ewma)
+                if queue_delay > self.queue_budgets[priority]:
+                    self._shed[priority] += 1
+                    return 'queue_delay'
+            if self._inflight >= self.inflight_limits[priority]:
+                self._shed[priority] += 1
+                return 'inflight'
+            self._inflight += 1
+            self._admitted[priority] += 1
+            return None
+
+    def _admit(self):
+        config = current_app.config
+        if not config['ADMISSION_ENABLED'] or request.method == 'OPTIONS':
+            return None
+        rule = request.url_rule.rule if request.url_rule is not None else '*'
+        priority = self.priority_for(rule)
+        header = request.headers.get('X-Request-Start')
+        if header is None:
+            self._missing_request_start()
+        queue_delay = parse_request_start(header, time.time())
+        reason = self.decide(priority, queue_delay, self.backlog())
+        if reason is None:
+            request.environ['admission.slot'] = True
+            return None
+
+        response = jsonify({'error': 'Service overloaded, please retry', 'reason': reason})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(config['ADMISSION_RETRY_AFTER'])
+        return response
+
+    def _missing_request_start(self):
+        with self._lock:
+            self._without_request_start += 1
+            if self._warned or self.listeners:
+                return
+            self._warned = True
+        logger.warning('admission control cannot see queueing: no X-Request-Start header and no '
+                       'listen socket to watch, so only the in-flight limit applies')
+
+    def _release(self, exc=None):
+        # Flagged on the WSGI environ: g may already be gone when a test
+        # client tears down a preserved request context
+        if request.environ.pop('admission.slot', False):
+            with self._lock:
+                self._inflight -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'inflight': self._inflight,
+                'inflight_limits': dict(self.inflight_limits),
+                'backlog': self._backlog,
+                'backlog_limits': dict(self.backlog_limits) if self.listeners else None,
+                'queue_delay_ewma_ms': round(self._queue_delay_ewma * 1000, 2),
+                'without_request_start': self._without_request_start,
+                'admitted': dict(self._admitted),
+                'shed': dict(self._shed),
+            }
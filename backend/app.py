@@ -1,14 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import base64
+import gc
+import csv
+import hmac
+import io
+import json
+import logging
 import re
 import os
+import time
+import zlib
 from dotenv import load_dotenv
+import click
+from sqlalchemy.exc import IntegrityError
+from admission import AdmissionController
+from circuit import CircuitOpenError
+from discount_cache import DiscountCodeCache, DiscountCodeFilter, DiscountEntry, invalidate_on_change
+from jobs import PeriodicJobs
+from logs import REQUEST_ID_HEADER, StructuredLogging
+from mailer import AsyncMailer
+from memtrace import GROUPINGS, MemoryTracer
+from order_cache import OrderReadCache, invalidate_orders_on_change
+from order_ids import OrderNumberGenerator
+from profiling import RequestProfiler, sign_profile_token
+from ratelimit import RateLimiter
+from replicas import ReplicaRouter, RoutingSession
+from slow_queries import SlowQueryLog
+from validation import Field, Schema, ValidationError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 # Use DATABASE_URL if provided, otherwise default to SQLite
 database_url = os.getenv('DATABASE_URL')
@@ -17,30 +43,198 @@ if database_url:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ecommerce.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Size the connection pool to the requests one worker serves at once
+# (1 for sync workers, threads/greenlets otherwise - see gunicorn.conf.py),
+# capped at DB_POOL_SIZE (default 10): a gevent worker runs 100 greenlets,
+# and 100 connections per worker would exhaust PostgreSQL's default
+# max_connections (100) with a single worker. Each worker opens at most
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections; greenlets beyond that wait
+# up to DB_POOL_TIMEOUT seconds for one to come free
+worker_concurrency = int(os.getenv('WORKER_CONCURRENCY', 1))
+if database_url and not database_url.startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', min(worker_concurrency, 10))),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'pool_pre_ping': True,
+    }
+# Create and seed the schema in create_app(); with --preload this runs
+# once in the gunicorn master instead of never (or once per worker)
+app.config['DB_INIT_ON_START'] = os.getenv('DB_INIT_ON_START', 'false').lower() == 'true'
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# Read replicas - comma-separated DATABASE_REPLICA_URLS; reads on the
+# DB_REPLICA_ROUTES endpoints go to a replica, except a session's reads for
+# DB_PIN_SECONDS after it writes (pins shared like rate limits, see below)
+app.config['DB_REPLICA_URLS'] = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+                                 if url.strip()]
+app.config['DB_REPLICA_ROUTES'] = {'get_products', 'get_order', 'get_cart', 'health_check'}
+app.config['DB_PIN_SECONDS'] = float(os.getenv('DB_PIN_SECONDS', 5))
+
 # Email configuration
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+app.config['MAIL_ASYNC'] = os.getenv('MAIL_ASYNC', 'true').lower() == 'true'
+# Give up on an SMTP operation after MAIL_TIMEOUT seconds; after
+# MAIL_BREAKER_FAILURES failed deliveries in a row stop trying (emails are
+# skipped and logged) until a probe succeeds, MAIL_BREAKER_RESET seconds later
+app.config['MAIL_TIMEOUT'] = float(os.getenv('MAIL_TIMEOUT', 10))
+app.config['MAIL_BREAKER_FAILURES'] = int(os.getenv('MAIL_BREAKER_FAILURES', 5))
+app.config['MAIL_BREAKER_RESET'] = float(os.getenv('MAIL_BREAKER_RESET', 30))
+
+# Rate limiting - set RATELIMIT_STORAGE_URI=shm:///dev/shm/<name> to share
+# buckets between gunicorn workers on the same host
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATELIMIT_STORAGE_URI'] = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+app.config['DB_PIN_STORAGE_URI'] = os.getenv('DB_PIN_STORAGE_URI', app.config['RATELIMIT_STORAGE_URI'])
+app.config['RATELIMIT_DEFAULT'] = os.getenv('RATELIMIT_DEFAULT', '100/minute')
+app.config['RATELIMIT_ROUTES'] = {
+    '/api/checkout': os.getenv('RATELIMIT_CHECKOUT', '10/minute'),
+    '/api/discount/apply': os.getenv('RATELIMIT_DISCOUNT', '20/minute'),
+}
+app.config['RATELIMIT_TRUST_PROXY'] = os.getenv('RATELIMIT_TRUST_PROXY', 'false').lower() == 'true'
+app.config['RATELIMIT_EXEMPT'] = ['/api/health', '/api/metrics']
+
+# Admission control - shed catalog browsing before cart and checkout traffic
+# when a worker is saturated or requests have queued too long (in the listen
+# backlog, or per the proxy's X-Request-Start header)
+app.config['ADMISSION_ENABLED'] = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+app.config['ADMISSION_MAX_INFLIGHT'] = int(os.getenv('ADMISSION_MAX_INFLIGHT', worker_concurrency))
+app.config['ADMISSION_MAX_BACKLOG'] = int(os.getenv('ADMISSION_MAX_BACKLOG', 64))
+app.config['ADMISSION_PRIORITIES'] = {
+    '/api/products': 'low',
+    '/api/checkout': 'critical',
+    '/api/orders': 'low',
+    '/api/orders/export': 'low',
+    '/api/reports/sales': 'low',
+    '/api/admin/slow-queries': 'low',
+    '/api/admin/profiles': 'low',
+    '/api/admin/profiles/<endpoint>': 'low',
+    '/api/admin/memory': 'low',
+    '/api/admin/memory/start': 'low',
+    '/api/admin/memory/stop': 'low',
+    '/api/admin/memory/snapshots': 'low',
+    '/api/admin/memory/diff': 'low',
+    '/api/orders/<order_number>': 'critical',
+    '/api/health': 'critical',
+    '/api/metrics': 'critical',
+}
+
+# Stock reservations - add-to-cart holds stock for RESERVATION_TTL seconds;
+# each worker releases expired holds every RESERVATION_SWEEP_INTERVAL seconds
+app.config['RESERVATION_TTL'] = int(os.getenv('RESERVATION_TTL', 900))
+app.config['RESERVATION_SWEEP_INTERVAL'] = int(os.getenv('RESERVATION_SWEEP_INTERVAL', 30))
+app.config['RESERVATION_SWEEP_BATCH'] = int(os.getenv('RESERVATION_SWEEP_BATCH', 500))
+
+# Abandoned carts - carts untouched for CART_TTL seconds are deleted in
+# batches of CART_GC_BATCH rows, pausing CART_GC_PAUSE seconds between batches
+app.config['CART_TTL'] = int(os.getenv('CART_TTL', 7 * 24 * 3600))
+app.config['CART_GC_INTERVAL'] = int(os.getenv('CART_GC_INTERVAL', 3600))
+app.config['CART_GC_BATCH'] = int(os.getenv('CART_GC_BATCH', 1000))
+app.config['CART_GC_PAUSE'] = float(os.getenv('CART_GC_PAUSE', 0.05))
+
+# Discount code cache - valid codes for DISCOUNT_CACHE_TTL seconds (never past
+# their expiry), unknown codes for DISCOUNT_NEGATIVE_TTL seconds
+app.config['DISCOUNT_CACHE_TTL'] = int(os.getenv('DISCOUNT_CACHE_TTL', 300))
+app.config['DISCOUNT_NEGATIVE_TTL'] = int(os.getenv('DISCOUNT_NEGATIVE_TTL', 30))
+# Bloom filter of known codes rejects guesses before the cache and database;
+# codes created by other workers are picked up every DISCOUNT_FILTER_REFRESH
+# seconds, or by the first miss once the filter is older than that
+app.config['DISCOUNT_FILTER_ENABLED'] = os.getenv('DISCOUNT_FILTER_ENABLED', 'true').lower() == 'true'
+app.config['DISCOUNT_FILTER_ERROR_RATE'] = float(os.getenv('DISCOUNT_FILTER_ERROR_RATE', 0.001))
+app.config['DISCOUNT_FILTER_REFRESH'] = int(os.getenv('DISCOUNT_FILTER_REFRESH', 30))
+
+# Order lookups - server-side cache TTL and browser max-age for
+# GET /api/orders/<order_number>; responses carry an ETag either way.
+# A cached order's status is checked against the database at most once
+# per ORDER_CACHE_STATUS_TTL seconds, which bounds how long a change made
+# by another worker goes unseen; orders in the final statuses never change
+app.config['ORDER_CACHE_TTL'] = int(os.getenv('ORDER_CACHE_TTL', 300))
+app.config['ORDER_CACHE_MAX_AGE'] = int(os.getenv('ORDER_CACHE_MAX_AGE', 60))
+app.config['ORDER_CACHE_STATUS_TTL'] = float(os.getenv('ORDER_CACHE_STATUS_TTL', 5))
+app.config['ORDER_CACHE_FINAL_STATUSES'] = os.getenv('ORDER_CACHE_FINAL_STATUSES',
+                                                     'cancelled,refunded').split(',')
+# Order listing - page size for GET /api/orders
+app.config['ORDER_PAGE_SIZE'] = int(os.getenv('ORDER_PAGE_SIZE', 20))
+app.config['ORDER_PAGE_SIZE_MAX'] = int(os.getenv('ORDER_PAGE_SIZE_MAX', 100))
+
+# Order export - rows fetched per batch while streaming GET /api/orders/export
+app.config['ORDER_EXPORT_BATCH'] = int(os.getenv('ORDER_EXPORT_BATCH', 1000))
+
+# Slow-query log (opt-in) - statements slower than the threshold are logged
+# and ranked by total time, with an EXPLAIN of each; read them per worker
+# from GET /api/admin/slow-queries
+app.config['SLOW_QUERY_ENABLED'] = os.getenv('SLOW_QUERY_ENABLED', 'false').lower() == 'true'
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 100))
+app.config['SLOW_QUERY_EXPLAIN'] = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+
+# Request profiling (opt-in) - profiles requests carrying an X-Profile header
+# signed with PROFILE_SECRET (see `flask profile-token`) or a random sample;
+# files per endpoint under PROFILE_DIR, merged at GET /api/admin/profiles
+app.config['PROFILE_ENABLED'] = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+app.config['PROFILE_SECRET'] = os.getenv('PROFILE_SECRET')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_FORMAT'] = os.getenv('PROFILE_FORMAT', 'collapsed')
+if os.getenv('PROFILE_DIR'):
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR')
+
+# Memory tracing (opt-in) - lets an admin start tracemalloc in one worker,
+# snapshot it and diff snapshots by line; traceback depth, kept snapshots and
+# tracing time are capped, see /api/admin/memory
+app.config['MEMTRACE_ENABLED'] = os.getenv('MEMTRACE_ENABLED', 'false').lower() == 'true'
+app.config['MEMTRACE_FRAMES'] = int(os.getenv('MEMTRACE_FRAMES', 1))
+app.config['MEMTRACE_MAX_SNAPSHOTS'] = int(os.getenv('MEMTRACE_MAX_SNAPSHOTS', 5))
+app.config['MEMTRACE_MAX_SECONDS'] = int(os.getenv('MEMTRACE_MAX_SECONDS', 3600))
+
+# Logging - JSON lines on stdout (or LOG_FILE), written by a background
+# thread; successful requests are sampled, failures and slow ones never are
+app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+app.config['LOG_FILE'] = os.getenv('LOG_FILE')
+app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+app.config['LOG_SUCCESS_SAMPLE_RATE'] = float(os.getenv('LOG_SUCCESS_SAMPLE_RATE', 0.1))
+app.config['LOG_SLOW_REQUEST_MS'] = float(os.getenv('LOG_SLOW_REQUEST_MS', 1000))
+app.config['LOG_LOGGERS'] = os.getenv('LOG_LOGGERS', 'access,admission,jobs,mailer,slow_queries').split(',')
+
+# Admin API - bearer token for store-wide endpoints; unset disables them
+app.config['ADMIN_API_TOKEN'] = os.getenv('ADMIN_API_TOKEN')
+
+# Order numbers - NODE_ID (0-63) must differ between hosts sharing a database
+app.config['ORDER_NODE_ID'] = int(os.getenv('NODE_ID', 0))
+app.config['ORDER_SLOT_DIR'] = os.getenv('ORDER_SLOT_DIR')
 
 # Configure CORS - allow frontend URL from environment or default to localhost
 frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
+cors_origins = [
+    frontend_url,
+    "http://localhost:3000",  # Keep for local development
+    "http://localhost:3001"   # Alternative local port
+]
+cors_expose_headers = ["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After", "ETag",
+                       REQUEST_ID_HEADER]
 CORS(app, resources={
     r"/api/*": {
-        "origins": [
-            frontend_url,
-            "http://localhost:3000",  # Keep for local development
-            "http://localhost:3001"   # Alternative local port
-        ],
+        "origins": cors_origins,
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", REQUEST_ID_HEADER],
+        "expose_headers": cors_expose_headers
     }
 })
-db = SQLAlchemy(app)
-mail = Mail(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+replicas = ReplicaRouter(app, db)
+slow_queries = SlowQueryLog(app)
+profiler = RequestProfiler(app)
+memtrace = MemoryTracer(app)
+# Created after the profiler so its request id is assigned first
+request_logs = StructuredLogging(app)
+# Flask-Mail is set up on the first confirmation email, not at import
+mailer = AsyncMailer(app=app)
+admission = AdmissionController(app)
+limiter = RateLimiter(app)
+jobs = PeriodicJobs(app)
+order_numbers = OrderNumberGenerator(app.config['ORDER_NODE_ID'], app.config['ORDER_SLOT_DIR'])
 
 # Database Models
 class Product(db.Model):
@@ -49,14 +243,26 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
     stock = db.Column(db.Integer, default=0)
+    # Units held by active StockReservations; available = stock - reserved
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(100), nullable=False)
+    session_id = db.Column(db.String(100), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
+    # Last time the cart this item belongs to was changed; see touch_cart()
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     product = db.relationship('Product', backref='cart_items')
 
+class StockReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    __table_args__ = (db.UniqueConstraint('session_id', 'product_id'),)
+
 class DiscountCode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(50), unique=True, nullable=False)
@@ -64,7 +270,47 @@ class DiscountCode(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     expiry_date = db.Column(db.DateTime)
 
+def load_discount_code(code):
+    discount = DiscountCode.query.filter_by(code=code).first()
+    return DiscountEntry.from_row(discount) if discount else None
+
+def fetch_discount_codes_since(last_id):
+    return db.session.query(DiscountCode.id, DiscountCode.code).filter(
+        DiscountCode.id > last_id
+    ).all()
+
+discount_filter = None
+if app.config['DISCOUNT_FILTER_ENABLED']:
+    discount_filter = DiscountCodeFilter(
+        fetch_discount_codes_since, error_rate=app.config['DISCOUNT_FILTER_ERROR_RATE'],
+        max_age=app.config['DISCOUNT_FILTER_REFRESH'],
+    )
+
+discount_codes = DiscountCodeCache(
+    load_discount_code,
+    ttl=app.config['DISCOUNT_CACHE_TTL'],
+    negative_ttl=app.config['DISCOUNT_NEGATIVE_TTL'],
+    prefilter=discount_filter,
+)
+invalidate_on_change(discount_codes, db.session, DiscountCode)
+if discount_filter is not None:
+    jobs.register('refresh_discount_filter', app.config['DISCOUNT_FILTER_REFRESH'],
+                  discount_filter.refresh)
+
+# Columns returned by the order listing, stored in the listing indexes on
+# PostgreSQL so pages are served by index-only scans
+ORDER_LIST_COLUMNS = ['order_number', 'total_amount', 'discount_amount', 'email', 'payment_method']
+
 class Order(db.Model):
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), optionally narrowed by session or status
+        db.Index('ix_order_created_id', 'created_at', 'id',
+                 postgresql_include=ORDER_LIST_COLUMNS + ['status']),
+        db.Index('ix_order_session_created_id', 'session_id', 'created_at', 'id',
+                 postgresql_include=ORDER_LIST_COLUMNS + ['status']),
+        db.Index('ix_order_status_created_id', 'status', 'created_at', 'id',
+                 postgresql_include=ORDER_LIST_COLUMNS),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
     session_id = db.Column(db.String(100), nullable=False)
@@ -75,6 +321,30 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     payment_method = db.Column(db.String(50))
     shipping_address = db.Column(db.Text)
+    discount_code = db.Column(db.String(50))
+
+class SalesRollupMixin:
+    """Order totals per time bucket, payment method and discount code ('' for none)"""
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    discount_code = db.Column(db.String(50), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    gross = db.Column(db.Float, nullable=False, default=0.0)
+    discount = db.Column(db.Float, nullable=False, default=0.0)
+    net = db.Column(db.Float, nullable=False, default=0.0)
+
+class HourlySalesRollup(SalesRollupMixin, db.Model):
+    __tablename__ = 'sales_rollup_hourly'
+
+class DailySalesRollup(SalesRollupMixin, db.Model):
+    __tablename__ = 'sales_rollup_daily'
+
+SALES_ROLLUPS = {'hour': HourlySalesRollup, 'day': DailySalesRollup}
+
+order_cache = OrderReadCache(ttl=app.config['ORDER_CACHE_TTL'],
+                             final_statuses=app.config['ORDER_CACHE_FINAL_STATUSES'],
+                             status_ttl=app.config['ORDER_CACHE_STATUS_TTL'])
+invalidate_orders_on_change(order_cache, db.session, Order)
 
 # Validation helpers
 def validate_email(email):
@@ -107,27 +377,68 @@ def sanitize_input(input_str):
         sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
     return sanitized.strip()
 
-# API Routes
-@app.route('/api/products', methods=['GET'])
-def get_products():
-    """Get all products"""
-    products = Product.query.all()
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'price': p.price,
-        'description': p.description,
-        'stock': p.stock
-    } for p in products])
+# Request body schemas, compiled once at import
+SESSION_ID = dict(max_length=100, sanitize=True, required=True)
 
-@app.route('/api/cart', methods=['GET'])
-def get_cart():
-    """Get cart items for a session"""
-    session_id = request.args.get('session_id')
-    if not session_id:
-        return jsonify({'error': 'session_id required'}), 400
-    
-    items = CartItem.query.filter_by(session_id=session_id).all()
+ADD_TO_CART_SCHEMA = Schema(
+    session_id=Field(**SESSION_ID, required_message='session_id and product_id required'),
+    product_id=Field(int, required=True, min_value=1,
+                     required_message='session_id and product_id required'),
+    quantity=Field(int, default=1, min_value=1, invalid_message='Invalid quantity'),
+)
+
+REMOVE_FROM_CART_SCHEMA = Schema(
+    session_id=Field(**SESSION_ID, required_message='session_id and item_id required'),
+    item_id=Field(int, required=True, min_value=1,
+                  required_message='session_id and item_id required'),
+)
+
+UPDATE_CART_SCHEMA = Schema(
+    session_id=Field(**SESSION_ID, required_message='session_id, item_id, and quantity required'),
+    item_id=Field(int, required=True, min_value=1,
+                  required_message='session_id, item_id, and quantity required'),
+    quantity=Field(int, required=True, min_value=1, invalid_message='Invalid quantity',
+                   required_message='session_id, item_id, and quantity required'),
+)
+
+APPLY_DISCOUNT_SCHEMA = Schema(
+    code=Field(max_length=50, sanitize=True, required=True,
+               required_message='code and session_id required'),
+    session_id=Field(**SESSION_ID, required_message='code and session_id required'),
+)
+
+CHECKOUT_SCHEMA = Schema(
+    session_id=Field(**SESSION_ID),
+    payment_method=Field(max_length=50, sanitize=True, required=True),
+    email=Field(max_length=100, strip=True, format='email', required=True,
+                required_message='Invalid email address', invalid_message='Invalid email address'),
+    card_number=Field(max_length=32, format='card', required=True, when=('payment_method', 'card'),
+                      required_message='Invalid card number', invalid_message='Invalid card number'),
+    cvv=Field(format='cvv', max_length=4, required=True, when=('payment_method', 'card'),
+              required_message='Invalid CVV', invalid_message='Invalid CVV'),
+    expiry_date=Field(max_length=7, required=True, when=('payment_method', 'card'),
+                      required_message='Expiry date required'),
+    shipping_address=Field(max_length=1000, sanitize=True, default=''),
+    discount_code=Field(max_length=50, sanitize=True, default=''),
+)
+
+@app.errorhandler(ValidationError)
+def handle_validation_error(error):
+    return jsonify(error.to_dict()), 400
+
+# Serialization helpers (shared with the ASGI read routes in asgi.py)
+def product_to_dict(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'description': product.description,
+        'stock': product.stock,
+        'available': product.stock - product.reserved
+    }
+
+def cart_to_dict(items):
+    """Summarize CartItem rows (with products loaded) as the cart response"""
     cart_total = 0
     cart_items = []
     
@@ -142,30 +453,325 @@ def get_cart():
         })
         cart_total += item.product.price * item.quantity
     
-    return jsonify({
+    return {
         'items': cart_items,
         'total': cart_total,
         'item_count': len(cart_items)
-    })
+    }
+
+def order_to_dict(order):
+    return {
+        'order_number': order.order_number,
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'discount_amount': order.discount_amount,
+        'email': order.email,
+        'created_at': order.created_at.isoformat(),
+        'payment_method': order.payment_method
+    }
+
+# Stock reservations
+def _utcnow():
+    # Naive UTC, matching how DateTime columns are stored
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _adjust_reserved(product_id, delta):
+    """Atomically change Product.reserved; increases fail if not available"""
+    stmt = db.update(Product).where(Product.id == product_id)
+    if delta > 0:
+        stmt = stmt.where(Product.stock - Product.reserved >= delta)
+    result = db.session.execute(stmt.values(reserved=Product.reserved + delta))
+    return result.rowcount == 1
+
+def _release_hold(hold):
+    # Conditional delete so a hold is never released twice (e.g. by the sweeper)
+    result = db.session.execute(db.delete(StockReservation).where(StockReservation.id == hold.id))
+    if result.rowcount == 1:
+        _adjust_reserved(hold.product_id, -hold.quantity)
+
+def set_reservation(session_id, product_id, quantity):
+    """Make a session's hold on a product exactly `quantity` units.
+
+    Extends the hold's expiry. Returns False, changing nothing, when the
+    extra units are not available. The caller commits.
+    """
+    now = _utcnow()
+    hold = StockReservation.query.filter_by(session_id=session_id, product_id=product_id).first()
+    if hold and hold.expires_at <= now:
+        _release_hold(hold)
+        hold = None
+    held = hold.quantity if hold else 0
+
+    if quantity > held and not _adjust_reserved(product_id, quantity - held):
+        return False
+    if quantity < held:
+        _adjust_reserved(product_id, quantity - held)
+
+    expires_at = now + timedelta(seconds=app.config['RESERVATION_TTL'])
+    if hold is None:
+        if quantity > 0:
+            db.session.add(StockReservation(
+                session_id=session_id, product_id=product_id, quantity=quantity, expires_at=expires_at
+            ))
+    elif quantity == 0:
+        db.session.delete(hold)
+    else:
+        hold.quantity = quantity
+        hold.expires_at = expires_at
+    return True
+
+def sell_stock(session_id, product_id, quantity):
+    """Convert a session's hold into a sale; returns False if stock ran out.
+
+    Releasing the session's own hold first makes its units available to
+    the conditional decrement, so an active hold always converts. An
+    expired hold converts only if the stock was not taken in the meantime.
+    """
+    hold = StockReservation.query.filter_by(session_id=session_id, product_id=product_id).first()
+    if hold:
+        _release_hold(hold)
+    result = db.session.execute(
+        db.update(Product)
+        .where(Product.id == product_id, Product.stock - Product.reserved >= quantity)
+        .values(stock=Product.stock - quantity)
+    )
+    return result.rowcount == 1
+
+def release_expired_reservations(batch_size=None):
+    """Release expired holds in batches, one short transaction per batch"""
+    batch_size = batch_size or app.config['RESERVATION_SWEEP_BATCH']
+    released = 0
+    while True:
+        now = _utcnow()
+        ids = db.session.scalars(
+            db.select(StockReservation.id)
+            .where(StockReservation.expires_at <= now)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        # RETURNING reports only rows this worker deleted, so concurrent
+        # sweepers never release the same hold twice
+        rows = db.session.execute(
+            db.delete(StockReservation)
+            .where(StockReservation.id.in_(ids), StockReservation.expires_at <= now)
+            .returning(StockReservation.product_id, StockReservation.quantity)
+        ).all()
+        per_product = {}
+        for product_id, quantity in rows:
+            per_product[product_id] = per_product.get(product_id, 0) + quantity
+        for product_id, quantity in per_product.items():
+            _adjust_reserved(product_id, -quantity)
+        db.session.commit()
+        released += len(rows)
+        if len(ids) < batch_size:
+            break
+    return {'released': released}
+
+jobs.register('release_expired_reservations', app.config['RESERVATION_SWEEP_INTERVAL'],
+              release_expired_reservations)
+
+# Sales rollups
+def rollup_bucket(moment, grain):
+    if grain == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _increment_rollup(model, key, totals):
+    columns = {getattr(model, name): getattr(model, name) + value for name, value in totals.items()}
+    return db.session.query(model).filter_by(**key).update(columns, synchronize_session=False)
+
+def add_to_sales_rollups(created_at, payment_method, discount_code, gross, discount, net):
+    """Count one order in the hourly and daily rollups, in the caller's transaction"""
+    totals = {'orders': 1, 'gross': gross, 'discount': discount, 'net': net}
+    for grain, model in SALES_ROLLUPS.items():
+        key = {'bucket_start': rollup_bucket(created_at, grain),
+               'payment_method': payment_method or '', 'discount_code': discount_code or ''}
+        if _increment_rollup(model, key, totals):
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**key, **totals))
+        except IntegrityError:
+            # A concurrent checkout created the bucket first
+            _increment_rollup(model, key, totals)
+
+def backfill_sales_rollups(start=None, end=None):
+    """Rebuild rollups from the Order table for whole days in [start, end).
+
+    Orders are streamed oldest first and each day's buckets are inserted
+    in bulk once the stream moves past it, so memory holds one day.
+    Run it for past ranges or while checkout is quiet: orders placed
+    mid-run in the same range may be counted twice or not at all.
+    """
+    start = rollup_bucket(start, 'day') if start else None
+    end = rollup_bucket(end, 'day') + timedelta(days=1) if end else None
+    for model in SALES_ROLLUPS.values():
+        query = db.session.query(model)
+        if start is not None:
+            query = query.filter(model.bucket_start >= start)
+        if end is not None:
+            query = query.filter(model.bucket_start < end)
+        query.delete(synchronize_session=False)
+
+    statement = db.select(Order.created_at, Order.payment_method, Order.discount_code,
+                          Order.total_amount, Order.discount_amount)
+    if start is not None:
+        statement = statement.where(Order.created_at >= start)
+    if end is not None:
+        statement = statement.where(Order.created_at < end)
+    statement = statement.order_by(Order.created_at).execution_options(yield_per=5000)
+
+    buckets = {grain: {} for grain in SALES_ROLLUPS}
+    counted = written = 0
+    current_day = None
+
+    def flush():
+        nonlocal written
+        for grain, rows in buckets.items():
+            if rows:
+                db.session.execute(db.insert(SALES_ROLLUPS[grain]), list(rows.values()))
+                written += len(rows)
+                rows.clear()
+
+    for created_at, payment_method, discount_code, net, discount in db.session.execute(statement):
+        day = rollup_bucket(created_at, 'day')
+        if day != current_day:
+            flush()
+            current_day = day
+        for grain, rows in buckets.items():
+            key = (rollup_bucket(created_at, grain), payment_method or '', discount_code or '')
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {'bucket_start': key[0], 'payment_method': key[1],
+                                   'discount_code': key[2], 'orders': 0, 'gross': 0.0,
+                                   'discount': 0.0, 'net': 0.0}
+            row['orders'] += 1
+            row['gross'] += net + (discount or 0.0)
+            row['discount'] += discount or 0.0
+            row['net'] += net
+        counted += 1
+    flush()
+    db.session.commit()
+    return {'orders': counted, 'buckets': written}
+
+@app.cli.command('backfill-rollups')
+@click.option('--start', help='First day to rebuild (YYYY-MM-DD); default: all history')
+@click.option('--end', help='Last day to rebuild (YYYY-MM-DD), inclusive')
+def backfill_rollups_command(start, end):
+    """Rebuild the hourly and daily sales rollups from the order history"""
+    result = backfill_sales_rollups(
+        datetime.strptime(start, '%Y-%m-%d') if start else None,
+        datetime.strptime(end, '%Y-%m-%d') if end else None,
+    )
+    print(f"Rebuilt {result['buckets']} rollup rows from {result['orders']} orders")
+
+# Abandoned carts
+def touch_cart(session_id):
+    """Mark every line of a cart as recently used"""
+    db.session.execute(
+        db.update(CartItem).where(CartItem.session_id == session_id).values(updated_at=_utcnow())
+    )
+
+def delete_abandoned_carts(batch_size=None, pause=None):
+    """Delete carts untouched for CART_TTL seconds.
+
+    Works in batches of primary keys, each in its own short transaction,
+    so writers are only ever blocked for one batch. Returns rows reclaimed
+    and time taken.
+    """
+    batch_size = batch_size or app.config['CART_GC_BATCH']
+    pause = app.config['CART_GC_PAUSE'] if pause is None else pause
+    started = time.perf_counter()
+    now = _utcnow()
+    cutoff = now - timedelta(seconds=app.config['CART_TTL'])
+
+    # Rows written before updated_at existed start their TTL now, batched
+    # like the delete so a large legacy table is not locked in one go
+    backfilled = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(CartItem.id).where(CartItem.updated_at.is_(None)).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        result = db.session.execute(
+            db.update(CartItem).where(CartItem.id.in_(ids), CartItem.updated_at.is_(None))
+            .values(updated_at=now)
+        )
+        db.session.commit()
+        backfilled += result.rowcount
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    deleted = batches = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(CartItem.id).where(CartItem.updated_at < cutoff).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        # Re-check the cutoff so a cart touched since the select survives
+        result = db.session.execute(
+            db.delete(CartItem).where(CartItem.id.in_(ids), CartItem.updated_at < cutoff)
+        )
+        db.session.commit()
+        deleted += result.rowcount
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return {
+        'deleted': deleted,
+        'batches': batches,
+        'backfilled': backfilled,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+jobs.register('delete_abandoned_carts', app.config['CART_GC_INTERVAL'], delete_abandoned_carts)
+
+@app.cli.command('gc-carts')
+def gc_carts_command():
+    """Delete abandoned carts now and report what was reclaimed"""
+    result = delete_abandoned_carts()
+    print(f"Deleted {result['deleted']} cart rows in {result['batches']} batches "
+          f"({result['duration_ms']} ms)")
+
+@app.cli.command('profile-token')
+@click.option('--ttl', default=300, show_default=True, help='Seconds the token stays valid')
+def profile_token_command(ttl):
+    """Print an X-Profile header value that profiles requests for --ttl seconds"""
+    if not app.config['PROFILE_SECRET']:
+        raise click.ClickException('PROFILE_SECRET is not set')
+    print(sign_profile_token(app.config['PROFILE_SECRET'], ttl))
+
+# API Routes
+@app.route('/api/products', methods=['GET'])
+def get_products():
+    """Get all products"""
+    products = Product.query.all()
+    return jsonify([product_to_dict(p) for p in products])
+
+@app.route('/api/cart', methods=['GET'])
+def get_cart():
+    """Get cart items for a session"""
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'session_id required'}), 400
+    
+    items = CartItem.query.filter_by(session_id=session_id).all()
+    return jsonify(cart_to_dict(items))
 
 @app.route('/api/cart/add', methods=['POST'])
 def add_to_cart():
     """Add item to cart"""
-    data = request.json
-    
-    # Validate input
-    session_id = sanitize_input(data.get('session_id', ''))
-    product_id = data.get('product_id')
-    quantity = data.get('quantity', 1)
-    
-    if not session_id or not product_id:
-        return jsonify({'error': 'session_id and product_id required'}), 400
-    
-    if not isinstance(product_id, int) or product_id <= 0:
-        return jsonify({'error': 'Invalid product_id'}), 400
-    
-    if not isinstance(quantity, int) or quantity <= 0:
-        return jsonify({'error': 'Invalid quantity'}), 400
+    data = ADD_TO_CART_SCHEMA.validate(request.get_json(silent=True))
+    session_id = data['session_id']
+    product_id = data['product_id']
+    quantity = data['quantity']
     
     # Check if product exists
     product = db.session.get(Product, product_id)
@@ -182,10 +788,16 @@ def add_to_cart():
         product_id=product_id
     ).first()
     
+    new_quantity = existing_item.quantity + quantity if existing_item else quantity
+    if product.stock < new_quantity:
+        return jsonify({'error': 'Insufficient stock'}), 400
+    
+    # Hold the stock for this cart until RESERVATION_TTL passes
+    if not set_reservation(session_id, product_id, new_quantity):
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient stock'}), 400
+    
     if existing_item:
-        new_quantity = existing_item.quantity + quantity
-        if product.stock < new_quantity:
-            return jsonify({'error': 'Insufficient stock'}), 400
         existing_item.quantity = new_quantity
     else:
         new_item = CartItem(
@@ -195,40 +807,34 @@ def add_to_cart():
         )
         db.session.add(new_item)
     
+    touch_cart(session_id)
     db.session.commit()
     return jsonify({'message': 'Item added to cart successfully'}), 201
 
 @app.route('/api/cart/remove', methods=['POST'])
 def remove_from_cart():
     """Remove item from cart"""
-    data = request.json
-    session_id = sanitize_input(data.get('session_id', ''))
-    item_id = data.get('item_id')
-    
-    if not session_id or not item_id:
-        return jsonify({'error': 'session_id and item_id required'}), 400
+    data = REMOVE_FROM_CART_SCHEMA.validate(request.get_json(silent=True))
+    session_id = data['session_id']
+    item_id = data['item_id']
     
     item = CartItem.query.filter_by(id=item_id, session_id=session_id).first()
     if not item:
         return jsonify({'error': 'Item not found in cart'}), 404
     
+    set_reservation(session_id, item.product_id, 0)
     db.session.delete(item)
+    touch_cart(session_id)
     db.session.commit()
     return jsonify({'message': 'Item removed from cart'}), 200
 
 @app.route('/api/cart/update', methods=['POST'])
 def update_cart():
     """Update cart item quantity"""
-    data = request.json
-    session_id = sanitize_input(data.get('session_id', ''))
-    item_id = data.get('item_id')
-    quantity = data.get('quantity')
-    
-    if not session_id or not item_id or quantity is None:
-        return jsonify({'error': 'session_id, item_id, and quantity required'}), 400
-    
-    if not isinstance(quantity, int) or quantity <= 0:
-        return jsonify({'error': 'Invalid quantity'}), 400
+    data = UPDATE_CART_SCHEMA.validate(request.get_json(silent=True))
+    session_id = data['session_id']
+    item_id = data['item_id']
+    quantity = data['quantity']
     
     item = CartItem.query.filter_by(id=item_id, session_id=session_id).first()
     if not item:
@@ -237,21 +843,23 @@ def update_cart():
     if item.product.stock < quantity:
         return jsonify({'error': 'Insufficient stock'}), 400
     
+    if not set_reservation(session_id, item.product_id, quantity):
+        db.session.rollback()
+        return jsonify({'error': 'Insufficient stock'}), 400
+    
     item.quantity = quantity
+    touch_cart(session_id)
     db.session.commit()
     return jsonify({'message': 'Cart updated successfully'}), 200
 
 @app.route('/api/discount/apply', methods=['POST'])
 def apply_discount():
     """Apply discount code"""
-    data = request.json
-    code = sanitize_input(data.get('code', ''))
-    session_id = sanitize_input(data.get('session_id', ''))
+    data = APPLY_DISCOUNT_SCHEMA.validate(request.get_json(silent=True))
+    code = data['code']
+    session_id = data['session_id']
     
-    if not code or not session_id:
-        return jsonify({'error': 'code and session_id required'}), 400
-    
-    discount = DiscountCode.query.filter_by(code=code.upper()).first()
+    discount = discount_codes.get(code)
     
     if not discount:
         return jsonify({'error': 'Invalid discount code'}), 404
@@ -259,14 +867,8 @@ def apply_discount():
     if not discount.is_active:
         return jsonify({'error': 'Discount code is not active'}), 400
     
-    if discount.expiry_date:
-        # Handle both timezone-aware and timezone-naive datetimes
-        expiry = discount.expiry_date
-        if expiry.tzinfo is None:
-            # Make timezone-naive datetime timezone-aware
-            expiry = expiry.replace(tzinfo=timezone.utc)
-        if expiry < datetime.now(timezone.utc):
-            return jsonify({'error': 'Discount code has expired'}), 400
+    if discount.is_expired():
+        return jsonify({'error': 'Discount code has expired'}), 400
     
     # Get cart total
     items = CartItem.query.filter_by(session_id=session_id).all()
@@ -289,27 +891,14 @@ def apply_discount():
 @app.route('/api/checkout', methods=['POST'])
 def checkout():
     """Process checkout and payment"""
-    data = request.json
-    
-    # Validate required fields
-    session_id = sanitize_input(data.get('session_id', ''))
-    email = data.get('email', '').strip()
-    payment_method = sanitize_input(data.get('payment_method', ''))
-    card_number = data.get('card_number', '')
-    cvv = data.get('cvv', '')
-    expiry_date = data.get('expiry_date', '')
-    shipping_address = sanitize_input(data.get('shipping_address', ''))
-    discount_code = sanitize_input(data.get('discount_code', ''))
-    
-    # Validation
-    if not session_id:
-        return jsonify({'error': 'session_id required'}), 400
-    
-    if not payment_method:
-        return jsonify({'error': 'payment_method required'}), 400
-    
-    if not validate_email(email):
-        return jsonify({'error': 'Invalid email address'}), 400
+    # Types, lengths and card fields are checked before touching the database
+    data = CHECKOUT_SCHEMA.validate(request.get_json(silent=True))
+    session_id = data['session_id']
+    email = data['email']
+    payment_method = data['payment_method']
+    card_number = data['card_number']
+    shipping_address = data['shipping_address']
+    discount_code = data['discount_code']
     
     # Get cart items
     cart_items = CartItem.query.filter_by(session_id=session_id).all()
@@ -321,42 +910,26 @@ def checkout():
     discount_amount = 0.0
     
     # Apply discount if provided
+    applied_code = None
     if discount_code:
-        discount = DiscountCode.query.filter_by(code=discount_code.upper()).first()
-        if discount and discount.is_active:
-            if not discount.expiry_date:
-                discount_amount = cart_total * (discount.discount_percent / 100)
-            else:
-                # Handle both timezone-aware and timezone-naive datetimes
-                expiry = discount.expiry_date
-                if expiry.tzinfo is None:
-                    expiry = expiry.replace(tzinfo=timezone.utc)
-                if expiry >= datetime.now(timezone.utc):
-                    discount_amount = cart_total * (discount.discount_percent / 100)
-                discount_amount = cart_total * (discount.discount_percent / 100)
+        discount = discount_codes.get(discount_code)
+        if discount and discount.is_usable():
+            discount_amount = cart_total * (discount.discount_percent / 100)
+            applied_code = discount.code
     
     final_total = cart_total - discount_amount
     
     # Validate payment
     if payment_method == 'card':
-        if not card_number or not validate_card_number(card_number):
-            return jsonify({'error': 'Invalid card number'}), 400
-        
-        if not cvv or not validate_cvv(cvv):
-            return jsonify({'error': 'Invalid CVV'}), 400
-        
-        if not expiry_date:
-            return jsonify({'error': 'Expiry date required'}), 400
-        
         # Simulate payment processing
         # In production, integrate with payment gateway
         # Decline if card ends in '000' or '0000' (test cards)
         if card_number.endswith('0000') or card_number.endswith('000'):
             return jsonify({'error': 'Payment declined'}), 400
     
-    # Create order with unique order number including microseconds
-    timestamp = datetime.now(timezone.utc)
-    order_number = f"ORD-{timestamp.strftime('%Y%m%d%H%M%S')}-{timestamp.microsecond}-{session_id[:8]}"
+    # Create order with a time-ordered number unique across workers and hosts
+    order_number = order_numbers.next_order_number()
+    created_at = _utcnow()
     order = Order(
         order_number=order_number,
         session_id=session_id,
@@ -365,14 +938,22 @@ def checkout():
         status='confirmed',
         email=email,
         payment_method=payment_method,
-        shipping_address=shipping_address
+        shipping_address=shipping_address,
+        discount_code=applied_code,
+        created_at=created_at
     )
     db.session.add(order)
+    # Commits or rolls back together with the order
+    add_to_sales_rollups(created_at, payment_method, applied_code,
+                         cart_total, discount_amount, final_total)
     
     # Clear cart
     for item in cart_items:
-        # Update product stock
-        item.product.stock -= item.quantity
+        # Convert the add-to-cart hold into a sale
+        product_name = item.product.name
+        if not sell_stock(session_id, item.product_id, item.quantity):
+            db.session.rollback()
+            return jsonify({'error': f'Insufficient stock for {product_name}'}), 400
         db.session.delete(item)
     
     db.session.commit()
@@ -380,9 +961,12 @@ def checkout():
     # Send confirmation email
     try:
         send_order_confirmation_email(email, order_number, final_total)
-    except Exception as e:
+    except CircuitOpenError as e:
+        # SMTP is down; the order stands without its email
+        logger.warning('email not sent: %s', e, extra={'order_number': order_number})
+    except Exception:
         # Log error but don't fail the order
-        print(f"Email sending failed: {e}")
+        logger.warning('email sending failed', exc_info=True, extra={'order_number': order_number})
     
     return jsonify({
         'order_number': order_number,
@@ -393,7 +977,7 @@ def checkout():
 
 def send_order_confirmation_email(email, order_number, total_amount):
     """Send order confirmation email"""
-    msg = Message(
+    msg = mailer.message(
         subject=f'Order Confirmation - {order_number}',
         recipients=[email],
         body=f'''
@@ -408,24 +992,380 @@ Thank you for shopping with us!
         ''',
         sender=app.config['MAIL_USERNAME']
     )
-    mail.send(msg)
+    mailer.send(msg)
+
+def is_admin_request():
+    """True when the request carries the configured admin bearer token"""
+    token = app.config['ADMIN_API_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if not token or not header.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(header[len('Bearer '):].encode(), token.encode())
+
+def encode_order_cursor(order):
+    raw = f'{order.created_at.isoformat()}|{order.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_order_cursor(cursor):
+    """Return (created_at, id) from a listing cursor; ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def parse_date_param(value, end=False):
+    """Parse YYYY-MM-DD or an ISO datetime; a bare end date covers the whole day"""
+    try:
+        if len(value) == 10:
+            day = datetime.strptime(value, '%Y-%m-%d')
+            return day + timedelta(days=1) if end else day
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f'Invalid date: {value}') from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def order_listing_query(session_id=None, status=None, start=None, end=None, after=None):
+    """Orders newest first, seeking past `after` = (created_at, id) instead of OFFSET"""
+    query = Order.query
+    if session_id:
+        query = query.filter(Order.session_id == session_id)
+    if status:
+        query = query.filter(Order.status == status)
+    if start is not None:
+        query = query.filter(Order.created_at >= start)
+    if end is not None:
+        query = query.filter(Order.created_at < end)
+    if after is not None:
+        query = query.filter(db.tuple_(Order.created_at, Order.id) < after)
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+@app.route('/api/orders', methods=['GET'])
+def list_orders():
+    """List orders for a session, or store-wide with the admin token"""
+    session_id = request.args.get('session_id', '')
+    if not session_id and not is_admin_request():
+        return jsonify({'error': 'session_id or admin token required'}), 401
+    
+    status = request.args.get('status') or None
+    limit = request.args.get('limit', app.config['ORDER_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['ORDER_PAGE_SIZE_MAX']))
+    try:
+        start = parse_date_param(request.args['start_date']) if request.args.get('start_date') else None
+        end = parse_date_param(request.args['end_date'], end=True) if request.args.get('end_date') else None
+        after = decode_order_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # One extra row tells whether another page exists
+    orders = order_listing_query(session_id, status, start, end, after).limit(limit + 1).all()
+    next_cursor = encode_order_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return jsonify({
+        'orders': [order_to_dict(order) for order in orders[:limit]],
+        'next_cursor': next_cursor,
+        'limit': limit
+    })
+
+ORDER_EXPORT_COLUMNS = ['id', 'order_number', 'created_at', 'status', 'session_id', 'email',
+                        'payment_method', 'total_amount', 'discount_amount', 'discount_code',
+                        'shipping_address']
+
+def export_rows(start=None, end=None, status=None):
+    """Yield order rows oldest first as plain tuples, one batch in memory at a time.
+
+    Selecting columns rather than Order objects keeps rows out of the
+    session's identity map; yield_per streams from a server-side cursor
+    on PostgreSQL and fetches in batches on SQLite.
+    """
+    statement = db.select(*(getattr(Order, name) for name in ORDER_EXPORT_COLUMNS))
+    if status:
+        statement = statement.where(Order.status == status)
+    if start is not None:
+        statement = statement.where(Order.created_at >= start)
+    if end is not None:
+        statement = statement.where(Order.created_at < end)
+    statement = statement.order_by(Order.created_at, Order.id)
+    result = db.session.execute(
+        statement.execution_options(yield_per=app.config['ORDER_EXPORT_BATCH'])
+    )
+    for batch in result.partitions():
+        yield batch
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([_export_value(v) for v in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(ORDER_EXPORT_COLUMNS, map(_export_value, row)))) + '\n' for row in batch
+        )
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/orders/export', methods=['GET'])
+def export_orders():
+    """Stream orders as CSV or NDJSON (admin only)"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start = parse_date_param(request.args['start_date']) if request.args.get('start_date') else None
+        end = parse_date_param(request.args['end_date'], end=True) if request.args.get('end_date') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    batches = export_rows(start, end, request.args.get('status') or None)
+    if export_format == 'csv':
+        chunks, mimetype = csv_chunks(batches), 'text/csv'
+    else:
+        chunks, mimetype = ndjson_chunks(batches), 'application/x-ndjson'
+    headers = {'Content-Disposition': f'attachment; filename=orders.{export_format}'}
+    if request.accept_encodings['gzip']:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    else:
+        chunks = (chunk.encode() for chunk in chunks)
+    # The generator runs after the view returns; keep the request context (and session) alive
+    return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+@app.route('/api/reports/sales', methods=['GET'])
+def sales_report():
+    """Sales totals per hour or day from the rollup tables (admin only)"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    
+    grain = request.args.get('grain', 'day')
+    group_by = request.args.get('group_by') or None
+    if grain not in SALES_ROLLUPS:
+        return jsonify({'error': 'grain must be hour or day'}), 400
+    if group_by not in (None, 'payment_method', 'discount_code'):
+        return jsonify({'error': 'group_by must be payment_method or discount_code'}), 400
+    try:
+        start = parse_date_param(request.args['start_date']) if request.args.get('start_date') else None
+        end = parse_date_param(request.args['end_date'], end=True) if request.args.get('end_date') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    model = SALES_ROLLUPS[grain]
+    keys = [model.bucket_start] + ([getattr(model, group_by)] if group_by else [])
+    statement = db.select(
+        *keys,
+        db.func.sum(model.orders), db.func.sum(model.gross),
+        db.func.sum(model.discount), db.func.sum(model.net),
+    ).group_by(*keys).order_by(*keys)
+    if start is not None:
+        statement = statement.where(model.bucket_start >= rollup_bucket(start, grain))
+    if end is not None:
+        statement = statement.where(model.bucket_start < end)
+    
+    rows = []
+    for row in db.session.execute(statement):
+        entry = {'bucket_start': row[0].isoformat()}
+        if group_by:
+            entry[group_by] = row[1]
+        orders, gross, discount, net = row[-4:]
+        entry.update({'orders': orders, 'gross': round(gross, 2),
+                      'discount': round(discount, 2), 'net': round(net, 2)})
+        rows.append(entry)
+    return jsonify({
+        'grain': grain,
+        'group_by': group_by,
+        'rows': rows,
+        'totals': {
+            'orders': sum(r['orders'] for r in rows),
+            'gross': round(sum(r['gross'] for r in rows), 2),
+            'discount': round(sum(r['discount'] for r in rows), 2),
+            'net': round(sum(r['net'] for r in rows), 2),
+        }
+    })
+
+@app.route('/api/admin/slow-queries', methods=['GET', 'DELETE'])
+def slow_query_report():
+    """Slowest statements seen by this worker, by total time (admin only)"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    if request.method == 'DELETE':
+        slow_queries.reset()
+        return '', 204
+    try:
+        limit = max(1, int(request.args.get('limit', 20)))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({
+        'pid': os.getpid(),
+        'enabled': slow_queries.enabled,
+        'threshold_ms': app.config['SLOW_QUERY_THRESHOLD_MS'],
+        'queries': slow_queries.top(limit),
+    })
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Stored request profiles per endpoint (admin only)"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    return jsonify({'enabled': app.config['PROFILE_ENABLED'], 'endpoints': profiler.summary()})
+
+@app.route('/api/admin/profiles/<endpoint>', methods=['GET'])
+def aggregate_profiles(endpoint):
+    """All of an endpoint's profiles merged: collapsed stacks or a pstats report"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    if endpoint not in profiler.summary():
+        return jsonify({'error': 'No profiles for this endpoint'}), 404
+    fmt = request.args.get('format', 'collapsed')
+    if fmt == 'collapsed':
+        counts = profiler.aggregate_collapsed(endpoint)
+        body = ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+    elif fmt == 'pstats':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            return jsonify({'error': 'sort must be cumulative, tottime or calls'}), 400
+        body = profiler.aggregate_pstats(endpoint, sort=sort)
+    else:
+        return jsonify({'error': 'format must be collapsed or pstats'}), 400
+    return app.response_class(body, mimetype='text/plain')
+
+def memory_request_error():
+    """401 without the admin token, 409 if ?pid= names another worker"""
+    if not is_admin_request():
+        return jsonify({'error': 'admin token required'}), 401
+    pid = request.args.get('pid')
+    if pid and pid != str(os.getpid()):
+        # Each worker traces on its own; the caller retries until it lands on `pid`
+        return jsonify({'error': 'served by another worker', 'pid': os.getpid()}), 409
+    return None
+
+@app.route('/api/admin/memory', methods=['GET'])
+def memory_status():
+    """This worker's tracing state, traced memory and snapshots (admin only)"""
+    error = memory_request_error()
+    if error:
+        return error
+    return jsonify(memtrace.status())
+
+@app.route('/api/admin/memory/start', methods=['POST'])
+def start_memory_tracing():
+    """Start tracemalloc in this worker (admin only, needs MEMTRACE_ENABLED)"""
+    error = memory_request_error()
+    if error:
+        return error
+    if not memtrace.enabled:
+        return jsonify({'error': 'memory tracing is disabled'}), 403
+    frames = (request.get_json(silent=True) or {}).get('frames')
+    if frames is not None and not isinstance(frames, int):
+        return jsonify({'error': 'frames must be an integer'}), 400
+    return jsonify(memtrace.start(frames))
+
+@app.route('/api/admin/memory/stop', methods=['POST'])
+def stop_memory_tracing():
+    """Stop tracemalloc in this worker and drop its snapshots (admin only)"""
+    error = memory_request_error()
+    if error:
+        return error
+    return jsonify(memtrace.stop())
+
+@app.route('/api/admin/memory/snapshots', methods=['POST'])
+def take_memory_snapshot():
+    """Snapshot this worker's traced allocations; returns its id and top lines"""
+    error = memory_request_error()
+    if error:
+        return error
+    snapshot_id = memtrace.snapshot()
+    if snapshot_id is None:
+        return jsonify({'error': 'memory tracing is not started'}), 409
+    return jsonify({'pid': os.getpid(), 'id': snapshot_id, 'top': memtrace.top(snapshot_id, limit=10)}), 201
+
+@app.route('/api/admin/memory/diff', methods=['GET'])
+def diff_memory_snapshots():
+    """Allocation growth between two of this worker's snapshots (admin only)
+
+    ?from= defaults to the oldest snapshot and ?to= to a new one taken now;
+    ?group_by= is lineno, filename or traceback.
+    """
+    error = memory_request_error()
+    if error:
+        return error
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in GROUPINGS:
+        return jsonify({'error': 'group_by must be lineno, filename or traceback'}), 400
+    try:
+        limit = max(1, int(request.args.get('limit', 20)))
+        new_id = int(request.args['to']) if 'to' in request.args else memtrace.snapshot()
+        old_id = int(request.args['from']) if 'from' in request.args else min(memtrace.snapshots, default=None)
+    except ValueError:
+        return jsonify({'error': 'from, to and limit must be integers'}), 400
+    if old_id is None or new_id is None:
+        return jsonify({'error': 'memory tracing is not started'}), 409
+    if old_id not in memtrace.snapshots or new_id not in memtrace.snapshots:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    return jsonify({
+        'pid': os.getpid(),
+        'from': old_id,
+        'to': new_id,
+        'group_by': group_by,
+        'stats': memtrace.diff(old_id, new_id, group_by, limit),
+    })
 
 @app.route('/api/orders/<order_number>', methods=['GET'])
 def get_order(order_number):
     """Get order details"""
-    order = Order.query.filter_by(order_number=order_number).first()
-    if not order:
+    cached = lookup_order(order_number)
+    if not cached:
         return jsonify({'error': 'Order not found'}), 404
     
-    return jsonify({
-        'order_number': order.order_number,
-        'status': order.status,
-        'total_amount': order.total_amount,
-        'discount_amount': order.discount_amount,
-        'email': order.email,
-        'created_at': order.created_at.isoformat(),
-        'payment_method': order.payment_method
-    })
+    if request.if_none_match.contains(cached.etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(cached.payload)
+    response.headers.update(order_cache_headers(cached))
+    return response
+
+def lookup_order(order_number):
+    """Cached order payload and ETag, or None; 404s are not cached"""
+    cached = order_cache.get(order_number)
+    if cached is not None and order_cache.needs_check(order_number, cached):
+        # Another worker may have changed the status since it was last checked
+        status = Order.query.with_entities(Order.status).filter_by(order_number=order_number).scalar()
+        cached = order_cache.confirm(order_number, cached, status)
+    if cached is None:
+        order = Order.query.filter_by(order_number=order_number).first()
+        if order is None and replicas.use_primary():
+            # Just placed and not replicated yet
+            order = Order.query.filter_by(order_number=order_number).first()
+        if order:
+            cached = order_cache.put(order_number, order_to_dict(order))
+    return cached
+
+def order_cache_headers(cached):
+    # private: the payload carries the customer's email
+    return {
+        'ETag': f'"{cached.etag}"',
+        'Cache-Control': f"private, max-age={app.config['ORDER_CACHE_MAX_AGE']}",
+    }
 
 # Initialize database
 # Health check endpoint for monitoring
@@ -444,6 +1384,8 @@ def health_check():
             'timestamp': datetime.now(timezone.utc).isoformat(),
             'database': 'connected',
             'products': product_count,
+            # Not critical: orders still go through while mail is down
+            'mail': mailer.breaker.state,
             'version': '1.0.0'
         }), 200
     except Exception as e:
@@ -453,9 +1395,52 @@ def health_check():
             'error': str(e)
         }), 503
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Operational metrics for the worker that serves the request"""
+    return jsonify({
+        'pid': os.getpid(),
+        'admission': admission.metrics(),
+        'jobs': jobs.metrics(),
+        'discount_cache': discount_codes.metrics(),
+        'order_cache': order_cache.metrics(),
+        'replicas': replicas.metrics(),
+        'logging': request_logs.metrics(),
+        'mail': mailer.metrics(),
+    })
+
+def upgrade_schema():
+    """Add columns declared on the models but missing from existing tables.
+
+    create_all() only creates missing tables; this covers the additive
+    changes (nullable or server-defaulted columns, new indexes) that the
+    models pick up over time, so existing databases keep working.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" DEFAULT {default.text}" if hasattr(default, 'text') else f" DEFAULT '{default}'"
+                connection.execute(db.text(ddl))
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+
 def init_db():
     """Initialize database and seed sample data"""
     db.create_all()
+    upgrade_schema()
     # Seed sample data
     if Product.query.count() == 0:
         products = [
@@ -480,7 +1465,50 @@ def init_db():
         
         db.session.commit()
 
+def dispose_engines(close=True):
+    """Drop the pooled connections of the primary and replica engines.
+
+    close=False forgets them without closing, for a forked child whose
+    inherited sockets still belong to the parent.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+    replicas.dispose(close=close)
+
+def _reset_engines_after_fork():
+    # Runs in the child straight after fork, where a lock held by another
+    # parent thread stays held forever: only lock-free work belongs here.
+    # Engine.dispose(close=False) just swaps in a new pool.
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    replicas.reset_after_fork()
+
+# Forked children (preloaded gunicorn workers, multiprocessing) start with
+# empty pools rather than sharing the parent's connections
+os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+def create_app():
+    """Application factory for ``gunicorn 'app:create_app()'``.
+
+    Models, routes and extensions are set up at import; this adds the
+    one-time startup work. With GUNICORN_PRELOAD=true it runs once in the
+    master and every worker inherits the result copy-on-write.
+    """
+    if app.config['DB_INIT_ON_START']:
+        with app.app_context():
+            init_db()
+    # Nothing opened during startup may leak into the workers
+    dispose_engines()
+    request_logs.install()
+    # Move the import-time heap out of the collector's reach, so a
+    # collection in a worker does not touch (and un-share) those pages
+    gc.freeze()
+    return app
+
 if __name__ == '__main__':
+    request_logs.install()
     with app.app_context():
         init_db()
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,217 @@
+"""
+Optional ASGI deployment of the API.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+The read-heavy routes (GET /api/products, /api/cart and
+/api/orders/<order_number>) are served on the event loop through an async
+SQLAlchemy engine, so one process can hold thousands of idle or slow
+connections. They still run inside a Flask request context with the app's
+own before/after request hooks, so admission control, rate limiting,
+replica routing, CORS and request-id/access logging behave as they do for
+every other route; only the view itself is async. Every other request,
+including all writes, is handed to the Flask app on a thread pool and
+keeps its transactional handling, hooks and validation unchanged.
+Requires the packages in requirements-asgi.txt.
+"""
+import asyncio
+import io
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import jsonify, request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload
+from werkzeug.exceptions import HTTPException
+
+from app import (app, db, replicas, order_cache, Product, CartItem, Order,
+                 product_to_dict, cart_to_dict, order_to_dict, order_cache_headers)
+
+_ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """Swap the sync driver in a SQLAlchemy URL for its asyncio counterpart"""
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend!r}')
+    return url.set(drivername=_ASYNC_DRIVERS[backend])
+
+
+def wsgi_environ(scope):
+    """WSGI environ for a body-less ASGI HTTP request"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+        'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+class APIApplication:
+    """ASGI app serving read routes natively and delegating the rest to Flask"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        # Flask endpoint -> async view used in its place
+        self.views = {
+            'get_products': self.get_products,
+            'get_cart': self.get_cart,
+            'get_order': self.get_order,
+        }
+        self.engines = {}
+        self.sessionmakers = {}
+        self._engine_lock = asyncio.Lock()
+
+    async def _sessions(self):
+        """Async sessionmaker for the database this request reads from"""
+        # Replica routing (and read-your-writes pinning) was decided by the
+        # router's before_request hook, exactly as for a Flask view
+        url = (replicas.read_engine() or db.engine).url
+        if url not in self.sessionmakers:
+            # Created on first use so each uvicorn worker builds its own engines
+            async with self._engine_lock:
+                if url not in self.sessionmakers:
+                    async_url = async_database_url(url)
+                    options = {}
+                    if async_url.get_backend_name() != 'sqlite':
+                        options = {
+                            'pool_size': int(os.getenv('ASGI_DB_POOL_SIZE', 20)),
+                            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),
+                            'pool_pre_ping': True,
+                        }
+                    self.engines[url] = create_async_engine(async_url, **options)
+                    self.sessionmakers[url] = async_sessionmaker(self.engines[url], expire_on_commit=False)
+        return self.sessionmakers[url]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            endpoint = self._endpoint(scope['path'])
+            if endpoint in self.views:
+                return await self._serve(self.views[endpoint], scope, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.flask_app.extensions['structured_logging'].install()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in self.engines.values():
+                    await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _endpoint(self, path):
+        try:
+            endpoint, _ = self.flask_app.url_map.bind('localhost').match(path, 'GET')
+        except HTTPException:  # 404, 405 and redirects: let Flask answer
+            return None
+        return endpoint
+
+    async def _serve(self, view, scope, send):
+        """Flask's wsgi_app() and full_dispatch_request(), awaiting an async view"""
+        flask_app = self.flask_app
+        ctx = flask_app.request_context(wsgi_environ(scope))
+        error = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                response = flask_app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = flask_app.handle_exception(e)
+            await self._respond(send, response)
+        finally:
+            if error is not None and flask_app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    async def _respond(self, send, response):
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def get_products(self):
+        """Get all products"""
+        async with (await self._sessions())() as session:
+            products = (await session.scalars(select(Product))).all()
+        return jsonify([product_to_dict(p) for p in products])
+
+    async def get_cart(self):
+        """Get cart items for a session"""
+        session_id = request.args.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'session_id required'}), 400
+        async with (await self._sessions())() as session:
+            items = (await session.scalars(
+                select(CartItem)
+                .options(joinedload(CartItem.product))
+                .filter_by(session_id=session_id)
+            )).all()
+        return jsonify(cart_to_dict(items))
+
+    async def get_order(self, order_number):
+        """Get order details, from the shared order cache when possible"""
+        cached = order_cache.get(order_number)
+        if cached is not None and order_cache.needs_check(order_number, cached):
+            # Another worker may have changed the status since it was last checked
+            async with (await self._sessions())() as session:
+                status = await session.scalar(
+                    select(Order.status).filter_by(order_number=order_number).limit(1))
+            cached = order_cache.confirm(order_number, cached, status)
+        if cached is None:
+            order = await self._find_order(order_number)
+            if order is None and replicas.use_primary():
+                # Just placed and not replicated yet
+                order = await self._find_order(order_number)
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+            cached = order_cache.put(order_number, order_to_dict(order))
+        if request.if_none_match.contains(cached.etag):
+            response = self.flask_app.response_class(status=304)
+        else:
+            response = jsonify(cached.payload)
+        response.headers.update(order_cache_headers(cached))
+        return response
+
+    async def _find_order(self, order_number):
+        async with (await self._sessions())() as session:
+            return (await session.scalars(
+                select(Order).filter_by(order_number=order_number).limit(1)
+            )).first()
+
+application = APIApplication(app)
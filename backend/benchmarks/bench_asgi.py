@@ -0,0 +1,64 @@
+"""
+ASGI vs gunicorn sync at high connection counts.
+
+Drives the read routes (products, cart, order lookup) from a single event
+loop holding N concurrent connections, first against gunicorn with sync
+workers (the Procfile setup) and then against uvicorn serving asgi.py.
+
+    python benchmarks/bench_asgi.py --connections 64,256,1024 --duration 15
+"""
+import argparse
+import json
+import resource
+import urllib.request
+
+from harness import (GunicornServer, UvicornServer, drive_async_load, http_json, percentile,
+                     seeded_database)
+
+
+
+def prepare(base_url, sessions):
+    """Fill some carts and place one order; returns the read paths to drive"""
+    for index in range(sessions):
+        http_json('POST', f'{base_url}/api/cart/add',
+                  {'session_id': f'bench-{index}', 'product_id': index % 4 + 1, 'quantity': 1})
+    request = urllib.request.Request(
+        f'{base_url}/api/checkout', method='POST', headers={'Content-Type': 'application/json'},
+        data=json.dumps({'session_id': 'bench-0', 'email': 'bench@example.com',
+                         'payment_method': 'paypal', 'shipping_address': '1 Bench St'}).encode(),
+    )
+    with urllib.request.urlopen(request) as response:
+        order_number = json.loads(response.read())['order_number']
+    return ['/api/products', '/api/cart?session_id=bench-{index}', '/api/products',
+            f'/api/orders/{order_number}']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connections', default='64,256,1024')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn sync workers')
+    parser.add_argument('--asgi-workers', type=int, default=1)
+    args = parser.parse_args()
+
+    # Each client connection needs a descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    servers = {
+        f'sync x{args.workers}': lambda env: GunicornServer({**env, 'WEB_CONCURRENCY': str(args.workers)}),
+        f'asgi x{args.asgi_workers}': lambda env: UvicornServer(env, workers=args.asgi_workers),
+    }
+    print(f"{'server':<10} {'conns':>6} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>9}")
+    for name, make_server in servers.items():
+        env = {'DATABASE_URL': seeded_database(), 'GUNICORN_BACKLOG': '4096'}
+        with make_server(env) as server:
+            read_paths = prepare(server.url, 50)
+            for connections in (int(c) for c in args.connections.split(',')):
+                completed, errors, latencies = drive_async_load(server.url, read_paths, connections, args.duration)
+                print(f'{name:<10} {connections:>6} {completed / args.duration:>9.1f} {errors:>7} '
+                      f'{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Checkout contention: many processes buying the same few products.
+
+Starts --processes worker processes with --threads threads each. Every
+thread drives the WSGI app in-process (no HTTP server) against one
+file-backed database, in a loop of add-one-unit-to-cart then checkout,
+always on the --hot most popular products. Each run starts with --stock
+units per hot product.
+
+Reports throughput, checkout latency and error rates broken down by
+exception. Lock wait is the time spent inside INSERT/UPDATE/DELETE
+statements and COMMITs, which is where SQLite waits on its busy timeout
+and PostgreSQL on row locks. Afterwards the stock left is reconciled
+against the orders: an oversell is an order beyond the initial stock, a
+lost update is a sale that did not decrement stock, and a stranded hold
+is a unit still reserved after the run.
+
+    python benchmarks/bench_checkout_contention.py --processes 4 --threads 2 --hot 1
+    python benchmarks/bench_checkout_contention.py --database-url postgresql://localhost/bench
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import create_engine, text
+
+from harness import init_database, percentile, seeded_database
+
+_WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class LockTimer:
+    """Accumulates time spent in write statements and commits"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+        self._started = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        do_commit = engine.dialect.do_commit
+
+        def timed_commit(dbapi_connection):
+            started = time.perf_counter()
+            try:
+                do_commit(dbapi_connection)
+            finally:
+                self._add(time.perf_counter() - started)
+        engine.dialect.do_commit = timed_commit
+
+    def _add(self, elapsed):
+        with self._lock:
+            self.seconds += elapsed
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._started.at = time.perf_counter() if statement.lstrip().upper().startswith(_WRITES) else None
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(self._started, 'at', None)
+        if started is not None:
+            self._add(time.perf_counter() - started)
+
+
+def worker(hot, threads, duration, barrier, results):
+    """One process: `threads` shoppers looping add-to-cart + checkout"""
+    from flask import got_request_exception
+    from app import app, db
+
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    app.config['MAIL_DEFAULT_SENDER'] = 'bench@example.com'
+    app.config['JOBS_ENABLED'] = False
+    with app.app_context():
+        timer = LockTimer(db.engine)
+    exceptions = Counter()
+    exceptions_lock = threading.Lock()
+
+    def record_exception(sender, exception, **extra):
+        name = type(exception).__name__
+        if 'database is locked' in str(exception):
+            name += ' (database is locked)'
+        with exceptions_lock:
+            exceptions[name] += 1
+    got_request_exception.connect(record_exception, app)
+
+    totals = Counter()
+    latencies = []
+    totals_lock = threading.Lock()
+
+    def shopper(index):
+        client = app.test_client()
+        local, local_latencies = Counter(), []
+        stop = time.perf_counter() + duration
+        iteration = 0
+        while time.perf_counter() < stop:
+            session_id = f'contend-{os.getpid()}-{index}-{iteration}'
+            product_id = (index + iteration) % hot + 1
+            iteration += 1
+            status = client.post('/api/cart/add', json={
+                'session_id': session_id, 'product_id': product_id, 'quantity': 1,
+            }).status_code
+            local[f'add {status}'] += 1
+            if status != 201:
+                continue
+            started = time.perf_counter()
+            status = client.post('/api/checkout', json={
+                'session_id': session_id, 'email': 'load@example.com', 'payment_method': 'paypal',
+            }).status_code
+            local_latencies.append(time.perf_counter() - started)
+            local[f'checkout {status}'] += 1
+        with totals_lock:
+            totals.update(local)
+            latencies.extend(local_latencies)
+
+    barrier.wait()
+    pool = [threading.Thread(target=shopper, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put({
+        'totals': dict(totals),
+        'latencies': latencies,
+        'exceptions': dict(exceptions),
+        'lock_seconds': timer.seconds,
+    })
+
+
+def prepare(url, hot, stock):
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        for table in ('stock_reservation', 'cart_item', '"order"', 'sales_rollup_hourly',
+                      'sales_rollup_daily'):
+            connection.execute(text(f'DELETE FROM {table}'))
+        connection.execute(text('UPDATE product SET stock = :stock, reserved = 0 WHERE id <= :hot'),
+                           {'stock': stock, 'hot': hot})
+        prices = dict(connection.execute(
+            text('SELECT id, price FROM product WHERE id <= :hot ORDER BY id'), {'hot': hot}
+        ).all())
+    engine.dispose()
+    return prices
+
+
+def reconcile(url, prices, stock):
+    engine = create_engine(url)
+    with engine.connect() as connection:
+        products = {row.id: row for row in connection.execute(
+            text('SELECT id, name, stock, reserved FROM product WHERE id <= :hot'), {'hot': len(prices)}
+        )}
+        orders = Counter(round(total, 2) for total, in connection.execute(
+            text('SELECT total_amount FROM "order"')
+        ))
+    engine.dispose()
+    rows = []
+    for product_id, price in prices.items():
+        product = products[product_id]
+        sold = orders[round(price, 2)]
+        rows.append({
+            'name': product.name,
+            'orders': sold,
+            'stock_left': product.stock,
+            'oversold': max(0, sold - stock),
+            'lost_updates': sold - (stock - product.stock),
+            'stranded': product.reserved,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1, help='shopper threads per process')
+    parser.add_argument('--hot', type=int, default=2, choices=range(1, 5), help='hot products (1-4)')
+    parser.add_argument('--stock', type=int, default=200, help='initial units per hot product')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--database-url', help='default: a fresh SQLite file')
+    args = parser.parse_args()
+
+    url = init_database(args.database_url) if args.database_url else seeded_database()
+    prices = prepare(url, args.hot, args.stock)
+    os.environ.update({'DATABASE_URL': url, 'RATELIMIT_ENABLED': 'false',
+                       'ADMISSION_ENABLED': 'false', 'MAIL_ASYNC': 'false',
+                       'WORKER_CONCURRENCY': str(args.threads)})
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(args.processes + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(args.hot, args.threads, args.duration, barrier, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    reports = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    totals, exceptions, latencies = Counter(), Counter(), []
+    lock_seconds = 0.0
+    for report in reports:
+        totals.update(report['totals'])
+        exceptions.update(report['exceptions'])
+        latencies.extend(report['latencies'])
+        lock_seconds += report['lock_seconds']
+    requests = sum(totals.values())
+    confirmed = totals['checkout 201']
+    attempted = sum(count for key, count in totals.items() if key.startswith('checkout'))
+    failed = sum(count for key, count in totals.items() if key.split()[1].startswith('5'))
+
+    print(f'{args.processes} processes x {args.threads} threads, {args.hot} hot products, '
+          f'{args.stock} units each, {elapsed:.1f}s on {url.split(":", 1)[0]}')
+    print(f'requests/s     {requests / elapsed:>10.1f}')
+    print(f'orders/s       {confirmed / elapsed:>10.1f}  ({confirmed} of {attempted} checkouts)')
+    print(f'checkout p50   {percentile(latencies, 50) * 1000:>9.1f}ms')
+    print(f'checkout p99   {percentile(latencies, 99) * 1000:>9.1f}ms')
+    print(f'lock wait      {lock_seconds:>9.2f}s  '
+          f'({lock_seconds / max(confirmed, 1) * 1000:.1f} ms per order, '
+          f'{lock_seconds / (elapsed * args.processes * args.threads):.0%} of shopper time)')
+    print(f'errors         {failed:>10} ({failed / max(requests, 1):.2%} of requests)')
+    for key in sorted(totals):
+        print(f'  {key:<14} {totals[key]:>8}')
+    for name, count in exceptions.most_common():
+        print(f'  {name}: {count}')
+    print(f"\n{'product':<10} {'orders':>7} {'left':>6} {'oversold':>9} {'lost upd':>9} {'stranded':>9}")
+    for row in reconcile(url, prices, args.stock):
+        print(f"{row['name']:<10} {row['orders']:>7} {row['stock_left']:>6} {row['oversold']:>9} "
+              f"{row['lost_updates']:>9} {row['stranded']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Discount code Bloom filter on a million-code campaign.
+
+Builds the filter over N valid codes shaped like
+TestDataGenerator.generate_discount_code (8 uppercase letters/digits),
+then replays a brute-force run of random guesses of the same shape.
+Reports build time, filter size, false-positive rate and rejection
+throughput, next to the ORM lookup each guess used to cost.
+
+    python benchmarks/bench_discount_filter.py --codes 1000000 --guesses 1000000
+"""
+import argparse
+import os
+import random
+import string
+import time
+
+from harness import seeded_database
+from bloom import BloomFilter
+
+ALPHABET = string.ascii_uppercase + string.digits
+
+
+def random_codes(rng, count):
+    return [''.join(rng.choices(ALPHABET, k=8)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--codes', type=int, default=1000000)
+    parser.add_argument('--guesses', type=int, default=1000000)
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    parser.add_argument('--db-sample', type=int, default=20000,
+                        help='guesses replayed against the database for comparison (0 skips)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    valid = set(random_codes(rng, args.codes))
+    guesses = [code for code in random_codes(rng, args.guesses) if code not in valid]
+
+    started = time.perf_counter()
+    # Same sizing DiscountCodeFilter.rebuild() uses
+    bloom = BloomFilter(2 * len(valid), args.error_rate)
+    for code in valid:
+        bloom.add(code)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    false_positives = sum(1 for guess in guesses if guess in bloom)
+    probe_s = time.perf_counter() - started
+
+    print(f'codes:               {len(valid):,}')
+    print(f'filter size:         {bloom.size_bytes / 1024 / 1024:.2f} MiB '
+          f'({bloom.num_bits / len(valid):.1f} bits/code, {bloom.num_hashes} hashes)')
+    print(f'build time:          {build_s:.2f} s')
+    print(f'guesses:             {len(guesses):,}')
+    print(f'false positives:     {false_positives:,} ({false_positives / len(guesses):.4%}, '
+          f'target {args.error_rate:.4%} at capacity)')
+    print(f'rejections/s:        {(len(guesses) - false_positives) / probe_s:,.0f}')
+    print(f'probe latency:       {probe_s / len(guesses) * 1e6:.2f} us')
+
+    if args.db_sample:
+        # What each guess cost before: the ORM lookup in load_discount_code
+        # against a SQLite file holding the campaign
+        os.environ['DATABASE_URL'] = seeded_database()
+        from app import app, db, load_discount_code
+
+        with app.app_context():
+            connection = db.session.connection()
+            connection.exec_driver_sql('DELETE FROM discount_code')
+            connection.exec_driver_sql(
+                'INSERT INTO discount_code (code, discount_percent, is_active) VALUES (?, 10, 1)',
+                [(code,) for code in valid],
+            )
+            db.session.commit()
+            sample = guesses[:args.db_sample]
+            started = time.perf_counter()
+            for guess in sample:
+                load_discount_code(guess)
+            db_s = time.perf_counter() - started
+        print(f'db lookups/s:        {len(sample) / db_s:,.0f} (ORM query, SQLite file)')
+
+
+if __name__ == '__main__':
+    main()
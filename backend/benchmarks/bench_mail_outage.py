@@ -0,0 +1,141 @@
+"""
+Checkout latency through an SMTP outage, with and without the mail breaker.
+
+Runs gunicorn against a local fake SMTP server in three phases of
+--phase seconds each: healthy (mail accepted after --smtp-latency),
+outage (the server accepts connections and never answers) and recovered.
+Shoppers add one unit to a cart and check out in a loop; checkout
+latency is reported per phase, along with the breaker state each worker
+reported at the end of the phase.
+
+Mail is sent inline (MAIL_ASYNC=false) unless --async is given, which is
+where an outage hurts most: without the breaker every checkout waits
+MAIL_TIMEOUT. With the async pool checkout is not blocked, but the pool
+falls behind and keeps working through a backlog of doomed messages.
+With the breaker on, the outage p99 still includes the --failures
+checkouts per worker that time out before it opens; after that,
+checkouts skip the email and run at healthy speed.
+
+    python benchmarks/bench_mail_outage.py --phase 10 --connections 8
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+
+from sqlalchemy import create_engine, text
+
+from harness import GunicornServer, http_json, percentile, seeded_database
+from fakesmtp import FakeSMTPServer  # importable once harness has put backend/ on sys.path
+
+PHASES = (('healthy', 'ok'), ('outage', 'hang'), ('recovered', 'ok'))
+
+
+def breaker_states(server, workers, attempts=20):
+    """Breaker state per worker pid, from as many workers as answer"""
+    states = {}
+    for _ in range(attempts):
+        with urllib.request.urlopen(server.url + '/api/metrics', timeout=30) as response:
+            metrics = json.load(response)
+        states[metrics['pid']] = metrics['mail']['breaker']['state']
+        if len(states) == workers:
+            break
+    return states
+
+
+def run_phase(server, connections, duration):
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def shopper(index):
+        iteration = 0
+        while time.perf_counter() < stop:
+            session_id = f'outage-{os.getpid()}-{index}-{iteration}-{time.time_ns()}'
+            iteration += 1
+            http_json('POST', server.url + '/api/cart/add',
+                      {'session_id': session_id, 'product_id': 1, 'quantity': 1})
+            started = time.perf_counter()
+            try:
+                status = http_json('POST', server.url + '/api/checkout', {
+                    'session_id': session_id, 'email': 'buyer@example.com', 'payment_method': 'paypal',
+                }, timeout=60)
+            except OSError:
+                status = None
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+
+    threads = [threading.Thread(target=shopper, args=(i,)) for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def run(breaker, smtp, database_url, args):
+    env = {
+        'DATABASE_URL': database_url,
+        'WEB_CONCURRENCY': str(args.workers),
+        'MAIL_SERVER': smtp.host,
+        'MAIL_PORT': str(smtp.port),
+        'MAIL_USE_TLS': 'false',
+        'MAIL_USERNAME': 'shop@example.com',
+        'MAIL_ASYNC': 'true' if args.use_async else 'false',
+        'MAIL_TIMEOUT': str(args.mail_timeout),
+        'MAIL_BREAKER_FAILURES': str(args.failures) if breaker else '0',
+        'MAIL_BREAKER_RESET': str(args.reset),
+        'LOG_LEVEL': 'ERROR',
+    }
+    rows = []
+    with GunicornServer(env) as server:
+        for phase, mode in PHASES:
+            smtp.mode = mode
+            connected = smtp.connections
+            latencies, statuses = run_phase(server, args.connections, args.phase)
+            states = breaker_states(server, args.workers)
+            rows.append({
+                'breaker': 'on' if breaker else 'off',
+                'phase': phase,
+                'orders': statuses.count(201),
+                'errors': len(statuses) - statuses.count(201),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'smtp': smtp.connections - connected,
+                'states': ','.join(sorted(set(states.values()))),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--phase', type=float, default=10, help='seconds per phase')
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--smtp-latency', type=float, default=0.05)
+    parser.add_argument('--mail-timeout', type=float, default=2)
+    parser.add_argument('--failures', type=int, default=3, help='MAIL_BREAKER_FAILURES when on')
+    parser.add_argument('--reset', type=float, default=5, help='MAIL_BREAKER_RESET seconds')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='send through the mail pool')
+    args = parser.parse_args()
+
+    database_url = seeded_database()
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(text('UPDATE product SET stock = 1000000000'))
+    engine.dispose()
+
+    print(f"{'breaker':<8} {'phase':<10} {'orders':>7} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'SMTP conns':>10}  breaker state")
+    with FakeSMTPServer(latency=args.smtp_latency) as smtp:
+        for breaker in (False, True):
+            for row in run(breaker, smtp, database_url, args):
+                print(f"{row['breaker']:<8} {row['phase']:<10} {row['orders']:>7} {row['errors']:>7} "
+                      f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['smtp']:>10}  {row['states']}")
+
+
+if __name__ == '__main__':
+    main()
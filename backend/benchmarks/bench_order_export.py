@@ -0,0 +1,83 @@
+"""
+Order export memory and throughput.
+
+Seeds N orders into a throwaway SQLite database, runs one gunicorn sync
+worker and streams /api/orders/export in each format while sampling the
+worker's RSS. Peak RSS should stay flat as --orders grows.
+
+    python benchmarks/bench_order_export.py --orders 200000,1000000
+"""
+import argparse
+import sqlite3
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from harness import GunicornServer, rss_kb, seeded_database
+
+TOKEN = 'bench-admin-token'
+
+
+def seed_orders(url, count):
+    connection = sqlite3.connect(url[len('sqlite:///'):])
+    start = datetime(2024, 1, 1)
+    connection.executemany(
+        'INSERT INTO "order" (order_number, session_id, total_amount, discount_amount, status, email, '
+        'created_at, payment_method, shipping_address) VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)',
+        ((f'ORD-BENCH{i:010d}', f'session-{i % 5000}', 10.0 + i % 500, 'confirmed',
+          'bench@example.com', (start + timedelta(seconds=i * 30)).isoformat(' '),
+          'card', f'{i} Bench Street, Springfield') for i in range(count)),
+    )
+    connection.commit()
+    connection.close()
+
+
+def stream(url, accept_gzip=False):
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+    if accept_gzip:
+        headers['Accept-Encoding'] = 'gzip'
+    total = 0
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=600) as response:
+        while True:
+            chunk = response.read(1 << 16)
+            if not chunk:
+                return total
+            total += len(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--orders', default='200000,1000000')
+    args = parser.parse_args()
+
+    print(f"{'orders':>9} {'export':<12} {'MB':>8} {'seconds':>8} {'rows/s':>9} {'idle RSS':>9} {'peak RSS':>9}")
+    for count in (int(c) for c in args.orders.split(',')):
+        url = seeded_database()
+        seed_orders(url, count)
+        env = {'DATABASE_URL': url, 'WEB_CONCURRENCY': '1', 'ADMIN_API_TOKEN': TOKEN,
+               'GUNICORN_TIMEOUT': '600'}
+        with GunicornServer(env) as server:
+            worker = server.worker_pids()[0]
+            idle = rss_kb(worker)
+            for name, query, accept_gzip in [('csv', 'format=csv', False), ('ndjson', 'format=ndjson', False),
+                                              ('csv+gzip', 'format=csv', True)]:
+                peak, done = [idle], threading.Event()
+
+                def sample():
+                    while not done.is_set():
+                        peak[0] = max(peak[0], rss_kb(worker))
+                        time.sleep(0.05)
+                sampler = threading.Thread(target=sample)
+                sampler.start()
+                started = time.perf_counter()
+                size = stream(f'{server.url}/api/orders/export?{query}', accept_gzip)
+                elapsed = time.perf_counter() - started
+                done.set()
+                sampler.join()
+                print(f'{count:>9} {name:<12} {size / 1e6:>8.1f} {elapsed:>8.1f} {count / elapsed:>9.0f} '
+                      f'{idle / 1024:>8.0f}M {peak[0] / 1024:>8.0f}M')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Worker boot time and memory with and without gunicorn --preload.
+
+Starts gunicorn on 'app:create_app()' with GUNICORN_PRELOAD off and on,
+and reports the time until the first and until every worker answers,
+per-worker RSS and PSS (shared copy-on-write pages counted once) after a
+short warm-up, and the total PSS of master plus workers. Also times a
+bare ``import app`` in a fresh interpreter.
+
+    python benchmarks/bench_startup.py --workers 4
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.request
+
+from harness import (BACKEND_DIR, GunicornServer, drive_load, http_json, pss_kb, rss_kb,
+                     seeded_database)
+
+
+def import_seconds(database_url, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=BACKEND_DIR, check=True,
+                       env={'DATABASE_URL': database_url, 'PATH': ''})
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def wait_for_workers(server, workers, timeout=60):
+    """Seconds from launch until `workers` distinct pids have answered"""
+    seen = set()
+    deadline = time.time() + timeout
+    while len(seen) < workers and time.time() < deadline:
+        with urllib.request.urlopen(server.url + '/api/metrics', timeout=5) as response:
+            seen.add(json.load(response)['pid'])
+    return time.perf_counter() - server.started
+
+
+def run(preload, database_url, args):
+    env = {
+        'DATABASE_URL': database_url,
+        'GUNICORN_PRELOAD': 'true' if preload else 'false',
+        'WEB_CONCURRENCY': str(args.workers),
+    }
+    with GunicornServer(env, app='app:create_app()') as server:
+        all_ready = wait_for_workers(server, args.workers)
+        drive_load(lambda index, iteration: http_json('GET', server.url + '/api/products') == 200,
+                   args.workers * 2, args.warmup)
+        workers = server.worker_pids()
+        return {
+            'preload': 'on' if preload else 'off',
+            'first_ms': server.ready_after * 1000,
+            'all_ms': all_ready * 1000,
+            'rss_mb': sum(rss_kb(pid) for pid in workers) / len(workers) / 1024,
+            'pss_mb': sum(pss_kb(pid) for pid in workers) / len(workers) / 1024,
+            'total_mb': sum(pss_kb(pid) for pid in [server.process.pid, *workers]) / 1024,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of load before sampling memory')
+    parser.add_argument('--repeat', type=int, default=5, help='import timings to take the best of')
+    args = parser.parse_args()
+
+    database_url = seeded_database()
+    print(f'import app: {import_seconds(database_url, args.repeat) * 1000:.0f} ms')
+    print(f"{'preload':<8} {'first ms':>9} {'all ms':>8} {'RSS/worker':>11} "
+          f"{'PSS/worker':>11} {'total PSS':>10}")
+    for preload in (False, True):
+        row = run(preload, database_url, args)
+        print(f"{row['preload']:<8} {row['first_ms']:>9.0f} {row['all_ms']:>8.0f} "
+              f"{row['rss_mb']:>9.1f}MB {row['pss_mb']:>9.1f}MB {row['total_mb']:>8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
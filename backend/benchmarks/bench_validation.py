@@ -0,0 +1,86 @@
+"""
+Checkout body validation: hand-written helpers vs the compiled schema.
+
+Times the checks the checkout route used to run inline (sanitize_input
+on five fields, validate_email, validate_card_number, validate_cvv)
+against CHECKOUT_SCHEMA.validate, on a valid body and on hostile ones.
+
+    python benchmarks/bench_validation.py --number 20000
+"""
+import argparse
+import os
+import timeit
+
+import harness  # noqa: F401 - puts the backend on sys.path
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+from app import (CHECKOUT_SCHEMA, sanitize_input, validate_card_number, validate_cvv,
+                 validate_email)
+from validation import ValidationError
+
+VALID = {
+    'session_id': 'session-6f1c2a9e',
+    'email': 'shopper@example.com',
+    'payment_method': 'card',
+    'card_number': '4111 1111 1111 1111',
+    'cvv': '123',
+    'expiry_date': '12/25',
+    'shipping_address': '123 Main Street, Springfield, IL 62701',
+    'discount_code': 'SAVE10',
+}
+
+PAYLOADS = {
+    'valid': VALID,
+    'sql injection': {**VALID, 'session_id': "'; DROP TABLE orders; --",
+                      'shipping_address': "1'; DELETE FROM orders WHERE '1'='1",
+                      'discount_code': "' OR 1=1; SELECT * FROM discount_code --"},
+    'oversized': {**VALID, 'shipping_address': "'; SELECT " * 10000,
+                  'email': 'a' * 100000 + '@example.com'},
+    'bad card': {**VALID, 'card_number': '4111-1111-abcd', 'cvv': '12a'},
+}
+
+
+def legacy(data):
+    """The checkout route's inline validation before the schema"""
+    session_id = sanitize_input(data.get('session_id', ''))
+    email = data.get('email', '').strip()
+    payment_method = sanitize_input(data.get('payment_method', ''))
+    card_number = data.get('card_number', '')
+    cvv = data.get('cvv', '')
+    expiry_date = data.get('expiry_date', '')
+    sanitize_input(data.get('shipping_address', ''))
+    sanitize_input(data.get('discount_code', ''))
+    if not session_id or not payment_method or not validate_email(email):
+        return False
+    if payment_method == 'card':
+        if not card_number or not validate_card_number(card_number):
+            return False
+        if not cvv or not validate_cvv(cvv) or not expiry_date:
+            return False
+    return True
+
+
+def compiled(data):
+    try:
+        CHECKOUT_SCHEMA.validate(data)
+    except ValidationError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<14} {'legacy us':>10} {'schema us':>10} {'speedup':>8}")
+    for name, payload in PAYLOADS.items():
+        number = args.number if name != 'oversized' else max(1, args.number // 100)
+        legacy_s = min(timeit.repeat(lambda: legacy(payload), number=number, repeat=3)) / number
+        compiled_s = min(timeit.repeat(lambda: compiled(payload), number=number, repeat=3)) / number
+        print(f'{name:<14} {legacy_s * 1e6:>10.2f} {compiled_s * 1e6:>10.2f} '
+              f'{legacy_s / compiled_s:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
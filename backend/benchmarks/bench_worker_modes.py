@@ -0,0 +1,79 @@
+"""
+Throughput per GB of RAM for each gunicorn worker mode.
+
+Runs the stress-test.js workflow (browse, add to cart, view cart) against
+gunicorn in sync, gthread and (if installed) gevent mode and reports
+requests/s, total worker memory and requests/s per GB.
+
+    python benchmarks/bench_worker_modes.py --connections 64 --duration 20
+"""
+import argparse
+import importlib.util
+import os
+
+from harness import (GunicornServer, drive_load, http_json, percentile, pss_kb,
+                     seeded_database)
+
+
+def workflow(base_url):
+    def request(index, iteration):
+        session_id = f'bench-{os.getpid()}-{index}-{iteration}'
+        step = iteration % 3
+        if step == 0:
+            return http_json('GET', f'{base_url}/api/products') == 200
+        if step == 1:
+            status = http_json('POST', f'{base_url}/api/cart/add', {
+                'session_id': session_id, 'product_id': iteration % 4 + 1, 'quantity': 1,
+            })
+            return status in (201, 400)
+        return http_json('GET', f'{base_url}/api/cart?session_id={session_id}') == 200
+    return request
+
+
+def run_mode(mode, args):
+    env = {
+        'DATABASE_URL': seeded_database(),
+        'GUNICORN_WORKER_MODE': mode,
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_WORKER_CONNECTIONS': str(args.greenlets),
+    }
+    with GunicornServer(env) as server:
+        drive_load(workflow(server.url), args.connections, 2)  # warm up
+        completed, errors, latencies = drive_load(workflow(server.url), args.connections, args.duration)
+        pids = [server.process.pid, *server.worker_pids()]
+        memory_mb = sum(pss_kb(pid) for pid in pids) / 1024
+    throughput = completed / args.duration
+    return {
+        'mode': mode,
+        'rps': throughput,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'memory_mb': memory_mb,
+        'rps_per_gb': throughput / (memory_mb / 1024) if memory_mb else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--greenlets', type=int, default=100)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'PSS MB':>8} {'req/s/GB':>10}")
+    for mode in args.modes.split(','):
+        if mode == 'gevent' and importlib.util.find_spec('gevent') is None:
+            print(f'{mode:<8} skipped (gevent not installed)')
+            continue
+        r = run_mode(mode, args)
+        print(f"{r['mode']:<8} {r['rps']:>9.1f} {r['errors']:>7} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['memory_mb']:>8.1f} {r['rps_per_gb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
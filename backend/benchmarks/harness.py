@@ -0,0 +1,251 @@
+"""
+Shared helpers for the backend benchmarks: start a gunicorn server on a
+throwaway SQLite database, drive HTTP load and sample worker memory.
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seeded_database(path=None):
+    """Create and seed a SQLite database file; returns its URL"""
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.db', prefix='bench-')
+        os.close(fd)
+    return init_database(f'sqlite:///{path}')
+
+
+def init_database(url):
+    """Create and seed the schema at `url` in a fresh interpreter"""
+    subprocess.run(
+        [sys.executable, '-c', 'from app import app, init_db\nwith app.app_context(): init_db()'],
+        cwd=BACKEND_DIR, env={**os.environ, 'DATABASE_URL': url}, check=True,
+    )
+    return url
+
+
+class ServerProcess:
+    """Context manager running an app server from the backend directory"""
+
+    def __init__(self, argv, env=None):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.env = {
+            **os.environ,
+            'PORT': str(self.port),
+            'RATELIMIT_ENABLED': 'false',
+            'ADMISSION_ENABLED': 'false',
+            # Nothing listens here, so confirmation emails fail fast
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': '9',
+            **(env or {}),
+        }
+        self.argv = [arg.format(port=self.port) for arg in argv]
+        self.process = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(
+            self.argv, cwd=BACKEND_DIR, env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.ready_after = wait_until_ready(self.url + '/api/health') - self.started
+        return self
+
+    def __exit__(self, *exc):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def worker_pids(self):
+        return child_pids(self.process.pid)
+
+
+class GunicornServer(ServerProcess):
+    """gunicorn configured by gunicorn.conf.py"""
+
+    def __init__(self, env=None, app='app:app', args=()):
+        super().__init__(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', *args, app], env
+        )
+
+
+class UvicornServer(ServerProcess):
+    """uvicorn serving the ASGI entry point"""
+
+    def __init__(self, env=None, workers=1):
+        super().__init__([
+            sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', '{port}',
+            '--workers', str(workers), '--log-level', 'warning', '--backlog', '4096',
+        ], env)
+
+
+def wait_until_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'{url} did not become ready within {timeout}s')
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_kb(pid, field='VmRSS'):
+    """Resident set size of one process in kB (Linux /proc)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def pss_kb(pid):
+    """Proportional set size in kB; counts shared copy-on-write pages once"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return rss_kb(pid)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def drive_load(request_fn, connections, duration):
+    """Call request_fn(worker_index, iteration) from many threads.
+
+    Returns (completed, errors, latencies in seconds).
+    """
+    stop = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def client(index):
+        iteration = 0
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                ok = request_fn(index, iteration)
+            except OSError:
+                ok = False
+            local_latencies.append(time.perf_counter() - started)
+            local_errors += 0 if ok else 1
+            iteration += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        list(pool.map(client, range(connections)))
+    return len(latencies), errors[0], latencies
+
+
+def http_json(method, url, body=None, timeout=30):
+    return http_call(method, url, body, timeout)[0]
+
+
+def http_call(method, url, body=None, timeout=30):
+    """Returns (status, response body parsed as JSON or None)"""
+    data = None
+    headers = {}
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers['Content-Type'] = 'application/json'
+    request = urllib.request.Request(url, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    try:
+        return status, json.loads(payload)
+    except ValueError:
+        return status, None
+
+
+async def _async_get(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+def drive_async_load(base_url, paths, connections, duration):
+    """Hold `connections` concurrent GET loops open from one event loop.
+
+    Scales to thousands of client connections, which a thread per
+    connection cannot. Returns (completed, errors, latencies in seconds).
+    """
+    host, port = base_url.split('//', 1)[1].split(':')
+    port = int(port)
+
+    async def run():
+        stop = time.perf_counter() + duration
+        latencies, errors = [], 0
+
+        async def client(index):
+            nonlocal errors
+            iteration = 0
+            while time.perf_counter() < stop:
+                path = paths[(index + iteration) % len(paths)].format(index=index)
+                started = time.perf_counter()
+                try:
+                    ok = await asyncio.wait_for(_async_get(host, port, path), 60) == 200
+                except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                errors += 0 if ok else 1
+                iteration += 1
+
+        await asyncio.gather(*(client(i) for i in range(connections)))
+        return len(latencies), errors, latencies
+
+    return asyncio.run(run())
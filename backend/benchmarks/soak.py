@@ -0,0 +1,339 @@
+"""
+Soak test: hours of mixed traffic against gunicorn, watching for drift.
+
+Short load tests miss leaks and slow creep, so this runs a realistic mix
+for --duration (e.g. 4h) against a local gunicorn and samples, every
+--interval seconds:
+
+* RSS of every worker (a recycled worker shows up as a new pid)
+* open database connections - file descriptors on the SQLite file per
+  worker, or backends in pg_stat_activity for PostgreSQL
+* rows in cart_item, and rows in "order" not accounted for by the
+  checkouts this run confirmed
+* latency p50/p95/p99 and errors for the requests of that interval
+
+The mix browses the catalog, abandons carts, checks out, looks orders up
+and applies discount codes. Carts expire after --cart-ttl seconds, so
+cart_item should level off once the abandoned-cart job catches up.
+
+Every sample goes to --output as CSV. At the end a line is fitted to
+each metric over the samples after --warmup, and a metric whose fitted
+change over the run exceeds its tolerance is flagged; the exit status
+is 1 if anything was.
+
+    python benchmarks/soak.py --duration 4h --interval 60 --output soak.csv
+    python benchmarks/soak.py --duration 10m --warmup 2m --tolerance p99_ms=0.5
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from harness import GunicornServer, http_call, init_database, percentile, rss_kb, seeded_database
+
+# Share of each action in the mix
+MIX = (
+    ('browse', 50),
+    ('abandon_cart', 20),
+    ('checkout', 15),
+    ('order_lookup', 10),
+    ('discount', 5),
+)
+
+# metric: (largest tolerated change over the run relative to its fitted
+# start, floor for that start so near-zero baselines do not flag noise)
+TOLERANCES = {
+    'rss_kb': (0.10, 20 * 1024),
+    'connections': (0.50, 1),
+    'cart_item': (0.25, 100),
+    'unaccounted_orders': (0.0, 1),
+    'p50_ms': (0.25, 5),
+    'p99_ms': (0.50, 20),
+    'error_rate': (0.0, 0.01),
+}
+
+
+def parse_duration(value):
+    """Seconds from '90', '30s', '15m' or '4h'"""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def parse_tolerance(value):
+    metric, _, tolerance = value.partition('=')
+    if metric not in TOLERANCES:
+        raise argparse.ArgumentTypeError(f'unknown metric {metric!r}; one of {", ".join(TOLERANCES)}')
+    return metric, float(tolerance)
+
+
+def fit_line(points):
+    """Least-squares (intercept, slope) through (x, y) points"""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else 0.0
+    return mean_y - slope * mean_x, slope
+
+
+def drift(points, tolerance, floor):
+    """(start, end, relative change) of the fitted line, and whether it is too much"""
+    intercept, slope = fit_line(points)
+    first, last = points[0][0], points[-1][0]
+    start, end = intercept + slope * first, intercept + slope * last
+    change = (end - start) / max(abs(start), floor)
+    return start, end, change, change > tolerance
+
+
+class Workload:
+    """The request mix, run from --connections client threads"""
+
+    def __init__(self, base_url, products, seed=None):
+        self.base_url = base_url
+        self.products = products
+        self.actions = [name for name, weight in MIX for _ in range(weight)]
+        self.order_numbers = deque(maxlen=1000)
+        self.checkouts = 0
+        self.latencies, self.requests, self.errors = [], 0, 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def window(self):
+        """Latencies, requests and errors since the last call"""
+        with self._lock:
+            window = self.latencies, self.requests, self.errors
+            self.latencies, self.requests, self.errors = [], 0, 0
+        return window
+
+    def _timed(self, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, payload = http_call(method, self.base_url + path, body)
+        except OSError:
+            status, payload = None, None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.requests += 1
+            self.errors += 1 if status is None or status >= 500 else 0
+        return status, payload
+
+    def _add_to_cart(self, session_id, rng):
+        status, _ = self._timed('POST', '/api/cart/add', {
+            'session_id': session_id, 'product_id': rng.choice(self.products),
+            'quantity': rng.randint(1, 3),
+        })
+        return status == 201
+
+    def step(self, session_id, rng):
+        action = rng.choice(self.actions)
+        if action == 'browse':
+            self._timed('GET', '/api/products')
+        elif action == 'abandon_cart':
+            if self._add_to_cart(session_id, rng):
+                self._timed('GET', f'/api/cart?session_id={session_id}')
+        elif action == 'checkout':
+            if self._add_to_cart(session_id, rng):
+                status, payload = self._timed('POST', '/api/checkout', {
+                    'session_id': session_id, 'email': 'soak@example.com', 'payment_method': 'paypal',
+                })
+                if status == 201:
+                    with self._lock:
+                        self.checkouts += 1
+                        self.order_numbers.append(payload['order_number'])
+        elif action == 'order_lookup':
+            with self._lock:
+                order_number = rng.choice(self.order_numbers) if self.order_numbers else None
+            if order_number:
+                self._timed('GET', f'/api/orders/{order_number}')
+        elif self._add_to_cart(session_id, rng):
+            self._timed('POST', '/api/discount/apply', {
+                'session_id': session_id, 'code': rng.choice(('SAVE10', 'WELCOME20', 'NOPE')),
+            })
+
+    def client(self, index, stop):
+        rng = random.Random(self._random.random())
+        iteration = 0
+        while not stop.is_set():
+            self.step(f'soak-{os.getpid()}-{index}-{iteration}', rng)
+            iteration += 1
+
+
+class Probe:
+    """Reads connection counts and table sizes straight from the database"""
+
+    def __init__(self, url):
+        self.url = make_url(url)
+        self.sqlite = self.url.get_backend_name() == 'sqlite'
+        self.path = os.path.realpath(self.url.database) if self.sqlite else None
+        self.engine = create_engine(url, pool_size=1)
+
+    def prepare(self):
+        """Stock that outlasts the run; returns the product ids"""
+        with self.engine.begin() as connection:
+            connection.execute(text('UPDATE product SET stock = 1000000000'))
+            return [row.id for row in connection.execute(text('SELECT id FROM product ORDER BY id'))]
+
+    def connections(self, pids):
+        if not self.sqlite:
+            with self.engine.connect() as connection:
+                return connection.execute(text(
+                    'SELECT count(*) FROM pg_stat_activity '
+                    'WHERE datname = current_database() AND pid <> pg_backend_pid()'
+                )).scalar()
+        count = 0
+        for pid in pids:
+            try:
+                fds = os.listdir(f'/proc/{pid}/fd')
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    count += os.readlink(f'/proc/{pid}/fd/{fd}') == self.path
+                except OSError:
+                    pass
+        return count
+
+    def rows(self):
+        with self.engine.connect() as connection:
+            return {table: connection.execute(text(f'SELECT count(*) FROM {quoted}')).scalar()
+                    for table, quoted in (('cart_item', 'cart_item'), ('order', '"order"'))}
+
+
+def sample(server, workload, probe, started, baseline_orders, interval):
+    latencies, requests, errors = workload.window()
+    workers = {pid: rss_kb(pid) for pid in server.worker_pids()}
+    rows = probe.rows()
+    return {
+        'elapsed_s': round(time.perf_counter() - started),
+        'workers': len(workers),
+        'rss_kb': max(workers.values(), default=0),
+        'worker_rss_kb': ' '.join(f'{pid}:{kb}' for pid, kb in sorted(workers.items())),
+        'connections': probe.connections(workers),
+        'cart_item': rows['cart_item'],
+        'order': rows['order'],
+        'unaccounted_orders': rows['order'] - baseline_orders - workload.checkouts,
+        'rps': round(requests / interval, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'error_rate': round(errors / max(requests, 1), 4),
+    }
+
+
+def report(samples, warmup, tolerances):
+    """Print the fitted drift of every metric; returns the flagged ones"""
+    steady = [row for row in samples if row['elapsed_s'] >= warmup]
+    if len(steady) < 3:
+        print(f'\nonly {len(steady)} samples after the {warmup:.0f}s warm-up; need 3 to fit a trend')
+        return []
+    series = {metric: [(row['elapsed_s'], row[metric]) for row in steady] for metric in tolerances}
+    # A worker leaking on its own hides behind the max, so fit each pid too
+    for row in steady:
+        for entry in row['worker_rss_kb'].split():
+            pid, kb = entry.split(':')
+            series.setdefault(f'rss_kb[{pid}]', []).append((row['elapsed_s'], int(kb)))
+
+    flagged = []
+    print(f"\n{'metric':<20} {'start':>10} {'end':>10} {'change':>8} {'limit':>7}")
+    for metric, points in series.items():
+        tolerance, floor = tolerances[metric.split('[')[0]]
+        if len(points) < 3:
+            continue
+        start, end, change, too_much = drift(points, tolerance, floor)
+        if too_much:
+            flagged.append(metric)
+        print(f"{metric:<20} {start:>10.1f} {end:>10.1f} {change:>+8.1%} {tolerance:>7.0%}"
+              f"{'  DRIFT' if too_much else ''}")
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--duration', type=parse_duration, default='1h', help="e.g. 4h, 30m, 600")
+    parser.add_argument('--interval', type=parse_duration, default='60s', help='between samples')
+    parser.add_argument('--warmup', type=parse_duration, default='15m',
+                        help='samples before this are left out of the trends')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--connections', type=int, default=8, help='client threads')
+    parser.add_argument('--cart-ttl', type=parse_duration, default='5m',
+                        help='CART_TTL and RESERVATION_TTL for the server')
+    parser.add_argument('--tolerance', type=parse_tolerance, action='append', default=[],
+                        metavar='METRIC=CHANGE', help='e.g. rss_kb=0.05; repeatable')
+    parser.add_argument('--database-url', help='default: a fresh SQLite file')
+    parser.add_argument('--output', help='CSV file for the samples')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    tolerances = dict(TOLERANCES)
+    for metric, tolerance in args.tolerance:
+        tolerances[metric] = (tolerance, TOLERANCES[metric][1])
+
+    url = init_database(args.database_url) if args.database_url else seeded_database()
+    probe = Probe(url)
+    products = probe.prepare()
+    env = {
+        'DATABASE_URL': url,
+        'WEB_CONCURRENCY': str(args.workers),
+        'CART_TTL': str(int(args.cart_ttl)),
+        'RESERVATION_TTL': str(int(args.cart_ttl)),
+        'CART_GC_INTERVAL': str(max(1, int(args.cart_ttl // 5))),
+        'MAIL_ASYNC': 'false',
+    }
+    with GunicornServer(env, app='app:create_app()') as server:
+        workload = Workload(server.url, products, args.seed)
+        baseline_orders = probe.rows()['order']
+        stop = threading.Event()
+        clients = [threading.Thread(target=workload.client, args=(i, stop), daemon=True)
+                   for i in range(args.connections)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+
+        output = open(args.output, 'w', newline='') if args.output else None
+        writer = None
+        samples = []
+        print(f"{'elapsed':>8} {'workers':>7} {'max RSS':>9} {'conns':>5} {'cart_item':>9} "
+              f"{'order':>7} {'rps':>7} {'p50':>8} {'p99':>8} {'errors':>7}")
+        try:
+            while time.perf_counter() - started < args.duration:
+                time.sleep(min(args.interval, max(0.0, args.duration - (time.perf_counter() - started))))
+                row = sample(server, workload, probe, started, baseline_orders, args.interval)
+                samples.append(row)
+                print(f"{row['elapsed_s']:>7}s {row['workers']:>7} {row['rss_kb'] / 1024:>7.1f}MB "
+                      f"{row['connections']:>5} {row['cart_item']:>9} {row['order']:>7} {row['rps']:>7} "
+                      f"{row['p50_ms']:>6.1f}ms {row['p99_ms']:>6.1f}ms {row['error_rate']:>7.2%}",
+                      flush=True)
+                if output:
+                    if writer is None:
+                        writer = csv.DictWriter(output, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                    output.flush()
+        except KeyboardInterrupt:
+            print('interrupted, reporting what was sampled')
+        finally:
+            stop.set()
+            for thread in clients:
+                thread.join(timeout=35)
+            if output:
+                output.close()
+
+    flagged = report(samples, args.warmup, tolerances)
+    probe.engine.dispose()
+    if flagged:
+        print(f"\ndrift beyond tolerance: {', '.join(flagged)}")
+        sys.exit(1)
+    print('\nno drift beyond tolerance')
+
+
+if __name__ == '__main__':
+    main()
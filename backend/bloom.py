@@ -0,0 +1,59 @@
+"""
+Bloom filter for cheap negative membership checks.
+
+A Bloom filter answers "definitely not present" or "possibly present".
+Sized for ``capacity`` items at ``error_rate``, it uses about
+1.44 * log2(1 / error_rate) bits per item, so a million codes at 0.1%
+fit in under 2 MB. Items can be added but never removed; rebuild the
+filter to drop them.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _hashes(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item):
+        h1, h2 = self._hashes(item)
+        bits, num_bits = self._bits, self.num_bits
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % num_bits
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        h1, h2 = self._hashes(item)
+        bits, num_bits = self._bits, self.num_bits
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % num_bits
+            if not bits[position >> 3] & (1 << (position & 7)):
+                # Most absent items stop at the first or second probe
+                return False
+        return True
+
+    @property
+    def size_bytes(self):
+        return len(self._bits)
+
+    @property
+    def saturated(self):
+        """True once more items were added than the filter was sized for"""
+        return self.count > self.capacity
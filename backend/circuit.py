@@ -0,0 +1,113 @@
+"""
+Circuit breaker for calls to a dependency that can go away.
+
+After `failure_threshold` consecutive failures the breaker opens. While
+it is open, calls fail at once with CircuitOpenError instead of waiting
+on a dead host. After `reset_timeout` seconds it lets a single probe
+through (half-open): if the probe succeeds the breaker closes, and if it
+fails the breaker opens for another `reset_timeout`. Each worker process
+keeps its own breaker, so each one notices an outage on its own.
+"""
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency the breaker has given up on"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'{name} circuit is open; retrying in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker; failure_threshold=0 never opens"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._counts = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def check(self):
+        """Raise CircuitOpenError while open; a half-open breaker passes"""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return
+            self._counts['rejected'] += 1
+            retry_after = self.reset_timeout - (self.clock() - self._opened_at)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now.
+
+        When half-open, the first caller becomes the probe and the rest
+        are turned away until it reports back.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._counts['rejected'] += 1
+            retry_after = 0.0 if state == HALF_OPEN else \
+                self.reset_timeout - (self.clock() - self._opened_at)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._counts['successes'] += 1
+            self._failures = 0
+            self._state = CLOSED
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._counts['failures'] += 1
+            self._failures += 1
+            probe_failed = self._state == HALF_OPEN
+            if probe_failed or (self.failure_threshold and self._failures >= self.failure_threshold):
+                if self._state != OPEN:
+                    self._counts['opened'] += 1
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._failures,
+                **self._counts,
+            }
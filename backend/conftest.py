@@ -0,0 +1,209 @@
+"""
+Shared pytest fixtures for the backend suite.
+
+Modules that talk to the database use ``transactional_client``: the
+schema is created and seeded once per module, and each test runs inside
+an outer transaction on a single connection that is rolled back
+afterwards. The app's own commits only release savepoints, so every test
+starts from the seed data without any DDL.
+
+A module provides its seed data and wraps the fixture:
+
+    @pytest.fixture(scope='module')
+    def seed():
+        return seed_database    # adds rows to db.session; no commit needed
+
+    @pytest.fixture
+    def client(transactional_client):
+        return transactional_client
+
+Tests that read through a second connection cannot see that outer
+transaction. They use ``committed_client``, whose commits are real and
+whose tables are emptied and re-seeded after each test.
+
+TEST_DB_ISOLATION=recreate switches back to drop_all/create_all per test,
+to check that a failure is not caused by the rollback itself.
+
+Without DATABASE_URL the suite runs against a scratch SQLite file, never
+the dev database. Under pytest-xdist every worker gets its own database
+cloned from a template (see testdb.py), so ``pytest -n auto`` is safe.
+There the seed data is also cloned: each seed function runs once per
+run, and every module using it starts from a copy of the seeded
+database.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+import testdb
+
+WORKER = os.getenv('PYTEST_XDIST_WORKER')
+SCRATCH_DIR = None
+# Before app.py is imported: it binds its engine at import time
+if WORKER and os.getenv(testdb.TEMPLATE_ENV):
+    os.environ['DATABASE_URL'] = testdb.clone_for_worker(os.environ[testdb.TEMPLATE_ENV], WORKER)
+elif not os.getenv('DATABASE_URL'):
+    # Otherwise app.py would fall back to the dev database in instance/.
+    # A file rather than :memory:, so the async engines see the same data
+    SCRATCH_DIR = tempfile.mkdtemp(prefix='pytest-db-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'test.db')}"
+
+from app import app, db, discount_codes, dispose_engines, order_cache  # noqa: E402
+
+ISOLATION = os.getenv('TEST_DB_ISOLATION', 'rollback')
+
+
+def pytest_configure(config):
+    # In the xdist controller, before any worker starts; workers inherit the env
+    if getattr(config.option, 'numprocesses', None) and not hasattr(config, 'workerinput'):
+        os.environ[testdb.TEMPLATE_ENV] = testdb.build_template(db.metadata, os.getenv('DATABASE_URL'))
+
+
+def pytest_unconfigure(config):
+    if SCRATCH_DIR:
+        dispose_engines()
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    template = os.environ.get(testdb.TEMPLATE_ENV)
+    if not template:
+        return
+    if hasattr(config, 'workerinput'):
+        dispose_engines()
+        testdb.discard(os.environ['DATABASE_URL'])
+    else:
+        testdb.discard(template)
+        del os.environ[testdb.TEMPLATE_ENV]
+
+
+def _configure():
+    app.config['TESTING'] = True
+    app.config['MAIL_SUPPRESS_SEND'] = True
+    app.config['RATELIMIT_ENABLED'] = False
+
+
+def _rebuild(seed):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        db.session.commit()
+
+
+def _restore_seeded(seed):
+    # Copy in the template seeded by `seed`, seeding it the first time
+    template = os.environ[testdb.TEMPLATE_ENV]
+    seeded = testdb.seeded_url(template, f'{seed.__module__}.{seed.__qualname__}')
+    dispose_engines()
+    with testdb.locked(seeded):
+        if testdb.exists(seeded):
+            testdb.copy(seeded, os.environ['DATABASE_URL'])
+        else:
+            testdb.copy(template, os.environ['DATABASE_URL'])
+            with app.app_context():
+                seed()
+                db.session.commit()
+            dispose_engines()
+            testdb.copy(os.environ['DATABASE_URL'], seeded)
+    # No DDL ran, so nothing told the caches their tables were replaced
+    discount_codes.invalidate_all()
+    order_cache.invalidate_all()
+
+
+@pytest.fixture(scope='module')
+def seed():
+    """Seed data for transactional_client; modules override this"""
+    return lambda: None
+
+
+@pytest.fixture(scope='module')
+def seeded_schema(seed):
+    """Schema and seed data shared by every test in the module"""
+    _configure()
+    if WORKER and os.getenv(testdb.TEMPLATE_ENV) and ISOLATION != 'recreate':
+        _restore_seeded(seed)
+    else:
+        _rebuild(seed)
+    yield
+    with app.app_context():
+        db.drop_all()
+
+
+def _reseed(seed):
+    # Empty every table and seed again; cheaper than DDL
+    with app.app_context():
+        tables = db.metadata.sorted_tables
+        if db.engine.dialect.name == 'postgresql':
+            names = ', '.join(f'"{table.name}"' for table in tables)
+            db.session.execute(db.text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+        else:
+            for table in reversed(tables):
+                db.session.execute(table.delete())
+        seed()
+        db.session.commit()
+    discount_codes.invalidate_all()
+    order_cache.invalidate_all()
+
+
+@pytest.fixture
+def transactional_client(seeded_schema, seed):
+    """Test client whose database changes are rolled back after each test"""
+    with rolled_back_client(seed) as client:
+        yield client
+
+
+@contextmanager
+def rolled_back_client(seed):
+    """Test client whose database changes are rolled back on exit.
+
+    Needs ``seeded_schema``. A test can use it directly to check what
+    survives a rollback.
+    """
+    _configure()
+    if ISOLATION == 'recreate':
+        _rebuild(seed)
+        with app.test_client() as client:
+            yield client
+        return
+
+    with app.app_context():
+        connection = db.engine.connect()
+    driver_connection = connection.connection.driver_connection
+    isolation_level = None
+    if connection.dialect.name == 'sqlite':
+        # pysqlite never emits BEGIN before a SAVEPOINT; issue it ourselves
+        isolation_level = driver_connection.isolation_level
+        driver_connection.isolation_level = None
+        driver_connection.execute('BEGIN')
+    outer = connection.begin()
+
+    factory = db.session.session_factory
+    saved_options = dict(factory.kw)
+    factory.configure(bind=connection, join_transaction_mode='create_savepoint')
+    try:
+        with app.test_client() as client:
+            yield client
+    finally:
+        factory.kw.clear()
+        factory.kw.update(saved_options)
+        outer.rollback()
+        if connection.dialect.name == 'sqlite':
+            driver_connection.isolation_level = isolation_level
+        connection.close()
+        # Process-wide caches may hold rows that were just rolled back
+        discount_codes.invalidate_all()
+        order_cache.invalidate_all()
+
+
+@pytest.fixture
+def committed_client(seeded_schema, seed):
+    """Test client whose changes are committed, then wiped and re-seeded.
+
+    For tests that read through a second connection (the ASGI app's async
+    engine), which never sees a transaction that is rolled back.
+    """
+    _configure()
+    with app.test_client() as client:
+        yield client
+    _reseed(seed)
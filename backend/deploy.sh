@@ -94,7 +94,7 @@ deploy_render() {
     echo -e "  1. Connect your GitHub repository to Render"
     echo -e "  2. Create a new Web Service"
     echo -e "  3. Set build command: docker build -t backend ."
-    echo -e "  4. Set start command: gunicorn --bind 0.0.0.0:\$PORT --workers 4 app:app"
+    echo -e "  4. Set start command: gunicorn --config gunicorn.conf.py 'app:create_app()'"
     echo -e "  5. Set environment variables"
     echo ""
     echo -e "${GREEN}Or use Render CLI:${NC}"
@@ -113,7 +113,7 @@ deploy_heroku() {
     
     # Create Procfile if it doesn't exist
     if [ ! -f "Procfile" ]; then
-        echo "web: gunicorn --bind 0.0.0.0:\$PORT --workers 4 app:app" > Procfile
+        echo "web: gunicorn --config gunicorn.conf.py 'app:create_app()'" > Procfile
     fi
     
     # Login and deploy
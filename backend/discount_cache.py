@@ -0,0 +1,257 @@
+"""
+In-process cache of discount codes.
+
+Codes are looked up on every discount application and checkout but change
+rarely. Entries are keyed by the normalized (uppercased) code and hold
+just what the routes need. A cached valid code is dropped at the moment
+its expiry_date passes, so the next lookup sees it as expired. Unknown
+codes are cached negatively for a short TTL, so guessing random codes
+does not cost a database query per attempt.
+
+A DiscountCodeFilter in front of the cache holds a Bloom filter of every
+code in the table. Codes it has definitely never seen are rejected
+without touching the cache or the database, which is what brute-force
+enumeration of random codes mostly produces. Codes added by another
+worker, or straight into the table, reach the filter on its periodic
+refresh; a miss on a filter older than that first reads any new rows,
+so a late or missing refresh never turns a real code away.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import timezone
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from bloom import BloomFilter
+
+
+class DiscountEntry(namedtuple('DiscountEntry', 'code discount_percent is_active expires_at')):
+    """Snapshot of one DiscountCode row; expires_at is a UTC epoch or None"""
+
+    def is_expired(self, now=None):
+        now = time.time() if now is None else now
+        return self.expires_at is not None and self.expires_at < now
+
+    def is_usable(self, now=None):
+        return self.is_active and not self.is_expired(now)
+
+    @classmethod
+    def from_row(cls, row):
+        expires_at = None
+        if row.expiry_date is not None:
+            expiry = row.expiry_date
+            if expiry.tzinfo is None:
+                # Stored naive datetimes are UTC
+                expiry = expiry.replace(tzinfo=timezone.utc)
+            expires_at = expiry.timestamp()
+        return cls(row.code, row.discount_percent, bool(row.is_active), expires_at)
+
+
+def normalize_code(code):
+    return code.upper()
+
+
+class DiscountCodeFilter:
+    """Bloom filter of known codes, extended incrementally as rows appear.
+
+    ``fetch_since(last_id)`` returns (id, code) pairs for rows with a
+    greater id, so refresh() only reads codes added since the last call.
+    Deleted or renamed codes stay in the filter as harmless false
+    positives until the next full rebuild. Once the filter is `max_age`
+    seconds past its last refresh, a miss refreshes it before answering.
+    """
+
+    def __init__(self, fetch_since, error_rate=0.001, min_capacity=10000, max_age=None,
+                 clock=time.monotonic):
+        self.fetch_since = fetch_since
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.max_age = max_age
+        self.clock = clock
+        self._filter = None
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self._passed = 0
+        self._rebuilds = 0
+        self._stale_refreshes = 0
+
+    def rebuild(self):
+        rows = self.fetch_since(0)
+        # Leave headroom so incremental adds do not force a rebuild soon
+        bloom = BloomFilter(max(self.min_capacity, 2 * len(rows)), self.error_rate)
+        for _, code in rows:
+            bloom.add(normalize_code(code))
+        with self._lock:
+            self._filter = bloom
+            self._last_id = max((row_id for row_id, _ in rows), default=0)
+            self._refreshed_at = self.clock()
+            self._rebuilds += 1
+        return {'codes': len(rows)}
+
+    def refresh(self):
+        """Add codes inserted since the last refresh (e.g. by other workers)"""
+        if self._filter is None:
+            return self.rebuild()
+        rows = self.fetch_since(self._last_id)
+        with self._lock:
+            for row_id, code in rows:
+                self._filter.add(normalize_code(code))
+                self._last_id = max(self._last_id, row_id)
+            self._refreshed_at = self.clock()
+            saturated = self._filter.saturated
+        if saturated:
+            return self.rebuild()
+        return {'codes': len(rows)}
+
+    def add(self, code):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(normalize_code(code))
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+
+    def is_stale(self):
+        return bool(self.max_age) and self.clock() - self._refreshed_at >= self.max_age
+
+    def might_exist(self, code):
+        if self._filter is None:
+            self.rebuild()
+        key = normalize_code(code)
+        present = key in self._filter
+        if not present and self.is_stale():
+            # The code may have been added since; one cheap query per
+            # max_age, however many misses arrive
+            self.refresh()
+            self._stale_refreshes += 1
+            present = key in self._filter
+        if present:
+            self._passed += 1
+        else:
+            self._rejected += 1
+        return present
+
+    def metrics(self):
+        bloom = self._filter
+        return {
+            'codes': bloom.count if bloom else 0,
+            'size_bytes': bloom.size_bytes if bloom else 0,
+            'rejected': self._rejected,
+            'passed': self._passed,
+            'rebuilds': self._rebuilds,
+            'stale_refreshes': self._stale_refreshes,
+        }
+
+
+class DiscountCodeCache:
+    """Read-through cache over a loader returning DiscountEntry or None"""
+
+    def __init__(self, loader, ttl=300, negative_ttl=30, max_entries=10000, prefilter=None):
+        self.loader = loader
+        self.prefilter = prefilter
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+
+    def get(self, code, now=None):
+        """Return the DiscountEntry for a code, or None if no such code exists"""
+        key = normalize_code(code)
+        if self.prefilter is not None and not self.prefilter.might_exist(key):
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                entry, valid_until = cached
+                if now < valid_until:
+                    if entry is None:
+                        self._negative_hits += 1
+                    else:
+                        self._hits += 1
+                    return entry
+                del self._entries[key]
+            self._misses += 1
+
+        entry = self.loader(key)
+        if entry is None:
+            valid_until = now + self.negative_ttl
+        else:
+            valid_until = now + self.ttl
+            if entry.expires_at is not None and entry.expires_at > now:
+                # Evict exactly when a still-valid code expires
+                valid_until = min(valid_until, entry.expires_at)
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Oldest insertion first; bounds memory under brute force
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (entry, valid_until)
+        return entry
+
+    def invalidate(self, code):
+        with self._lock:
+            self._entries.pop(normalize_code(code), None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+        if self.prefilter is not None:
+            self.prefilter.reset()
+
+    def metrics(self):
+        with self._lock:
+            metrics = {
+                'size': len(self._entries),
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'misses': self._misses,
+            }
+        if self.prefilter is not None:
+            metrics['filter'] = self.prefilter.metrics()
+        return metrics
+
+
+def invalidate_on_change(cache, session_cls, model):
+    """Invalidate cached codes when rows of `model` are committed.
+
+    Changed codes (old and new values) are collected at flush and
+    dropped from the cache after the transaction commits. Bulk
+    query.update()/delete() bypass these events; call invalidate_all()
+    after those.
+    """
+    def collect(mapper, connection, target):
+        session = object_session(target)
+        if session is None:
+            return
+        changed = session.info.setdefault('changed_discount_codes', set())
+        changed.add(target.code)
+        history = inspect(target).attrs.code.history
+        changed.update(code for code in history.deleted or () if code)
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, collect)
+
+    @event.listens_for(session_cls, 'after_commit')
+    def flush_invalidations(session):
+        for code in session.info.pop('changed_discount_codes', ()):
+            cache.invalidate(code)
+            if cache.prefilter is not None:
+                cache.prefilter.add(code)
+
+    @event.listens_for(session_cls, 'after_soft_rollback')
+    def discard_invalidations(session, previous_transaction):
+        session.info.pop('changed_discount_codes', None)
+
+    # Recreating the table (tests, fresh installs) leaves nothing valid
+    for name in ('after_create', 'after_drop'):
+        event.listen(model.__table__, name, lambda *args, **kwargs: cache.invalidate_all())
@@ -0,0 +1,96 @@
+"""
+A local SMTP server that misbehaves on request, for tests and benchmarks.
+
+It speaks just enough SMTP for smtplib to deliver a message, and can be
+switched at any time between:
+
+* ``ok`` - accept mail, after `latency` seconds
+* ``hang`` - accept the connection and never answer, like a host whose
+  SMTP service has wedged (clients wait for their timeout)
+* ``reject`` - answer ``421`` and hang up, like a server shedding load
+* ``reset`` - close the connection straight away
+
+    with FakeSMTPServer() as smtp:
+        app.config.update(MAIL_SERVER=smtp.host, MAIL_PORT=smtp.port)
+        smtp.mode = 'hang'
+"""
+import socketserver
+import threading
+import time
+
+MODES = ('ok', 'hang', 'reject', 'reset')
+
+
+class _Session(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        fake = self.server.fake
+        mode, latency = fake.mode, fake.latency
+        with fake.lock:
+            fake.connections += 1
+        if latency:
+            time.sleep(latency)
+        if mode == 'hang':
+            fake.stopped.wait()
+            return
+        if mode == 'reject':
+            self.wfile.write(b'421 fake.smtp service not available\r\n')
+            return
+        if mode == 'reset':
+            return
+        self.wfile.write(b'220 fake.smtp ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.wfile.write(b'250-fake.smtp\r\n250 8BITMIME\r\n')
+            elif command == b'DATA':
+                self.wfile.write(b'354 end with .\r\n')
+                body = []
+                for data in iter(self.rfile.readline, b''):
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    body.append(data)
+                with fake.lock:
+                    fake.messages.append(b''.join(body))
+                self.wfile.write(b'250 queued\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.wfile.write(b'250 OK\r\n')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    block_on_close = False
+
+
+class FakeSMTPServer:
+    """Context manager running the fake server on a free local port"""
+
+    def __init__(self, mode='ok', latency=0.0):
+        if mode not in MODES:
+            raise ValueError(f'mode must be one of {MODES}')
+        self.mode = mode
+        self.latency = latency
+        self.connections = 0
+        self.messages = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self._server = _Server(('127.0.0.1', 0), _Session)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), name='fake-smtp',
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,63 @@
+"""
+Gunicorn configuration.
+
+Gunicorn loads this file automatically from the working directory. The
+worker mode is selected with GUNICORN_WORKER_MODE:
+
+* ``sync``   - one request per process (default, previous behaviour)
+* ``gthread`` - GUNICORN_THREADS requests per process on OS threads
+* ``gevent`` - GUNICORN_WORKER_CONNECTIONS requests per process on greenlets
+  (requires ``gevent``; install ``psycogreen`` as well on Postgres)
+
+The per-process concurrency is exported as WORKER_CONCURRENCY so app.py
+can size its database connection pool to match, up to DB_POOL_SIZE
+(default 10) connections per worker whatever the greenlet count.
+
+GUNICORN_PRELOAD=true imports the app once in the master (run it as
+``app:create_app()``) and forks workers that share its memory
+copy-on-write; app.py resets the connection pools in each child. Leave
+it off with gevent, which must patch the standard library before the
+app is imported.
+"""
+import os
+import sys
+
+_MODES = ('sync', 'gthread', 'gevent')
+
+worker_mode = os.getenv('GUNICORN_WORKER_MODE', 'sync').lower()
+if worker_mode not in _MODES:
+    sys.exit(f'Unknown GUNICORN_WORKER_MODE {worker_mode!r}; expected one of {list(_MODES)}')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+worker_class = worker_mode
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+if worker_mode == 'gthread':
+    threads = int(os.getenv('GUNICORN_THREADS', 8))
+    concurrency = threads
+elif worker_mode == 'gevent':
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+    concurrency = worker_connections
+else:
+    concurrency = 1
+
+os.environ.setdefault('WORKER_CONCURRENCY', str(concurrency))
+
+
+def post_worker_init(worker):
+    # Let admission control shed on the accept queue all workers share
+    admission = getattr(worker.wsgi, 'extensions', {}).get('admission')
+    if admission is not None:
+        admission.watch([listener.sock for listener in worker.sockets])
+    if worker_mode != 'gevent':
+        return
+    # psycopg2 waits on the socket in C; without this every query blocks the hub
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        worker.log.warning('psycogreen not installed; Postgres queries will block the gevent hub')
+        return
+    patch_psycopg()
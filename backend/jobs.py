@@ -0,0 +1,94 @@
+"""
+Periodic maintenance jobs run inside each worker process.
+
+Jobs run on one daemon thread per process, started on the first request
+after the worker forks (threads do not survive fork). Every job must be
+safe to run concurrently from several workers, which in practice means
+doing its work in small, self-contained transactions.
+"""
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJobs:
+    """Flask extension running registered jobs at fixed intervals"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.jobs = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_ENABLED', True)
+        self.app = app
+        app.before_request(self._ensure_started)
+        app.extensions['jobs'] = self
+
+    def register(self, name, interval, func):
+        """Run func() in an app context every `interval` seconds (0 disables)"""
+        self.jobs[name] = (interval, func)
+        self._stats[name] = {'runs': 0, 'errors': 0, 'last_run': None,
+                             'last_duration_ms': None, 'last_result': None}
+
+    def run(self, name):
+        """Run one job now in the current thread and record its result"""
+        _, func = self.jobs[name]
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                result = func()
+        except Exception:
+            with self._lock:
+                self._stats[name]['errors'] += 1
+            logger.exception('job failed', extra={'job': name})
+            return None
+        with self._lock:
+            stats = self._stats[name]
+            stats['runs'] += 1
+            stats['last_run'] = time.time()
+            stats['last_duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            stats['last_result'] = result
+        return result
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return None
+        config = current_app.config
+        with self._lock:
+            if self._pid == os.getpid():
+                return None
+            self._pid = os.getpid()
+            if not config['JOBS_ENABLED'] or current_app.testing:
+                return None
+            self._stop.clear()
+            thread = threading.Thread(target=self._loop, name='periodic-jobs', daemon=True)
+            thread.start()
+        return None
+
+    def _loop(self):
+        next_run = {name: time.monotonic() + interval
+                    for name, (interval, _) in self.jobs.items() if interval > 0}
+        while next_run and not self._stop.is_set():
+            name = min(next_run, key=next_run.get)
+            if self._stop.wait(max(0.0, next_run[name] - time.monotonic())):
+                return
+            self.run(name)
+            next_run[name] = time.monotonic() + self.jobs[name][0]
+
+    def stop(self):
+        self._stop.set()
+
+    def metrics(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
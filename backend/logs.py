@@ -0,0 +1,265 @@
+"""
+Structured JSON logging that never blocks a request.
+
+Records are put on a bounded in-memory queue by the thread that logs
+them, and a listener thread formats and writes them to stdout (or
+LOG_FILE). Slow stdout (a full pipe, a stalled log shipper) backs up
+into the queue, and once the queue holds LOG_QUEUE_SIZE records further
+records are dropped and counted rather than waited for. Tracebacks are
+rendered on the listener thread too, so a burst of failures costs the
+requests little more than a queue put.
+
+Every request gets a correlation id: the caller's ``X-Request-ID`` when
+it looks sane, otherwise a fresh one. It is echoed in the response and
+attached to every record logged while the request is handled. Each
+request is logged once on the ``access`` logger. Failures (status >= 400)
+and requests slower than LOG_SLOW_REQUEST_MS are always logged; other
+requests are sampled at LOG_SUCCESS_SAMPLE_RATE and carry the rate so
+counts can be scaled back up.
+
+Nothing is written until install() is called (create_app() does). It
+attaches the handler to the app's logger and the loggers named in
+LOG_LOGGERS; the root logger, and whatever a test runner or embedding
+program has set up on it, is left alone.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+access_logger = logging.getLogger('access')
+
+
+def current_request_id():
+    """The correlation id of the request being handled, if any"""
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with `extra` fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to sys.stdout as it is when the record is written.
+
+    Test runners replace sys.stdout after the app has been imported.
+    """
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting on a full queue.
+
+    The queue and its listener belong to one process: a forked worker
+    gets fresh ones on its first record, like the mailer's thread pool.
+    """
+
+    def __init__(self, target, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Locks inside an inherited queue may be held by a thread that
+            # did not survive the fork
+            self.queue = queue.Queue(self.maxsize)
+            self.listener = DropReportingListener(self, self.target)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Render the message now (its args may change later) but leave
+        # the traceback to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = getattr(record, 'request_id', None) or current_request_id()
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Flush what is queued and stop this process's listener"""
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+
+class DropReportingListener(logging.handlers.QueueListener):
+    """Writes queued records, and notes when some were dropped"""
+
+    def __init__(self, source, target):
+        super().__init__(source.queue, target, respect_handler_level=True)
+        self.source = source
+        self.reported = source.dropped
+
+    def stop(self, timeout=5):
+        # The queue may be full; wait for room, but not forever on a stuck writer
+        try:
+            self.queue.put(self._sentinel, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def handle(self, record):
+        super().handle(record)
+        dropped = self.source.dropped
+        if dropped != self.reported:
+            super().handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'log queue full, records dropped', 'dropped': dropped - self.reported,
+            }))
+            self.reported = dropped
+
+
+class StructuredLogging:
+    """Flask extension installing queued JSON logging and an access log"""
+
+    def __init__(self, app=None, stream=None):
+        self.app = None
+        self.stream = stream
+        self.handler = None
+        self.loggers = []
+        self.sample_rate = 1.0
+        self.slow_request = 1.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOG_LEVEL', 'INFO')
+        app.config.setdefault('LOG_FILE', None)
+        app.config.setdefault('LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('LOG_SUCCESS_SAMPLE_RATE', 1.0)
+        app.config.setdefault('LOG_SLOW_REQUEST_MS', 1000)
+        app.config.setdefault('LOG_LOGGERS', ['access', 'admission', 'jobs', 'mailer', 'slow_queries'])
+        self.app = app
+        self.sample_rate = app.config['LOG_SUCCESS_SAMPLE_RATE']
+        self.slow_request = app.config['LOG_SLOW_REQUEST_MS'] / 1000
+
+        if app.config['LOG_FILE']:
+            target = logging.FileHandler(app.config['LOG_FILE'])
+        elif self.stream is not None:
+            target = logging.StreamHandler(self.stream)
+        else:
+            target = StdoutHandler()
+        target.setFormatter(JsonFormatter())
+        self.handler = NonBlockingQueueHandler(target, app.config['LOG_QUEUE_SIZE'])
+
+        # First in: every other hook and log line sees the request id
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start)
+        app.after_request(self._finish)
+        app.extensions['structured_logging'] = self
+
+    def install(self):
+        """Send the app's loggers to the queue, at LOG_LEVEL"""
+        if self.loggers:
+            return
+        # Flask's stderr handler would print every app.logger line twice
+        self.app.logger.removeHandler(default_handler)
+        self.loggers = [self.app.logger] + [logging.getLogger(name) for name in self.app.config['LOG_LOGGERS']]
+        for logger in self.loggers:
+            logger.addHandler(self.handler)
+            logger.setLevel(self.app.config['LOG_LEVEL'])
+        atexit.register(self.handler.stop)
+
+    def shutdown(self):
+        """Detach from the loggers, flushing queued records first"""
+        for logger in self.loggers:
+            logger.removeHandler(self.handler)
+        self.loggers = []
+        atexit.unregister(self.handler.stop)
+        self.handler.stop()
+        self.handler.target.close()
+
+    def _start(self):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    def _finish(self, response):
+        # A request turned away before _start (e.g. by admission control)
+        if 'request_id' not in g:
+            self._start()
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        elapsed = time.perf_counter() - g.request_started
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+        }
+        if response.status_code >= 500:
+            access_logger.error('request', extra=fields)
+        elif response.status_code >= 400 or elapsed >= self.slow_request:
+            access_logger.warning('request', extra=fields)
+        elif self.sample_rate >= 1 or random.random() < self.sample_rate:
+            access_logger.info('request', extra=dict(fields, sample_rate=self.sample_rate))
+        return response
+
+    def metrics(self):
+        return {
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'success_sample_rate': self.sample_rate,
+        }
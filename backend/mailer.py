@@ -0,0 +1,134 @@
+"""
+Background delivery for Flask-Mail messages.
+
+SMTP round trips can take seconds, so messages are handed to a small
+thread pool instead of being sent on the request path. Under the gevent
+worker the threading module is monkey-patched, which turns the pool into
+greenlets and the SMTP socket I/O into cooperative waits.
+
+Flask-Mail is imported on the first send rather than at startup: most
+workers handle many requests between confirmations, and keeping it out
+of the import path makes every worker boot faster.
+
+Every SMTP socket operation gives up after MAIL_TIMEOUT seconds, and a
+circuit breaker stops trying after MAIL_BREAKER_FAILURES consecutive
+failed deliveries. While it is open, send() raises CircuitOpenError at
+once, so neither checkout nor the pool waits on a dead SMTP host. After
+MAIL_BREAKER_RESET seconds one delivery is let through as a probe.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit import CircuitBreaker, CircuitOpenError
+from logs import current_request_id
+
+logger = logging.getLogger(__name__)
+
+
+def timeout_mail(app, timeout):
+    """A Flask-Mail instance whose SMTP connections time out.
+
+    Flask-Mail 0.9 opens smtplib connections without a timeout, which
+    means waiting on the OS connect timeout (minutes) for a dead host.
+    """
+    import smtplib
+    from flask_mail import Connection, Mail
+
+    class TimeoutConnection(Connection):
+        def configure_host(self):
+            smtp = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+            host = smtp(self.mail.server, self.mail.port, timeout=timeout)
+            host.set_debuglevel(int(self.mail.debug))
+            if self.mail.use_tls:
+                host.starttls()
+            if self.mail.username and self.mail.password:
+                host.login(self.mail.username, self.mail.password)
+            return host
+
+    class TimeoutMail(Mail):
+        def connect(self):
+            return TimeoutConnection(self.app.extensions['mail'])
+
+    return TimeoutMail(app)
+
+
+class AsyncMailer:
+    """Flask extension sending mail off the request thread"""
+
+    def __init__(self, mail=None, app=None):
+        self.mail = mail
+        self.app = None
+        self.enabled = True
+        self.max_workers = 2
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker('smtp')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_ASYNC', True)
+        app.config.setdefault('MAIL_SEND_WORKERS', 2)
+        app.config.setdefault('MAIL_TIMEOUT', 10)
+        app.config.setdefault('MAIL_BREAKER_FAILURES', 5)
+        app.config.setdefault('MAIL_BREAKER_RESET', 30)
+        self.app = app
+        self.enabled = app.config['MAIL_ASYNC']
+        self.max_workers = app.config['MAIL_SEND_WORKERS']
+        self.breaker = CircuitBreaker('smtp', app.config['MAIL_BREAKER_FAILURES'],
+                                      app.config['MAIL_BREAKER_RESET'])
+        app.extensions['async_mailer'] = self
+
+    def get_mail(self):
+        """The Flask-Mail instance, created on first use"""
+        if self.mail is None:
+            with self._lock:
+                if self.mail is None:
+                    self.mail = timeout_mail(self.app, self.app.config['MAIL_TIMEOUT'])
+        return self.mail
+
+    def message(self, **kwargs):
+        # Message() reads the default sender from the app's Flask-Mail state
+        self.get_mail()
+        from flask_mail import Message
+        return Message(**kwargs)
+
+    def _get_executor(self):
+        # Pool threads do not survive fork; build one per worker process
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='mail'
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def send(self, message):
+        """Queue a message for delivery; sends inline when MAIL_ASYNC is off.
+
+        Raises CircuitOpenError without queueing while SMTP is failing.
+        """
+        self.breaker.check()
+        if not self.enabled:
+            self.breaker.call(self.get_mail().send, message)
+            return None
+        return self._get_executor().submit(self._deliver, message, current_request_id())
+
+    def _deliver(self, message, request_id=None):
+        with self.app.app_context():
+            try:
+                # Messages queued before the breaker opened are turned away here
+                self.breaker.call(self.get_mail().send, message)
+            except CircuitOpenError as e:
+                logger.warning('email not sent: %s', e, extra={'request_id': request_id})
+                raise
+            except Exception:
+                # Log error; the order is already committed
+                logger.warning('email sending failed', exc_info=True, extra={'request_id': request_id})
+                raise
+
+    def metrics(self):
+        return {'async': self.enabled, 'breaker': self.breaker.metrics()}
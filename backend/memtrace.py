@@ -0,0 +1,148 @@
+"""
+tracemalloc snapshots and diffs for long-running workers.
+
+Tracing is off until an operator starts it, because every allocation
+then pays for a traceback lookup. With MEMTRACE_ENABLED set, an admin
+can start tracing in the worker serving the request, take snapshots
+some hours apart and diff any two of them, grouped by line, by file or
+by full traceback. Each gunicorn worker traces and snapshots
+independently; responses carry the pid, and a request can insist on a
+worker with ``?pid=``.
+
+Overhead stays bounded while tracing: tracebacks are MEMTRACE_FRAMES
+deep (1 by default), at most MEMTRACE_MAX_SNAPSHOTS snapshots are kept,
+and tracing stops on its own after MEMTRACE_MAX_SECONDS.
+"""
+import os
+import threading
+import time
+import tracemalloc
+
+GROUPINGS = ('lineno', 'filename', 'traceback')
+
+# Allocations made by the tracing machinery itself are noise in every diff
+_NOISE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _stat_to_dict(stat):
+    frames = stat.traceback
+    return {
+        'location': f'{frames[0].filename}:{frames[0].lineno}',
+        'traceback': [f'{frame.filename}:{frame.lineno}' for frame in frames],
+        'size_kb': round(stat.size / 1024, 1),
+        'size_diff_kb': round(getattr(stat, 'size_diff', stat.size) / 1024, 1),
+        'count': stat.count,
+        'count_diff': getattr(stat, 'count_diff', stat.count),
+    }
+
+
+class MemoryTracer:
+    """Flask extension wrapping tracemalloc for the current worker"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.snapshots = {}
+        self._next_id = 1
+        self._started_at = None
+        self._timer = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MEMTRACE_ENABLED', False)
+        app.config.setdefault('MEMTRACE_FRAMES', 1)
+        app.config.setdefault('MEMTRACE_MAX_SNAPSHOTS', 5)
+        app.config.setdefault('MEMTRACE_MAX_SECONDS', 3600)
+        self.app = app
+        app.extensions['memtrace'] = self
+
+    @property
+    def enabled(self):
+        return self.app.config['MEMTRACE_ENABLED']
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=None):
+        """Start tracing (restarting with the new depth if already on)"""
+        frames = max(1, min(int(frames or self.app.config['MEMTRACE_FRAMES']), 25))
+        with self._lock:
+            self._stop_locked()
+            tracemalloc.start(frames)
+            self._started_at = time.time()
+            # Never left on by accident: stop after MEMTRACE_MAX_SECONDS
+            self._timer = threading.Timer(self.app.config['MEMTRACE_MAX_SECONDS'], self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            self._stop_locked()
+        return self.status()
+
+    def _stop_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.snapshots.clear()
+        self._started_at = None
+
+    def snapshot(self):
+        """Take a snapshot; returns its id, or None when not tracing"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            snapshot = tracemalloc.take_snapshot().filter_traces(_NOISE)
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self.snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self.snapshots) > self.app.config['MEMTRACE_MAX_SNAPSHOTS']:
+                del self.snapshots[min(self.snapshots)]
+        return snapshot_id
+
+    def top(self, snapshot_id, group_by='lineno', limit=20):
+        _, snapshot = self.snapshots[snapshot_id]
+        return [_stat_to_dict(stat) for stat in snapshot.statistics(group_by)[:limit]]
+
+    def diff(self, old_id, new_id, group_by='lineno', limit=20):
+        """Largest changes between two snapshots, biggest growth first"""
+        _, old = self.snapshots[old_id]
+        _, new = self.snapshots[new_id]
+        return [_stat_to_dict(stat) for stat in new.compare_to(old, group_by)[:limit]]
+
+    def status(self):
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            'pid': os.getpid(),
+            'enabled': self.enabled,
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+            'started_at': self._started_at,
+            'rss_kb': rss_kb(),
+            'traced_kb': round(traced / 1024, 1),
+            'traced_peak_kb': round(peak / 1024, 1),
+            'tracemalloc_overhead_kb': round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+            'snapshots': [{'id': snapshot_id, 'taken_at': taken_at}
+                          for snapshot_id, (taken_at, _) in sorted(self.snapshots.items())],
+        }
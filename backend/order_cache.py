@@ -0,0 +1,140 @@
+"""
+Read cache for single-order lookups.
+
+Confirmation pages and email links poll GET /api/orders/<order_number>,
+whose response only changes when the order's status does. Responses are
+cached per order number with a precomputed ETag. Clients holding the
+ETag revalidate with If-None-Match and get a 304 without loading or
+serializing the order.
+
+Each worker has its own cache, and a commit only evicts the entry in the
+worker that made it. So once an entry has gone `status_ttl` seconds
+without a check, the order's current status is read back (one indexed
+column) before the entry is served; on a mismatch the entry is dropped
+and the order reloaded. Between checks, polls cost no query at all, and
+another worker's status change shows up within `status_ttl`. Orders in a
+final status (``final_statuses``) no longer change and are never checked.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+
+class CachedOrder(namedtuple('CachedOrder', 'payload etag')):
+    """Serialized order plus its strong ETag (unquoted)"""
+
+
+def make_etag(payload):
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+class OrderReadCache:
+    """Per-process cache of order payloads keyed by order number"""
+
+    def __init__(self, ttl=300, max_entries=10000, final_statuses=(), status_ttl=5):
+        self.ttl = ttl
+        self.status_ttl = status_ttl
+        self.max_entries = max_entries
+        self.final_statuses = frozenset(final_statuses)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+    def get(self, order_number, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            cached = self._entries.get(order_number)
+            if cached is not None:
+                entry, valid_until, _ = cached
+                if now < valid_until:
+                    self._hits += 1
+                    return entry
+                del self._entries[order_number]
+            self._misses += 1
+        return None
+
+    def put(self, order_number, payload, now=None):
+        now = time.time() if now is None else now
+        entry = CachedOrder(payload, make_etag(payload))
+        if self.ttl <= 0:
+            return entry
+        with self._lock:
+            if len(self._entries) >= self.max_entries and order_number not in self._entries:
+                del self._entries[next(iter(self._entries))]
+            self._entries[order_number] = (entry, now + self.ttl, now)
+        return entry
+
+    def is_final(self, entry):
+        """True when the cached order can no longer change"""
+        return entry.payload.get('status') in self.final_statuses
+
+    def needs_check(self, order_number, entry, now=None):
+        """True when `entry`'s status is due to be compared with the database"""
+        if self.is_final(entry):
+            return False
+        now = time.time() if now is None else now
+        with self._lock:
+            cached = self._entries.get(order_number)
+            return cached is None or cached[0] is not entry or now - cached[2] >= self.status_ttl
+
+    def confirm(self, order_number, entry, status, now=None):
+        """Return `entry` if the order still has its cached status, else evict it.
+
+        `status` is the order's current status, or None if it is gone.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            cached = self._entries.get(order_number)
+            current = cached is not None and cached[0] is entry
+            if status is not None and status == entry.payload.get('status'):
+                if current:
+                    self._entries[order_number] = (entry, cached[1], now)
+                return entry
+            self._stale += 1
+            if current:
+                del self._entries[order_number]
+        return None
+
+    def invalidate(self, order_number):
+        with self._lock:
+            self._entries.pop(order_number, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self._hits, 'misses': self._misses,
+                    'stale': self._stale}
+
+
+def invalidate_orders_on_change(cache, session_cls, model):
+    """Evict cached orders once an update or delete of them is committed"""
+    def collect(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('changed_orders', set()).add(target.order_number)
+
+    for name in ('after_update', 'after_delete'):
+        event.listen(model, name, collect)
+
+    @event.listens_for(session_cls, 'after_commit')
+    def flush_invalidations(session):
+        for order_number in session.info.pop('changed_orders', ()):
+            cache.invalidate(order_number)
+
+    @event.listens_for(session_cls, 'after_soft_rollback')
+    def discard_invalidations(session, previous_transaction):
+        session.info.pop('changed_orders', None)
+
+    for name in ('after_create', 'after_drop'):
+        event.listen(model.__table__, name, lambda *args, **kwargs: cache.invalidate_all())
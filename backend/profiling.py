@@ -0,0 +1,220 @@
+"""
+On-demand profiling of individual requests.
+
+With PROFILE_ENABLED set, a request is profiled when it carries a valid
+``X-Profile`` header, or at random with probability PROFILE_SAMPLE_RATE.
+The header is ``<expires>:<signature>``, an HMAC-SHA256 of the expiry
+time under PROFILE_SECRET (mint one with ``flask profile-token``), so
+only operators can switch profiling on for a live worker.
+
+Each profiled request writes one file under PROFILE_DIR/<endpoint>/:
+
+* ``collapsed`` - stacks sampled every PROFILE_INTERVAL seconds from a
+  helper thread, one ``frame;frame;frame count`` line per stack, ready
+  for flamegraph.pl or speedscope
+* ``pstats`` - a cProfile dump with exact call counts
+
+The files of every worker on the host land in the same directory, so an
+endpoint's profiles can be merged into one view (aggregate_collapsed,
+aggregate_pstats). With PROFILE_ENABLED off no hooks are registered and
+requests pay nothing.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+FORMATS = ('collapsed', 'pstats')
+
+
+def sign_profile_token(secret, ttl=300, now=None):
+    """Header value that turns profiling on for the next `ttl` seconds"""
+    expires = int((now or time.time()) + ttl)
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f'{expires}:{signature}'
+
+
+def verify_profile_token(secret, token, now=None):
+    if not secret or not token or ':' not in token:
+        return False
+    expires, signature = token.split(':', 1)
+    if not expires.isdigit() or int(expires) < (now or time.time()):
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse_stack(frame)] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.items():
+                f.write(f'{stack} {count}\n')
+
+
+class CProfileRecorder:
+    """cProfile of the request thread, saved as a pstats dump"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+class RequestProfiler:
+    """Flask extension profiling selected requests to files"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._sequence = itertools.count()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_ENABLED', False)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+        app.config.setdefault('PROFILE_SECRET', None)
+        app.config.setdefault('PROFILE_FORMAT', 'collapsed')
+        app.config.setdefault('PROFILE_INTERVAL', 0.001)
+        app.config.setdefault('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'ecommerce-profiles'))
+        app.config.setdefault('PROFILE_MAX_FILES', 200)
+        if app.config['PROFILE_FORMAT'] not in FORMATS:
+            raise ValueError(f"PROFILE_FORMAT must be one of {FORMATS}")
+        self.app = app
+        app.extensions['profiler'] = self
+        if not app.config['PROFILE_ENABLED']:
+            return
+        # First in, last out: the profile covers the other extensions' hooks too
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start)
+        app.teardown_request_funcs.setdefault(None, []).insert(0, self._finish)
+        app.after_request(self._tag_response)
+
+    @property
+    def directory(self):
+        return self.app.config['PROFILE_DIR']
+
+    def _selected(self):
+        config = self.app.config
+        token = request.headers.get('X-Profile')
+        if token:
+            return verify_profile_token(config['PROFILE_SECRET'], token)
+        rate = config['PROFILE_SAMPLE_RATE']
+        return rate > 0 and random.random() < rate
+
+    def _start(self):
+        if not self._selected():
+            return
+        if self.app.config['PROFILE_FORMAT'] == 'pstats':
+            recorder = CProfileRecorder()
+        else:
+            recorder = StackSampler(threading.get_ident(), self.app.config['PROFILE_INTERVAL'])
+        g.profile_name = f'{int(time.time() * 1000)}-{os.getpid()}-{next(self._sequence)}'
+        g.profile_recorder = recorder
+        recorder.start()
+
+    def _tag_response(self, response):
+        if 'profile_name' in g:
+            response.headers['X-Profile-Id'] = f"{request.endpoint or 'unmatched'}/{g.profile_name}"
+        return response
+
+    def _finish(self, exc):
+        recorder = g.pop('profile_recorder', None)
+        if recorder is None:
+            return
+        recorder.stop()
+        directory = os.path.join(self.directory, request.endpoint or 'unmatched')
+        os.makedirs(directory, exist_ok=True)
+        recorder.write(os.path.join(directory, f"{g.profile_name}.{self.app.config['PROFILE_FORMAT']}"))
+        self._prune(directory)
+
+    def _prune(self, directory):
+        files = sorted(os.listdir(directory))
+        for name in files[:max(0, len(files) - self.app.config['PROFILE_MAX_FILES'])]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass  # another worker pruned it first
+
+    def _files(self, endpoint, fmt):
+        directory = os.path.join(self.directory, endpoint)
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.endswith('.' + fmt)]
+
+    def summary(self):
+        """Number of stored profiles per endpoint and format"""
+        if not os.path.isdir(self.directory):
+            return {}
+        return {
+            endpoint: {fmt: len(self._files(endpoint, fmt)) for fmt in FORMATS}
+            for endpoint in sorted(os.listdir(self.directory))
+        }
+
+    def aggregate_collapsed(self, endpoint):
+        """Summed stack counts of every collapsed profile for the endpoint"""
+        counts = Counter()
+        for path in self._files(endpoint, 'collapsed'):
+            with open(path) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        counts[stack] += int(count)
+        return counts
+
+    def aggregate_pstats(self, endpoint, limit=40, sort='cumulative'):
+        """Merged cProfile report for the endpoint as text"""
+        files = self._files(endpoint, 'pstats')
+        if not files:
+            return ''
+        out = io.StringIO()
+        pstats.Stats(*files, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,281 @@
+"""
+Token-bucket rate limiting shared across gunicorn workers.
+
+Buckets are keyed by route and client (IP address and, when the request
+carries one, its session_id). Bucket state lives in a storage backend:
+
+* ``memory://`` keeps buckets in a per-process dict (tests, single worker).
+* ``shm:///dev/shm/<name>`` keeps buckets in a fixed-size memory-mapped
+  slot table guarded by ``flock``, so every worker on the host sees the
+  same counters without a network round trip.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock
+    fcntl = None
+
+RATE_LIMIT_ERROR = {'error': 'Rate limit exceeded: too many requests'}
+
+_PERIODS = {
+    'second': 1, 'seconds': 1,
+    'minute': 60, 'minutes': 60,
+    'hour': 3600, 'hours': 3600,
+    'day': 86400, 'days': 86400,
+}
+
+
+def parse_rate(rate):
+    """Parse '10/minute' into (capacity, tokens refilled per second)"""
+    amount, _, period = rate.partition('/')
+    period = period.strip().lower()
+    if period not in _PERIODS:
+        raise ValueError(f'Invalid rate limit: {rate!r}')
+    capacity = int(amount)
+    if capacity <= 0:
+        raise ValueError(f'Invalid rate limit: {rate!r}')
+    return capacity, capacity / _PERIODS[period]
+
+
+def _refill(tokens, last, capacity, refill_rate, now):
+    if last <= 0:
+        return float(capacity)
+    return min(float(capacity), tokens + (now - last) * refill_rate)
+
+
+class MemoryStorage:
+    """Per-process bucket storage"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now, cost=1):
+        with self._lock:
+            tokens, last = self._buckets.get(key, (0.0, 0.0))
+            tokens = _refill(tokens, last, capacity, refill_rate, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if len(self._buckets) >= self.max_entries and key not in self._buckets:
+                self._evict()
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def _evict(self):
+        # Drop the least recently touched half; those buckets are likely full again
+        by_age = sorted(self._buckets.items(), key=lambda item: item[1][1])
+        for key, _ in by_age[:len(by_age) // 2 or 1]:
+            del self._buckets[key]
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedMemoryStorage:
+    """Bucket storage in a memory-mapped file shared by all local workers.
+
+    The file is a fixed open-addressing table of (key hash, tokens, last)
+    slots. Lookups probe a handful of slots and, when all are taken,
+    reuse the least recently touched one, so memory never grows.
+    """
+
+    _SLOT = struct.Struct('<Qdd')
+    _PROBES = 8
+
+    def __init__(self, path, slots=65536):
+        if fcntl is None:
+            raise RuntimeError('shm:// rate limit storage requires fcntl')
+        self.path = path
+        self.slots = slots
+        self.size = slots * self._SLOT.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # Map lazily and per process so a forked worker never inherits the
+        # parent's descriptor (flock is per open file description)
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = pid
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def _find_slot(self, key_hash):
+        base = key_hash % self.slots
+        victim, victim_last = base, math.inf
+        for probe in range(self._PROBES):
+            index = (base + probe) % self.slots
+            stored_hash, tokens, last = self._SLOT.unpack_from(self._map, index * self._SLOT.size)
+            if stored_hash == key_hash:
+                return index, tokens, last
+            if stored_hash == 0:
+                return index, 0.0, 0.0
+            if last < victim_last:
+                victim, victim_last = index, last
+        return victim, 0.0, 0.0
+
+    def consume(self, key, capacity, refill_rate, now, cost=1):
+        key_hash = self._hash(key)
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                index, tokens, last = self._find_slot(key_hash)
+                tokens = _refill(tokens, last, capacity, refill_rate, now)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self._SLOT.pack_into(self._map, index * self._SLOT.size, key_hash, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return allowed, tokens
+
+    def reset(self):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._map[:] = bytes(self.size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def storage_from_uri(uri):
+    """Build a storage backend from a RATELIMIT_STORAGE_URI value"""
+    if uri.startswith('memory://'):
+        return MemoryStorage()
+    if uri.startswith('shm://'):
+        return SharedMemoryStorage(uri[len('shm://'):])
+    raise ValueError(f'Unsupported rate limit storage: {uri!r}')
+
+
+class RateLimiter:
+    """Flask extension enforcing per-route token buckets"""
+
+    def __init__(self, app=None):
+        self.storage = None
+        self.default_limit = None
+        self.route_limits = {}
+        self.exempt = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+        app.config.setdefault('RATELIMIT_DEFAULT', '100/minute')
+        app.config.setdefault('RATELIMIT_ROUTES', {})
+        app.config.setdefault('RATELIMIT_EXEMPT', ['/api/health'])
+        app.config.setdefault('RATELIMIT_TRUST_PROXY', False)
+
+        self.storage = storage_from_uri(app.config['RATELIMIT_STORAGE_URI'])
+        self.default_limit = parse_rate(app.config['RATELIMIT_DEFAULT'])
+        self.route_limits = {
+            rule: parse_rate(rate) for rule, rate in app.config['RATELIMIT_ROUTES'].items()
+        }
+        self.exempt = set(app.config['RATELIMIT_EXEMPT'])
+
+        app.before_request(self._check)
+        app.after_request(self._add_headers)
+        app.extensions['ratelimit'] = self
+
+    def _client_ip(self, app_config):
+        if app_config['RATELIMIT_TRUST_PROXY'] and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or 'unknown'
+
+    @staticmethod
+    def _session_id():
+        session_id = request.args.get('session_id')
+        if session_id is None and request.is_json:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                session_id = data.get('session_id')
+        return session_id if isinstance(session_id, str) and session_id else None
+
+    def hit(self, rule, keys, now=None):
+        """Charge one token from every bucket in keys.
+
+        Returns (allowed, limit, remaining, reset_after) for the tightest
+        bucket, where reset_after is seconds until it is full again.
+        """
+        capacity, refill_rate = self.route_limits.get(rule, self.default_limit)
+        now = time.time() if now is None else now
+        allowed, remaining = True, float(capacity)
+        for key in keys:
+            ok, tokens = self.storage.consume(f'{rule}|{key}', capacity, refill_rate, now)
+            allowed = allowed and ok
+            remaining = min(remaining, tokens)
+        reset_after = (capacity - remaining) / refill_rate
+        return allowed, capacity, remaining, reset_after
+
+    def check(self, rule, client_ip, session_id=None, now=None):
+        """Charge one request to its IP and session buckets.
+
+        Returns (allowed, headers) where headers holds the X-RateLimit-*
+        values and, when the request is rejected, Retry-After.
+        """
+        keys = [f'ip:{client_ip}']
+        if session_id:
+            keys.append(f'sid:{session_id}')
+        now = time.time() if now is None else now
+        allowed, limit, remaining, reset_after = self.hit(rule, keys, now)
+        headers = {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(int(remaining)),
+            'X-RateLimit-Reset': str(int(math.ceil(now + reset_after))),
+        }
+        if not allowed:
+            refill_rate = self.route_limits.get(rule, self.default_limit)[1]
+            headers['Retry-After'] = str(max(1, int(math.ceil((1 - remaining) / refill_rate))))
+        return allowed, headers
+
+    def _check(self):
+        config = current_app.config
+        if not config['RATELIMIT_ENABLED'] or request.method == 'OPTIONS':
+            return None
+        rule = request.url_rule.rule if request.url_rule is not None else '*'
+        if rule in self.exempt:
+            return None
+
+        allowed, headers = self.check(rule, self._client_ip(config), self._session_id())
+        g.rate_limit_headers = headers
+        if allowed:
+            return None
+        response = jsonify(RATE_LIMIT_ERROR)
+        response.status_code = 429
+        return response
+
+    @staticmethod
+    def _add_headers(response):
+        headers = g.get('rate_limit_headers')
+        if headers is not None:
+            response.headers.update(headers)
+        return response
@@ -0,0 +1,167 @@
+"""
+Read-replica routing with read-your-writes for sessions.
+
+DB_REPLICA_URLS lists replica databases. Requests to the endpoints in
+DB_REPLICA_ROUTES run their SELECTs on one replica, chosen round-robin
+per request. Everything else, and any flush or INSERT/UPDATE/DELETE,
+stays on the primary. Replica engines are created lazily in each
+process, so forked workers never share a connection pool.
+
+A session that has just written (a successful non-GET request carrying
+its session_id) is pinned to the primary for DB_PIN_SECONDS, so its next
+cart read never sees a replica that has not caught up. Pins are stored
+in the rate limiter's storage backends, using a token bucket of capacity
+one that refills over the pin window: an empty bucket means the session
+wrote recently. With ``shm://`` storage the pin is visible to every
+worker on the host.
+"""
+import itertools
+import os
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.sql.dml import UpdateBase
+
+from ratelimit import storage_from_uri
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and has_app_context():
+            router = current_app.extensions.get('replicas')
+            if router is not None:
+                engine = router.read_engine()
+                if engine is not None:
+                    return engine
+        if bind is None and self.bind is not None:
+            # Bound to one connection (test fixtures): the primary is that connection
+            return self.bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Flask extension deciding per request whether reads may use a replica"""
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.pins = None
+        self._engines = None
+        self._engines_key = None
+        self._cycle = None
+        self._lock = threading.Lock()
+        self._counts = {'replica': 0, 'pinned': 0, 'fallback': 0, 'pins': 0}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('DB_REPLICA_URLS', [])
+        app.config.setdefault('DB_REPLICA_ROUTES', set())
+        app.config.setdefault('DB_PIN_SECONDS', 5)
+        app.config.setdefault('DB_PIN_STORAGE_URI', 'memory://')
+        self.db = db
+        self.app = app
+        self.pins = storage_from_uri(app.config['DB_PIN_STORAGE_URI'])
+        app.before_request(self._choose)
+        app.after_request(self._pin_writer)
+        app.extensions['replicas'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.app.config['DB_REPLICA_URLS'])
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def is_pinned(self, session_id, now=None):
+        refill = 1.0 / max(self.app.config['DB_PIN_SECONDS'], 0.001)
+        _, tokens = self.pins.consume(f'dbpin:{session_id}', 1, refill, now or time.time(), cost=0)
+        return tokens < 1
+
+    def pin(self, session_id, now=None):
+        """Route this session's reads to the primary for DB_PIN_SECONDS"""
+        now = now or time.time()
+        key = f'dbpin:{session_id}'
+        refill = 1.0 / max(self.app.config['DB_PIN_SECONDS'], 0.001)
+        _, tokens = self.pins.consume(key, 1, refill, now, cost=0)
+        self.pins.consume(key, 1, refill, now, cost=tokens)
+        self._count('pins')
+
+    def _choose(self):
+        if not self.enabled or request.method != 'GET':
+            return
+        if request.endpoint not in self.app.config['DB_REPLICA_ROUTES']:
+            return
+        session_id = request.args.get('session_id')
+        if session_id and self.is_pinned(session_id):
+            g.db_route = 'pinned'
+        else:
+            g.db_route = 'replica'
+        self._count(g.db_route)
+
+    def _pin_writer(self, response):
+        if self.enabled and request.method != 'GET' and response.status_code < 400:
+            data = request.get_json(silent=True)
+            session_id = data.get('session_id') if isinstance(data, dict) else None
+            if isinstance(session_id, str) and session_id:
+                self.pin(session_id)
+        return response
+
+    def read_engine(self):
+        """Engine for reads in the current request, or None for the primary"""
+        if g.get('db_route') != 'replica':
+            return None
+        engine = g.get('db_replica_engine')
+        if engine is None:
+            # One replica per request, so its reads see a single snapshot
+            engine = g.db_replica_engine = self._next_engine()
+        return engine
+
+    def _next_engine(self):
+        urls = tuple(self.app.config['DB_REPLICA_URLS'])
+        with self._lock:
+            if self._engines_key != (os.getpid(), urls):
+                options = self.app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+                self._engines = [create_engine(url, **options) for url in urls]
+                self._engines_key = (os.getpid(), urls)
+                self._cycle = itertools.cycle(self._engines)
+            return next(self._cycle)
+
+    def dispose(self, close=True):
+        with self._lock:
+            for engine in self._engines or ():
+                engine.dispose(close=close)
+            self._engines = self._engines_key = self._cycle = None
+
+    def reset_after_fork(self):
+        """Start a forked child with a new lock and no engines.
+
+        Another thread of the parent may have held the lock when the process
+        forked, and nothing in the child would ever release it, so the old
+        lock is replaced rather than acquired.
+        """
+        self._lock = threading.Lock()
+        for engine in self._engines or ():
+            engine.dispose(close=False)
+        self._engines = self._engines_key = self._cycle = None
+
+    def use_primary(self):
+        """Send the rest of this request's reads to the primary (e.g. after a
+        replica miss); returns True if reads had been going to a replica"""
+        if g.get('db_route') != 'replica':
+            return False
+        g.db_route = 'primary'
+        self._count('fallback')
+        # Drop the replica connection so later reads start on the primary
+        self.db.session.rollback()
+        return True
+
+    def metrics(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {'replicas': len(self.app.config['DB_REPLICA_URLS']), 'reads': counts}
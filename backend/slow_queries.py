@@ -0,0 +1,184 @@
+"""
+Opt-in slow-query log for the SQLAlchemy engines.
+
+With SLOW_QUERY_ENABLED set, every statement is timed around its DBAPI
+execute. Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with
+their normalized SQL, redacted parameters, duration and the endpoint
+that issued them. They are also aggregated per normalized statement, so
+the worst offenders by total time can be read back (GET
+/api/admin/slow-queries).
+
+The first time a normalized statement is slow, its plan is captured
+with EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on the same connection. On
+other databases this runs inside a savepoint, so a failing EXPLAIN cannot
+abort the request's transaction. When disabled, no listeners are
+registered and statements pay nothing.
+
+Stats are per process: each gunicorn worker reports what it has seen.
+"""
+import logging
+import re
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|(?<![:\w]):\w+|\?")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r'\s+')
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def normalize_sql(statement):
+    """One shape per query: literals and placeholders become ?, IN lists (...)"""
+    text = _WHITESPACE.sub(' ', statement).strip()
+    text = _LITERAL.sub('?', text)
+    text = _PLACEHOLDER.sub('?', text)
+    return _VALUE_LIST.sub('(...)', text)
+
+
+def _redact(value):
+    # Numbers are ids, quantities and prices; strings may be emails or addresses
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return f'<{type(value).__name__}>'
+
+
+def redact_parameters(parameters, executemany=False):
+    if executemany:
+        rows = list(parameters or ())
+        return {'rows': len(rows), 'first': redact_parameters(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: _redact(value) for key, value in parameters.items()}
+    return [_redact(value) for value in parameters or ()]
+
+
+class SlowQueryLog:
+    """Flask extension recording statements slower than a threshold"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.threshold = 0.1
+        self.max_statements = 500
+        self.explain = True
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_ENABLED', False)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 100)
+        app.config.setdefault('SLOW_QUERY_MAX_STATEMENTS', 500)
+        app.config.setdefault('SLOW_QUERY_EXPLAIN', True)
+        self.app = app
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.max_statements = app.config['SLOW_QUERY_MAX_STATEMENTS']
+        self.explain = app.config['SLOW_QUERY_EXPLAIN']
+        app.extensions['slow_queries'] = self
+        if app.config['SLOW_QUERY_ENABLED']:
+            self.enable()
+
+    def enable(self, target=Engine):
+        """Start timing statements on every engine (or just `target`)"""
+        if not self.enabled:
+            event.listen(target, 'before_cursor_execute', self._before)
+            event.listen(target, 'after_cursor_execute', self._after)
+            self._target = target
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            event.remove(self._target, 'before_cursor_execute', self._before)
+            event.remove(self._target, 'after_cursor_execute', self._after)
+            self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's own context, so a statement that raises
+        # leaves nothing behind on the connection
+        if context is not None:
+            context.slow_query_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'slow_query_started', None)
+        if started is None:  # enabled while this statement was running
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.threshold:
+            self.record(conn, statement, parameters, elapsed, executemany)
+
+    def record(self, conn, statement, parameters, elapsed, executemany=False):
+        normalized = normalize_sql(statement)
+        endpoint = (request.endpoint or request.path) if has_request_context() else None
+        params = redact_parameters(parameters, executemany)
+        duration_ms = elapsed * 1000
+        logger.warning('slow query %.1f ms endpoint=%s: %s params=%s',
+                       duration_ms, endpoint, normalized, params)
+
+        with self._lock:
+            stats = self._stats.get(normalized)
+            first = stats is None
+            if first:
+                if len(self._stats) >= self.max_statements:
+                    # Forget the statement that has cost the least so far
+                    cheapest = min(self._stats, key=lambda key: self._stats[key]['total_ms'])
+                    del self._stats[cheapest]
+                stats = self._stats[normalized] = {
+                    'statement': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'endpoints': {}, 'last_params': None, 'explain': None,
+                }
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['endpoints'][endpoint] = stats['endpoints'].get(endpoint, 0) + 1
+            stats['last_params'] = params
+        if first and self.explain:
+            plan = self._explain(conn, statement, parameters, executemany)
+            with self._lock:
+                stats['explain'] = plan
+
+    def _explain(self, conn, statement, parameters, executemany):
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        if executemany:
+            parameters = next(iter(parameters or ()), ())
+        sqlite = conn.dialect.name == 'sqlite'
+        # A raw DBAPI cursor keeps EXPLAIN out of these listeners
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            if not sqlite:
+                cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute(('EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN ') + statement, parameters)
+                rows = cursor.fetchall()
+            except Exception as e:
+                if not sqlite:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return [f'EXPLAIN failed: {e}']
+            if not sqlite:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        finally:
+            cursor.close()
+        # SQLite: (id, parent, notused, detail); PostgreSQL: one text column
+        return [row[-1] for row in rows]
+
+    def top(self, limit=20):
+        """The `limit` statements with the most total slow time"""
+        with self._lock:
+            entries = sorted(self._stats.values(), key=lambda stats: stats['total_ms'], reverse=True)
+            entries = [dict(stats, endpoints=dict(stats['endpoints'])) for stats in entries[:limit]]
+        for stats in entries:
+            stats['mean_ms'] = round(stats['total_ms'] / stats['count'], 2)
+            stats['total_ms'] = round(stats['total_ms'], 2)
+            stats['max_ms'] = round(stats['max_ms'], 2)
+        return entries
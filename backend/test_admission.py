@@ -0,0 +1,157 @@
+"""
+Test cases for admission control and load shedding
+"""
+import pytest
+import json
+import socket
+import time
+from flask import Flask, jsonify
+from admission import AdmissionController, accept_queue_depth, parse_request_start
+from app import app
+
+def _controlled_app(**config):
+    """Build a minimal app guarded by the admission controller"""
+    app = Flask(__name__)
+    app.config.update(
+        ADMISSION_MAX_INFLIGHT=4,
+        ADMISSION_PRIORITIES={'/api/products': 'low', '/api/checkout': 'critical'},
+        **config
+    )
+    controller = AdmissionController(app)
+
+    @app.route('/api/products')
+    def products():
+        return jsonify([])
+
+    @app.route('/api/checkout', methods=['POST'])
+    def checkout():
+        return jsonify({'status': 'confirmed'}), 201
+
+    return app, controller
+
+class TestQueueDelay:
+    """Test cases for X-Request-Start parsing"""
+
+    def test_parse_request_start_units(self):
+        """Test seconds, milliseconds and microseconds are all understood"""
+        now = 1700000010.0
+        assert parse_request_start('t=1700000009.5', now) == pytest.approx(0.5)
+        assert parse_request_start('1700000009500', now) == pytest.approx(0.5)
+        assert parse_request_start('t=1700000009500000', now) == pytest.approx(0.5)
+
+    def test_parse_request_start_invalid(self):
+        """Test missing, garbage and future timestamps"""
+        assert parse_request_start(None, time.time()) is None
+        assert parse_request_start('t=abc', time.time()) is None
+        assert parse_request_start(str(time.time() + 60), time.time()) == 0.0
+
+class TestLoadShedding:
+    """Test cases for priority-aware shedding"""
+
+    def test_low_priority_shed_on_queue_delay(self):
+        """Test catalog browsing is shed once it has queued past its budget"""
+        app, controller = _controlled_app()
+        client = app.test_client()
+        stale = f't={time.time() - 1.0:.3f}'
+        response = client.get('/api/products', headers={'X-Request-Start': stale})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert json.loads(response.data)['reason'] == 'queue_delay'
+
+        # Checkout has a larger budget and is still served
+        response = client.post('/api/checkout', json={}, headers={'X-Request-Start': stale})
+        assert response.status_code == 201
+        assert controller.metrics()['shed']['low'] == 1
+        assert controller.metrics()['admitted']['critical'] == 1
+
+    def test_low_priority_shed_before_critical_on_inflight(self):
+        """Test in-flight limits shed low priority first"""
+        _, controller = _controlled_app()
+        assert controller.inflight_limits == {'low': 2, 'normal': 3, 'critical': 4}
+        assert controller.decide('low', None) is None
+        assert controller.decide('low', None) is None
+        assert controller.decide('low', None) == 'inflight'
+        assert controller.decide('normal', None) is None
+        assert controller.decide('critical', None) is None
+        assert controller.decide('critical', None) == 'inflight'
+
+    def test_inflight_released_after_request(self):
+        """Test slots are returned when requests finish"""
+        app, controller = _controlled_app()
+        client = app.test_client()
+        for _ in range(10):
+            assert client.get('/api/products').status_code == 200
+        assert controller.metrics()['inflight'] == 0
+        assert controller.metrics()['admitted']['low'] == 10
+
+    def test_disabled_controller_admits_everything(self):
+        """Test ADMISSION_ENABLED=False turns shedding off"""
+        app, _ = _controlled_app(ADMISSION_ENABLED=False)
+        stale = f't={time.time() - 60:.3f}'
+        response = app.test_client().get('/api/products', headers={'X-Request-Start': stale})
+        assert response.status_code == 200
+
+    def test_metrics_endpoint_reports_admission(self):
+        """Test /api/metrics exposes the worker's admission decisions"""
+        response = app.test_client().get('/api/metrics')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert set(data['admission']) >= {'inflight', 'admitted', 'shed', 'queue_delay_ewma_ms'}
+
+@pytest.fixture
+def listener():
+    """A listening socket with three connections nobody has accepted"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(16)
+    clients = [socket.create_connection(server.getsockname()) for _ in range(3)]
+    yield server
+    for client in clients:
+        client.close()
+    server.close()
+
+@pytest.mark.skipif(not hasattr(socket, 'TCP_INFO'), reason='needs TCP_INFO')
+class TestListenBacklog:
+    """Test cases for shedding on the shared accept queue"""
+
+    def test_accept_queue_depth(self, listener):
+        """Test queued connections are counted until accepted"""
+        assert accept_queue_depth(listener) == 3
+        listener.accept()[0].close()
+        assert accept_queue_depth(listener) == 2
+
+    def test_unsupported_socket_ignored(self):
+        """Test sockets without an accept queue are not watched"""
+        _, controller = _controlled_app()
+        with socket.socket(socket.AF_UNIX) as unix:
+            controller.watch([unix])
+        assert controller.listeners == []
+        assert controller.backlog() is None
+
+    def test_low_priority_shed_on_backlog(self, listener):
+        """Test a sync worker sheds catalog reads while connections queue"""
+        app, controller = _controlled_app(ADMISSION_MAX_BACKLOG=4)
+        controller.watch([listener])
+        client = app.test_client()
+        response = client.get('/api/products')
+        assert response.status_code == 503
+        assert json.loads(response.data)['reason'] == 'backlog'
+        assert client.post('/api/checkout', json={}).status_code == 201
+        assert controller.metrics()['backlog'] == 3
+
+class TestQueueSignals:
+    """Test cases for running without any way to see queueing"""
+
+    def test_missing_request_start_warned_once_and_counted(self, caplog):
+        """Test requests without X-Request-Start are visible"""
+        app, controller = _controlled_app()
+        client = app.test_client()
+        with caplog.at_level('WARNING', logger='admission'):
+            for _ in range(3):
+                client.get('/api/products')
+            client.get('/api/products', headers={'X-Request-Start': f't={time.time():.3f}'})
+        assert len([r for r in caplog.records if r.name == 'admission']) == 1
+        assert controller.metrics()['without_request_start'] == 3
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,202 @@
+"""
+Test cases for the optional ASGI deployment
+Checks the async read routes return exactly what the Flask routes return
+"""
+import pytest
+import asyncio
+import json
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import app, db, admission, replicas, order_cache, Product, DiscountCode, Order
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+from asgi import APIApplication
+
+def call_asgi(asgi_app, method, path, body=None, headers=None):
+    """Run one HTTP request through an ASGI app; returns (status, headers, json)"""
+    path, _, query = path.partition('?')
+    payload = json.dumps(body).encode() if body is not None else b''
+    raw_headers = [(b'host', b'localhost')]
+    if body is not None:
+        raw_headers += [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(payload)).encode())]
+    raw_headers += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '', 'headers': raw_headers,
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start = sent[0]
+    response_headers = {k.decode(): v.decode() for k, v in start['headers']}
+    data = b''.join(m.get('body', b'') for m in sent[1:])
+    return start['status'], response_headers, json.loads(data) if data else None
+
+def seed_database():
+    """Rows every test starts from"""
+    db.session.add_all([
+        Product(name='Test Product 1', price=100.0, stock=10),
+        Product(name='Test Product 2', price=50.0, stock=5),
+    ])
+    db.session.add(DiscountCode(code='VALID10', discount_percent=10.0, is_active=True))
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def asgi_app(committed_client):
+    """Seeded database shared by the Flask and ASGI code paths.
+
+    The async engine has its own connection, so writes are committed and
+    wiped after each test rather than rolled back.
+    """
+    return APIApplication(app)
+
+class TestAsyncReadRoutes:
+    """Test cases for parity between async reads and the Flask routes"""
+
+    def test_products_match_flask(self, asgi_app):
+        """Test GET /api/products served on the event loop"""
+        status, _, data = call_asgi(asgi_app, 'GET', '/api/products')
+        assert status == 200
+        assert data == json.loads(app.test_client().get('/api/products').data)
+        assert [p['name'] for p in data] == ['Test Product 1', 'Test Product 2']
+
+    def test_cart_reflects_writes_through_flask(self, asgi_app):
+        """Test writes delegated to Flask are visible to async cart reads"""
+        status, _, _ = call_asgi(asgi_app, 'POST', '/api/cart/add', {
+            'session_id': 'asgi_session', 'product_id': 1, 'quantity': 2
+        })
+        assert status == 201
+        status, _, data = call_asgi(asgi_app, 'GET', '/api/cart?session_id=asgi_session')
+        assert status == 200
+        assert data['total'] == 200.0
+        assert data == json.loads(app.test_client().get('/api/cart?session_id=asgi_session').data)
+
+    def test_cart_requires_session_id(self, asgi_app):
+        """Test the async cart route keeps the Flask validation"""
+        status, _, data = call_asgi(asgi_app, 'GET', '/api/cart')
+        assert status == 400
+        assert data['error'] == 'session_id required'
+
+    def test_order_lookup(self, asgi_app):
+        """Test order lookup after a checkout handled by Flask"""
+        call_asgi(asgi_app, 'POST', '/api/cart/add', {'session_id': 'asgi_order', 'product_id': 2})
+        status, _, order = call_asgi(asgi_app, 'POST', '/api/checkout', {
+            'session_id': 'asgi_order', 'email': 'test@example.com', 'payment_method': 'paypal',
+            'shipping_address': '123 Test St'
+        })
+        assert status == 201
+        status, _, data = call_asgi(asgi_app, 'GET', f"/api/orders/{order['order_number']}")
+        assert status == 200
+        assert data['total_amount'] == 50.0
+        assert data == json.loads(app.test_client().get(f"/api/orders/{order['order_number']}").data)
+
+        status, _, data = call_asgi(asgi_app, 'GET', '/api/orders/ORD-MISSING')
+        assert status == 404
+
+    def test_order_revalidation(self, asgi_app):
+        """Test async order lookups send the ETag and honour If-None-Match"""
+        call_asgi(asgi_app, 'POST', '/api/cart/add', {'session_id': 'asgi_etag', 'product_id': 2})
+        _, _, order = call_asgi(asgi_app, 'POST', '/api/checkout', {
+            'session_id': 'asgi_etag', 'email': 'test@example.com', 'payment_method': 'paypal'
+        })
+        path = f"/api/orders/{order['order_number']}"
+        status, headers, _ = call_asgi(asgi_app, 'GET', path)
+        assert headers['etag'] == app.test_client().get(path).headers['ETag']
+        assert headers['cache-control'].startswith('private')
+        status, _, data = call_asgi(asgi_app, 'GET', path, headers={'If-None-Match': headers['etag']})
+        assert status == 304
+        assert data is None
+
+    def test_order_status_changed_elsewhere(self, asgi_app, monkeypatch):
+        """Test a cached order is checked against its current status"""
+        monkeypatch.setattr(order_cache, 'status_ttl', 0)
+        call_asgi(asgi_app, 'POST', '/api/cart/add', {'session_id': 'asgi_stale', 'product_id': 2})
+        _, _, order = call_asgi(asgi_app, 'POST', '/api/checkout', {
+            'session_id': 'asgi_stale', 'email': 'test@example.com', 'payment_method': 'paypal'
+        })
+        path = f"/api/orders/{order['order_number']}"
+        _, headers, _ = call_asgi(asgi_app, 'GET', path)
+        with app.app_context():
+            # Bulk UPDATE: no eviction here, as if another worker committed it
+            db.session.execute(db.update(Order).where(Order.order_number == order['order_number'])
+                               .values(status='shipped'))
+            db.session.commit()
+        status, _, data = call_asgi(asgi_app, 'GET', path, headers={'If-None-Match': headers['etag']})
+        assert status == 200
+        assert data['status'] == 'shipped'
+
+    def test_cors_and_rate_limit_headers(self, asgi_app):
+        """Test async routes send the same CORS and rate limit headers"""
+        app.config['RATELIMIT_ENABLED'] = True
+        try:
+            status, headers, _ = call_asgi(asgi_app, 'GET', '/api/products',
+                                           headers={'Origin': 'http://localhost:3000'})
+        finally:
+            app.config['RATELIMIT_ENABLED'] = False
+        assert status == 200
+        assert headers['access-control-allow-origin'] == 'http://localhost:3000'
+        assert 'x-ratelimit-remaining' in headers
+
+class TestSharedHooks:
+    """Test cases for the Flask request hooks around the async views"""
+
+    def test_request_id_echoed(self, asgi_app):
+        """Test async views get a request id like every Flask route"""
+        _, headers, _ = call_asgi(asgi_app, 'GET', '/api/products', headers={'X-Request-ID': 'edge-1'})
+        assert headers['x-request-id'] == 'edge-1'
+        _, headers, _ = call_asgi(asgi_app, 'GET', '/api/cart?session_id=s')
+        assert len(headers['x-request-id']) == 32
+
+    def test_admission_sheds_and_releases(self, asgi_app):
+        """Test async views are admitted, shed and released by the controller"""
+        before = admission.metrics()
+        stale = f't={time.time() - 60:.3f}'
+        status, headers, data = call_asgi(asgi_app, 'GET', '/api/products', headers={'X-Request-Start': stale})
+        assert status == 503
+        assert data['reason'] == 'queue_delay'
+        assert headers['retry-after'] == '1'
+        assert call_asgi(asgi_app, 'GET', '/api/products')[0] == 200
+        after = admission.metrics()
+        assert after['shed']['low'] == before['shed']['low'] + 1
+        assert after['admitted']['low'] == before['admitted']['low'] + 1
+        assert after['inflight'] == before['inflight']
+
+    def test_replica_routing_and_pinning(self, asgi_app, tmp_path):
+        """Test async reads go to a replica unless the session just wrote"""
+        replica_url = f'sqlite:///{tmp_path}/replica.db'
+        replica_engine = create_engine(replica_url)
+        db.metadata.create_all(replica_engine)
+        with Session(replica_engine) as session:
+            session.add(Product(name='Replica Product', price=10.0, stock=5))
+            session.commit()
+        replica_engine.dispose()
+        app.config['DB_REPLICA_URLS'] = [replica_url]
+        try:
+            _, _, data = call_asgi(asgi_app, 'GET', '/api/products')
+            assert [p['name'] for p in data] == ['Replica Product']
+            call_asgi(asgi_app, 'POST', '/api/cart/add', {'session_id': 'pinned', 'product_id': 1})
+            _, _, data = call_asgi(asgi_app, 'GET', '/api/cart?session_id=pinned')
+            assert len(data['items']) == 1
+        finally:
+            app.config['DB_REPLICA_URLS'] = []
+            replicas.dispose()
+            replicas.pins.reset()
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
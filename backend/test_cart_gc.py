@@ -0,0 +1,111 @@
+"""
+Test cases for abandoned-cart garbage collection
+"""
+import pytest
+from app import app, db, jobs, Product, CartItem, delete_abandoned_carts
+from datetime import datetime, timedelta
+
+@pytest.fixture(scope='module')
+def seed():
+    """One product with plenty of stock"""
+    return lambda: db.session.add(Product(name='Plenty', price=10.0, stock=1000))
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
+
+def _add(client, session_id, quantity=1):
+    return client.post('/api/cart/add', json={
+        'session_id': session_id, 'product_id': 1, 'quantity': quantity
+    })
+
+def _age_cart(session_id, seconds):
+    with app.app_context():
+        CartItem.query.filter_by(session_id=session_id).update(
+            {'updated_at': datetime.utcnow() - timedelta(seconds=seconds)}
+        )
+        db.session.commit()
+
+def _sessions():
+    with app.app_context():
+        return {item.session_id for item in CartItem.query.all()}
+
+class TestAbandonedCartCollection:
+    """Test cases for expiring untouched carts"""
+
+    def test_add_to_cart_sets_last_touched(self, client):
+        """Test cart writes stamp updated_at"""
+        _add(client, 'shopper')
+        with app.app_context():
+            item = CartItem.query.filter_by(session_id='shopper').one()
+            assert datetime.utcnow() - item.updated_at < timedelta(minutes=1)
+
+    def test_expired_carts_deleted(self, client):
+        """Test carts older than CART_TTL are reclaimed and fresh ones kept"""
+        _add(client, 'abandoned')
+        _add(client, 'active')
+        _age_cart('abandoned', app.config['CART_TTL'] + 60)
+        with app.app_context():
+            result = delete_abandoned_carts(pause=0)
+        assert result['deleted'] == 1
+        assert result['batches'] == 1
+        assert result['duration_ms'] >= 0
+        assert _sessions() == {'active'}
+
+    def test_touching_cart_keeps_it_alive(self, client):
+        """Test adding to an old cart refreshes every line in it"""
+        _add(client, 'returning')
+        _age_cart('returning', app.config['CART_TTL'] + 60)
+        _add(client, 'returning')
+        with app.app_context():
+            assert delete_abandoned_carts(pause=0)['deleted'] == 0
+        assert _sessions() == {'returning'}
+
+    def test_deletes_in_bounded_batches(self, client):
+        """Test many abandoned carts are removed a batch at a time"""
+        for i in range(7):
+            _add(client, f'session-{i}-0')
+            _age_cart(f'session-{i}-0', app.config['CART_TTL'] + 60)
+        with app.app_context():
+            result = delete_abandoned_carts(batch_size=3, pause=0)
+        assert result['deleted'] == 7
+        assert result['batches'] == 3
+        assert _sessions() == set()
+
+    def test_rows_without_timestamp_get_one(self, client):
+        """Test rows from before the column existed start their TTL now"""
+        _add(client, 'legacy')
+        with app.app_context():
+            CartItem.query.update({'updated_at': None})
+            db.session.commit()
+            assert delete_abandoned_carts(pause=0)['deleted'] == 0
+            assert CartItem.query.one().updated_at is not None
+
+    def test_backfill_in_bounded_batches(self, client):
+        """Test a large legacy table is stamped a batch at a time"""
+        for i in range(7):
+            _add(client, f'legacy-{i}')
+        with app.app_context():
+            CartItem.query.update({'updated_at': None})
+            db.session.commit()
+            result = delete_abandoned_carts(batch_size=3, pause=0)
+            assert result['backfilled'] == 7
+            assert result['deleted'] == 0
+            assert CartItem.query.filter(CartItem.updated_at.is_(None)).count() == 0
+
+    def test_registered_as_job(self, client):
+        """Test the collector reports through the job metrics"""
+        _add(client, 'abandoned')
+        _age_cart('abandoned', app.config['CART_TTL'] + 60)
+        jobs.run('delete_abandoned_carts')
+        assert jobs.metrics()['delete_abandoned_carts']['last_result']['deleted'] == 1
+
+    def test_cli_command(self, client):
+        """Test `flask gc-carts` runs the collector"""
+        result = app.test_cli_runner().invoke(args=['gc-carts'])
+        assert result.exit_code == 0
+        assert 'Deleted 0 cart rows' in result.output
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
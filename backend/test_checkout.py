@@ -4,54 +4,40 @@ Covers positive scenarios, negative scenarios, edge cases, and security scenario
 """
 import pytest
 import json
-import os
 from app import app, db, Product, CartItem, DiscountCode, Order
+from conftest import rolled_back_client
 from datetime import datetime, timedelta, timezone
 
+def seed_database():
+    """Rows every test starts from"""
+    products = [
+        Product(name='Test Product 1', price=100.0, stock=10),
+        Product(name='Test Product 2', price=50.0, stock=5),
+        Product(name='Out of Stock', price=25.0, stock=0),
+    ]
+    db.session.add_all(products)
+
+    discount_codes = [
+        DiscountCode(code='VALID10', discount_percent=10.0, is_active=True),
+        DiscountCode(code='INACTIVE', discount_percent=20.0, is_active=False),
+        DiscountCode(
+            code='EXPIRED',
+            discount_percent=15.0,
+            is_active=True,
+            expiry_date=datetime.now(timezone.utc) - timedelta(days=1)
+        ),
+    ]
+    db.session.add_all(discount_codes)
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
 @pytest.fixture
-def client():
-    """Create test client"""
-    app.config['TESTING'] = True
-    # Use DATABASE_URL from environment if available, otherwise use SQLite in-memory
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///:memory:')
-    app.config['MAIL_SUPPRESS_SEND'] = True
-    
-    with app.test_client() as client:
-        with app.app_context():
-            # Drop all tables first to ensure clean state
-            db.drop_all()
-            # Create all tables
-            db.create_all()
-            
-            # Seed test data
-            products = [
-                Product(name='Test Product 1', price=100.0, stock=10),
-                Product(name='Test Product 2', price=50.0, stock=5),
-                Product(name='Out of Stock', price=25.0, stock=0),
-            ]
-            for p in products:
-                db.session.add(p)
-            
-            # Check if discount codes already exist to avoid duplicates
-            existing_codes = {code.code for code in DiscountCode.query.all()}
-            discount_codes = [
-                DiscountCode(code='VALID10', discount_percent=10.0, is_active=True),
-                DiscountCode(code='INACTIVE', discount_percent=20.0, is_active=False),
-                DiscountCode(
-                    code='EXPIRED',
-                    discount_percent=15.0,
-                    is_active=True,
-                    expiry_date=datetime.now(timezone.utc) - timedelta(days=1)
-                ),
-            ]
-            for code in discount_codes:
-                if code.code not in existing_codes:
-                    db.session.add(code)
-            
-            db.session.commit()
-        yield client
-        with app.app_context():
-            db.drop_all()
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
 
 @pytest.fixture
 def session_id():
@@ -866,5 +852,28 @@ class TestIntegrationScenarios:
             updated_product = Product.query.get(1)
             assert updated_product.stock == initial_stock - 3
 
+class TestIsolation:
+    """Test cases for the rolled-back per-test transaction"""
+
+    def test_runs_start_from_seed_data(self, client, session_id):
+        """Test earlier tests' carts, orders and stock changes were rolled back"""
+        with app.app_context():
+            assert CartItem.query.count() == 0
+            assert Order.query.count() == 0
+            assert [p.stock for p in Product.query.order_by(Product.id)] == [10, 5, 0]
+
+    def test_cache_cleared_after_rollback(self, seeded_schema, seed, session_id):
+        """Test a deactivation cached in one transaction does not outlive its rollback"""
+        apply = {'session_id': session_id, 'code': 'VALID10'}
+        with rolled_back_client(seed) as client:
+            with app.app_context():
+                DiscountCode.query.filter_by(code='VALID10').one().is_active = False
+                db.session.commit()
+            client.post('/api/cart/add', json={'session_id': session_id, 'product_id': 1})
+            assert client.post('/api/discount/apply', json=apply).status_code == 400
+        with rolled_back_client(seed) as client:
+            client.post('/api/cart/add', json={'session_id': session_id, 'product_id': 1})
+            assert client.post('/api/discount/apply', json=apply).status_code == 200
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -6,64 +6,49 @@ import pytest
 import json
 import threading
 import time
-import os
 from app import app, db, Product, CartItem, DiscountCode, Order
 from datetime import datetime, timedelta, timezone
 from test_data_generator import TestDataGenerator
 
+def seed_database():
+    """Rows every test starts from"""
+    products = [
+        Product(name='Test Product 1', price=100.0, stock=10),
+        Product(name='Test Product 2', price=50.0, stock=5),
+        Product(name='Out of Stock', price=25.0, stock=0),
+        Product(name='Limited Stock', price=75.0, stock=2),
+        Product(name='High Value', price=1000.0, stock=1),
+    ]
+    db.session.add_all(products)
+
+    discount_codes = [
+        DiscountCode(code='VALID10', discount_percent=10.0, is_active=True),
+        DiscountCode(code='VALID20', discount_percent=20.0, is_active=True),
+        DiscountCode(code='INACTIVE', discount_percent=20.0, is_active=False),
+        DiscountCode(
+            code='EXPIRED',
+            discount_percent=15.0,
+            is_active=True,
+            expiry_date=datetime.now(timezone.utc) - timedelta(days=1)
+        ),
+        DiscountCode(
+            code='FUTURE',
+            discount_percent=25.0,
+            is_active=True,
+            expiry_date=datetime.now(timezone.utc) + timedelta(days=30)
+        ),
+    ]
+    db.session.add_all(discount_codes)
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
 @pytest.fixture
-def client():
-    """Create test client"""
-    app.config['TESTING'] = True
-    # Use DATABASE_URL from environment if available, otherwise use SQLite in-memory
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///:memory:')
-    app.config['MAIL_SUPPRESS_SEND'] = True
-    
-    with app.test_client() as client:
-        with app.app_context():
-            # Drop all tables first to ensure clean state
-            db.drop_all()
-            # Create all tables
-            db.create_all()
-            
-            # Seed test data
-            products = [
-                Product(name='Test Product 1', price=100.0, stock=10),
-                Product(name='Test Product 2', price=50.0, stock=5),
-                Product(name='Out of Stock', price=25.0, stock=0),
-                Product(name='Limited Stock', price=75.0, stock=2),
-                Product(name='High Value', price=1000.0, stock=1),
-            ]
-            for p in products:
-                db.session.add(p)
-            
-            # Check if discount codes already exist to avoid duplicates
-            existing_codes = {code.code for code in DiscountCode.query.all()}
-            discount_codes = [
-                DiscountCode(code='VALID10', discount_percent=10.0, is_active=True),
-                DiscountCode(code='VALID20', discount_percent=20.0, is_active=True),
-                DiscountCode(code='INACTIVE', discount_percent=20.0, is_active=False),
-                DiscountCode(
-                    code='EXPIRED',
-                    discount_percent=15.0,
-                    is_active=True,
-                    expiry_date=datetime.now(timezone.utc) - timedelta(days=1)
-                ),
-                DiscountCode(
-                    code='FUTURE',
-                    discount_percent=25.0,
-                    is_active=True,
-                    expiry_date=datetime.now(timezone.utc) + timedelta(days=30)
-                ),
-            ]
-            for code in discount_codes:
-                if code.code not in existing_codes:
-                    db.session.add(code)
-            
-            db.session.commit()
-        yield client
-        with app.app_context():
-            db.drop_all()
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
 
 @pytest.fixture
 def session_id():
@@ -315,7 +300,8 @@ class TestEdgeCasesExpanded:
         data = json.loads(cart_response.data)
         assert len(data['items']) == 2
     
-    @pytest.mark.skip(reason="Threading tests cause context issues with Flask test client")
+    @pytest.mark.skip(reason="Threading tests cause context issues with Flask test client; "
+                             "real contention is measured by benchmarks/bench_checkout_contention.py")
     def test_concurrent_add_to_cart(self, client):
         """Test concurrent additions to cart from different sessions"""
         results = []
@@ -341,7 +327,8 @@ class TestEdgeCasesExpanded:
         # All should succeed
         assert all(status == 201 for _, status in results)
     
-    @pytest.mark.skip(reason="Threading tests cause context issues with Flask test client")
+    @pytest.mark.skip(reason="Threading tests cause context issues with Flask test client; "
+                             "real contention is measured by benchmarks/bench_checkout_contention.py")
     def test_concurrent_checkout_same_product(self, client):
         """Test concurrent checkout attempts for same product with limited stock"""
         results = []
@@ -0,0 +1,248 @@
+"""
+Test cases for the discount code cache and its Bloom prefilter
+Covers hits, negative caching, expiry, invalidation and the discount routes
+"""
+import pytest
+import json
+import random
+import string
+from app import app, db, jobs, discount_codes, discount_filter, Product, DiscountCode
+from bloom import BloomFilter
+from discount_cache import DiscountCodeCache, DiscountCodeFilter, DiscountEntry
+from datetime import datetime, timedelta
+
+def seed_database():
+    """Rows every test starts from"""
+    db.session.add_all([
+        Product(name='Plenty', price=100.0, stock=100),
+        DiscountCode(code='SAVE10', discount_percent=10.0, is_active=True),
+        DiscountCode(code='SOON', discount_percent=50.0, is_active=True,
+                     expiry_date=datetime.utcnow() + timedelta(hours=1)),
+        DiscountCode(code='OLD', discount_percent=50.0, is_active=True,
+                     expiry_date=datetime.utcnow() - timedelta(days=1)),
+    ])
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
+
+def _counting_loader(rows):
+    calls = []
+    def loader(code):
+        calls.append(code)
+        return rows.get(code)
+    return loader, calls
+
+def _apply(client, code):
+    client.post('/api/cart/add', json={'session_id': 'shopper', 'product_id': 1, 'quantity': 1})
+    return client.post('/api/discount/apply', json={'code': code, 'session_id': 'shopper'})
+
+class TestDiscountCodeCache:
+    """Test cases for the cache on its own"""
+
+    def test_repeat_lookups_hit_cache(self):
+        """Test a valid code is loaded once and then served from memory"""
+        loader, calls = _counting_loader({'SAVE10': DiscountEntry('SAVE10', 10.0, True, None)})
+        cache = DiscountCodeCache(loader)
+        assert cache.get('save10').discount_percent == 10.0
+        assert cache.get('SAVE10').discount_percent == 10.0
+        assert calls == ['SAVE10']
+        assert cache.metrics()['hits'] == 1
+
+    def test_unknown_codes_cached_negatively(self):
+        """Test repeated guesses of a missing code cost one load per negative TTL"""
+        loader, calls = _counting_loader({})
+        cache = DiscountCodeCache(loader, negative_ttl=30)
+        assert cache.get('NOPE', now=1000) is None
+        assert cache.get('NOPE', now=1010) is None
+        assert calls == ['NOPE']
+        assert cache.get('NOPE', now=1031) is None
+        assert calls == ['NOPE', 'NOPE']
+        assert cache.metrics()['negative_hits'] == 1
+
+    def test_entry_dropped_when_code_expires(self):
+        """Test a cached code is reloaded at its expiry instead of after the TTL"""
+        loader, calls = _counting_loader({'SOON': DiscountEntry('SOON', 5.0, True, 1100)})
+        cache = DiscountCodeCache(loader, ttl=300)
+        assert cache.get('SOON', now=1000).is_usable(now=1000)
+        cache.get('SOON', now=1099)
+        assert len(calls) == 1
+        entry = cache.get('SOON', now=1101)
+        assert len(calls) == 2
+        assert entry.is_expired(now=1101)
+
+    def test_size_bounded(self):
+        """Test guessing many distinct codes cannot grow the cache without limit"""
+        loader, _ = _counting_loader({})
+        cache = DiscountCodeCache(loader, max_entries=100)
+        for i in range(1000):
+            cache.get(f'GUESS{i}')
+        assert cache.metrics()['size'] == 100
+
+class TestBloomFilter:
+    """Test cases for the membership filter"""
+
+    def test_no_false_negatives(self):
+        """Test every added code is reported as possibly present"""
+        bloom = BloomFilter(1000)
+        codes = [f'CODE{i:05d}' for i in range(1000)]
+        for code in codes:
+            bloom.add(code)
+        assert all(code in bloom for code in codes)
+
+    def test_false_positive_rate_near_target(self):
+        """Test random guesses pass the filter at about the configured rate"""
+        rng = random.Random(7)
+        bloom = BloomFilter(20000, error_rate=0.01)
+        for _ in range(20000):
+            bloom.add(''.join(rng.choices(string.ascii_uppercase + string.digits, k=8)))
+        guesses = [''.join(rng.choices(string.ascii_lowercase, k=8)) for _ in range(20000)]
+        rate = sum(guess in bloom for guess in guesses) / len(guesses)
+        assert rate < 0.02
+
+    def test_saturation_reported(self):
+        """Test the filter reports when it holds more than it was sized for"""
+        bloom = BloomFilter(2)
+        for code in ('A', 'B', 'C'):
+            bloom.add(code)
+        assert bloom.saturated
+
+class TestDiscountCodeFilter:
+    """Test cases for the incrementally refreshed code filter"""
+
+    def test_rejects_unknown_codes_without_loading(self):
+        """Test definite misses never reach the loader"""
+        prefilter = DiscountCodeFilter(lambda last_id: [(1, 'SAVE10')])
+        loader, calls = _counting_loader({'SAVE10': DiscountEntry('SAVE10', 10.0, True, None)})
+        cache = DiscountCodeCache(loader, prefilter=prefilter)
+        assert cache.get('ZZZZ9999') is None
+        assert cache.get('save10').code == 'SAVE10'
+        assert calls == ['SAVE10']
+        assert cache.metrics()['filter']['rejected'] == 1
+
+    def test_refresh_reads_only_new_rows(self):
+        """Test refresh asks for rows past the highest id already seen"""
+        rows = [(1, 'FIRST')]
+        requested = []
+        def fetch_since(last_id):
+            requested.append(last_id)
+            return [row for row in rows if row[0] > last_id]
+        prefilter = DiscountCodeFilter(fetch_since)
+        prefilter.rebuild()
+        rows.append((2, 'SECOND'))
+        assert prefilter.refresh() == {'codes': 1}
+        assert requested == [0, 1]
+        assert prefilter.might_exist('second')
+
+    def test_grows_when_saturated(self):
+        """Test a filter outgrowing its capacity is rebuilt larger"""
+        rows = [(i, f'CODE{i}') for i in range(1, 6)]
+        prefilter = DiscountCodeFilter(lambda last_id: [r for r in rows if r[0] > last_id], min_capacity=10)
+        prefilter.rebuild()
+        rows.extend((i, f'CODE{i}') for i in range(6, 30))
+        prefilter.refresh()
+        assert prefilter.metrics()['rebuilds'] == 2
+        assert all(prefilter.might_exist(code) for _, code in rows)
+
+    def test_stale_miss_reads_new_rows_first(self):
+        """Test a code added elsewhere is found once the filter is overdue a refresh"""
+        rows = [(1, 'FIRST')]
+        now = [0.0]
+        requested = []
+        def fetch_since(last_id):
+            requested.append(last_id)
+            return [row for row in rows if row[0] > last_id]
+        prefilter = DiscountCodeFilter(fetch_since, max_age=30, clock=lambda: now[0])
+        prefilter.rebuild()
+        rows.append((2, 'ELSEWHERE'))
+        assert not prefilter.might_exist('ELSEWHERE')
+        now[0] = 30
+        assert prefilter.might_exist('ELSEWHERE')
+        # Fresh again: further misses are answered from the filter alone
+        assert not prefilter.might_exist('ZZZZ9999')
+        assert requested == [0, 1]
+        assert prefilter.metrics()['stale_refreshes'] == 1
+
+class TestDiscountInvalidation:
+    """Test cases for keeping the app cache in step with the table"""
+
+    def test_update_invalidates_after_commit(self, client):
+        """Test deactivating a code takes effect on the next request"""
+        assert _apply(client, 'SAVE10').status_code == 200
+        with app.app_context():
+            DiscountCode.query.filter_by(code='SAVE10').one().is_active = False
+            db.session.commit()
+        assert _apply(client, 'SAVE10').status_code == 400
+
+    def test_insert_clears_negative_entry(self, client):
+        """Test a newly created code is usable despite an earlier miss"""
+        assert _apply(client, 'NEW20').status_code == 404
+        with app.app_context():
+            db.session.add(DiscountCode(code='NEW20', discount_percent=20.0, is_active=True))
+            db.session.commit()
+        response = _apply(client, 'NEW20')
+        assert response.status_code == 200
+        assert json.loads(response.data)['discount_percent'] == 20.0
+
+    def test_rollback_keeps_cache(self, client):
+        """Test uncommitted changes do not evict the cached code"""
+        _apply(client, 'SAVE10')
+        with app.app_context():
+            DiscountCode.query.filter_by(code='SAVE10').one().discount_percent = 99.0
+            db.session.flush()
+            db.session.rollback()
+        size = discount_codes.metrics()['size']
+        assert _apply(client, 'SAVE10').status_code == 200
+        assert discount_codes.metrics()['size'] == size
+
+    def test_code_from_another_process_found_after_refresh(self, client):
+        """Test a code inserted behind the app's back passes once the job runs"""
+        assert _apply(client, 'SAVE10').status_code == 200
+        with app.app_context():
+            db.session.execute(db.text(
+                "INSERT INTO discount_code (code, discount_percent, is_active) VALUES ('ELSEWHERE', 15, 1)"
+            ))
+            db.session.commit()
+        assert not discount_filter.might_exist('ELSEWHERE')
+        jobs.run('refresh_discount_filter')
+        assert _apply(client, 'ELSEWHERE').status_code == 200
+
+class TestDiscountRoutes:
+    """Test cases for the routes served through the cache"""
+
+    def test_apply_errors_unchanged(self, client):
+        """Test unknown, expired and valid codes keep their responses"""
+        assert _apply(client, 'MISSING').status_code == 404
+        assert json.loads(_apply(client, 'OLD').data)['error'] == 'Discount code has expired'
+        assert json.loads(_apply(client, 'soon').data)['discount_code'] == 'SOON'
+
+    def test_checkout_ignores_expired_code(self, client):
+        """Test an expired code no longer discounts the order"""
+        client.post('/api/cart/add', json={'session_id': 'buyer', 'product_id': 1, 'quantity': 1})
+        response = client.post('/api/checkout', json={
+            'session_id': 'buyer',
+            'email': 'test@example.com',
+            'payment_method': 'paypal',
+            'shipping_address': '123 Test St',
+            'discount_code': 'OLD'
+        })
+        assert response.status_code == 201
+        assert json.loads(response.data)['total_amount'] == 100.0
+
+    def test_metrics_report_cache(self, client):
+        """Test cache counters are exposed on /api/metrics"""
+        _apply(client, 'SAVE10')
+        _apply(client, 'SAVE10')
+        _apply(client, 'GUESSED1')
+        data = json.loads(client.get('/api/metrics').data)
+        assert data['discount_cache']['hits'] >= 1
+        assert data['discount_cache']['filter']['rejected'] >= 1
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,168 @@
+"""
+Test cases for structured logging
+Covers JSON records, request ids, access-log sampling and the non-blocking queue
+"""
+import pytest
+import io
+import json
+import logging
+import sys
+import threading
+import time
+from flask import Flask
+from logs import JsonFormatter, NonBlockingQueueHandler, StructuredLogging
+
+logger = logging.getLogger('test_logs')
+
+def _build_app(**config):
+    test_app = Flask(__name__)
+    test_app.config.update(config)
+
+    @test_app.route('/ok')
+    def ok():
+        logger.info('handled', extra={'cart_items': 3})
+        return 'ok'
+
+    @test_app.route('/slow')
+    def slow():
+        time.sleep(0.6)
+        return 'slow'
+
+    @test_app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    return test_app
+
+@pytest.fixture
+def logged():
+    """A bare app logging JSON into a buffer; yields (app, read_records)"""
+    stream = io.StringIO()
+    test_app = _build_app(LOG_SUCCESS_SAMPLE_RATE=1.0)
+    extension = StructuredLogging(test_app, stream=stream)
+    extension.install()
+
+    def records():
+        extension.handler.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield test_app, records
+    extension.shutdown()
+
+class _BlockingHandler(logging.Handler):
+    """Stands in for a stdout pipe nobody is reading"""
+
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        self.records.append(record)
+
+class TestJsonFormatter:
+    """Test cases for the record format"""
+
+    def test_extra_fields_and_exception(self):
+        """Test extras land at the top level and tracebacks are included"""
+        try:
+            raise ValueError('bad')
+        except ValueError:
+            record = logger.makeRecord('test_logs', logging.ERROR, __file__, 1, 'failed %s', ('job',),
+                                       sys.exc_info(), extra={'job': 'cart_gc'})
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry['message'] == 'failed job'
+        assert entry['level'] == 'ERROR'
+        assert entry['job'] == 'cart_gc'
+        assert 'ValueError: bad' in entry['exception']
+
+class TestRequestLogging:
+    """Test cases for request ids and the access log"""
+
+    def test_request_id_generated_and_propagated(self, logged):
+        """Test a fresh id is echoed and attached to records logged by the view"""
+        test_app, records = logged
+        response = test_app.test_client().get('/ok')
+        request_id = response.headers['X-Request-ID']
+        assert len(request_id) == 32
+        entries = [entry for entry in records() if entry.get('request_id') == request_id]
+        assert [entry['message'] for entry in entries] == ['handled', 'request']
+        assert entries[0]['cart_items'] == 3
+        assert entries[1]['status'] == 200 and entries[1]['endpoint'] == 'ok'
+
+    def test_incoming_request_id_kept_unless_malformed(self, logged):
+        """Test the caller's id is reused only when it is safe to log"""
+        test_app, _ = logged
+        client = test_app.test_client()
+        assert client.get('/ok', headers={'X-Request-ID': 'edge-1234'}).headers['X-Request-ID'] == 'edge-1234'
+        assert client.get('/ok', headers={'X-Request-ID': 'a b;c'}).headers['X-Request-ID'] != 'a b;c'
+
+    def test_errors_logged_with_traceback(self, logged):
+        """Test an unhandled exception logs its traceback under the request id"""
+        test_app, records = logged
+        response = test_app.test_client().get('/boom')
+        request_id = response.headers['X-Request-ID']
+        entries = [entry for entry in records() if entry.get('request_id') == request_id]
+        assert any('RuntimeError: boom' in entry.get('exception', '') for entry in entries)
+        assert entries[-1]['status'] == 500 and entries[-1]['level'] == 'ERROR'
+
+    def test_success_sampled_failures_and_slow_kept(self):
+        """Test sampling drops successes but never failures or slow requests"""
+        stream = io.StringIO()
+        test_app = _build_app(LOG_SUCCESS_SAMPLE_RATE=0.0, LOG_SLOW_REQUEST_MS=500)
+        extension = StructuredLogging(test_app, stream=stream)
+        extension.install()
+        client = test_app.test_client()
+        for path in ('/ok', '/ok', '/missing', '/slow'):
+            client.get(path)
+        extension.shutdown()
+        paths = [json.loads(line)['path'] for line in stream.getvalue().splitlines()
+                 if json.loads(line)['logger'] == 'access']
+        assert paths == ['/missing', '/slow']
+
+class TestInstall:
+    """Test cases for which loggers are captured"""
+
+    def test_nothing_attached_until_installed(self):
+        """Test creating the extension leaves every logger as it was"""
+        root = logging.getLogger()
+        handlers, level = list(root.handlers), root.level
+        test_app = _build_app()
+        extension = StructuredLogging(test_app, stream=io.StringIO())
+        assert extension.handler not in logging.getLogger('access').handlers
+        extension.install()
+        try:
+            assert extension.handler in test_app.logger.handlers
+            assert extension.handler in logging.getLogger('access').handlers
+            assert root.handlers == handlers and root.level == level
+        finally:
+            extension.shutdown()
+        assert extension.handler not in logging.getLogger('access').handlers
+
+class TestNonBlockingQueue:
+    """Test cases for logging while the writer is stuck"""
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test a stalled writer never stalls the logging thread"""
+        target = _BlockingHandler()
+        handler = NonBlockingQueueHandler(target, maxsize=10)
+        burst = logging.getLogger('test_logs.burst')
+        burst.propagate = False
+        burst.addHandler(handler)
+        try:
+            started = time.perf_counter()
+            for i in range(500):
+                burst.error('failure %d', i)
+            assert time.perf_counter() - started < 1
+            assert handler.dropped >= 480
+        finally:
+            target.unblock.set()
+            handler.stop()
+            burst.removeHandler(handler)
+        messages = [record.getMessage() for record in target.records]
+        assert messages[0] == 'failure 0'
+        assert 'log queue full, records dropped' in messages
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
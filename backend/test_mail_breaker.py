@@ -0,0 +1,219 @@
+"""
+Test cases for SMTP timeouts and the mail circuit breaker
+Covers breaker state changes, delivery against a misbehaving SMTP server
+and checkout latency during a mail outage
+"""
+import pytest
+import json
+import time
+from flask import Flask
+from app import app, db, mailer, Product
+from circuit import CircuitBreaker, CircuitOpenError
+from fakesmtp import FakeSMTPServer
+from mailer import AsyncMailer, timeout_mail
+
+class _Clock:
+    """Hand-wound monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _fail():
+    raise ConnectionError('smtp down')
+
+@pytest.fixture
+def smtp():
+    """A fake SMTP server, stopped afterwards"""
+    with FakeSMTPServer() as server:
+        yield server
+
+def _mailer(smtp, **config):
+    flask_app = Flask(__name__)
+    flask_app.config.update(MAIL_SERVER=smtp.host, MAIL_PORT=smtp.port, MAIL_USE_TLS=False,
+                            MAIL_DEFAULT_SENDER='shop@example.com', MAIL_ASYNC=False, MAIL_TIMEOUT=0.2)
+    flask_app.config.update(config)
+    return flask_app, AsyncMailer(app=flask_app)
+
+def _send(flask_app, mailer):
+    with flask_app.app_context():
+        mailer.send(mailer.message(subject='Order', recipients=['a@example.com'], body='Thanks'))
+
+class TestCircuitBreaker:
+    """Test cases for breaker state changes"""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test the breaker opens on the threshold and then fails fast"""
+        breaker = CircuitBreaker('smtp', failure_threshold=3, reset_timeout=30, clock=_Clock())
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                breaker.call(_fail)
+        assert breaker.state == 'open'
+        calls = []
+        with pytest.raises(CircuitOpenError) as excinfo:
+            breaker.call(calls.append, 1)
+        assert calls == []
+        assert excinfo.value.retry_after == 30
+        assert breaker.metrics()['rejected'] == 1
+
+    def test_success_resets_failure_count(self):
+        """Test only consecutive failures count towards opening"""
+        breaker = CircuitBreaker('smtp', failure_threshold=2, clock=_Clock())
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+        breaker.call(lambda: None)
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+        assert breaker.state == 'closed'
+
+    def test_half_open_lets_one_probe_through(self):
+        """Test a single probe after the reset timeout, closing on success"""
+        clock = _Clock()
+        breaker = CircuitBreaker('smtp', failure_threshold=1, reset_timeout=30, clock=clock)
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+        clock.now = 30
+        assert breaker.state == 'half_open'
+        breaker.check()  # send() may queue while half-open
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # a second caller while the probe is out
+        breaker.record_success()
+        assert breaker.state == 'closed'
+
+    def test_failed_probe_reopens(self):
+        """Test a failed probe opens the breaker for another reset timeout"""
+        clock = _Clock()
+        breaker = CircuitBreaker('smtp', failure_threshold=5, reset_timeout=30, clock=clock)
+        for _ in range(5):
+            breaker.record_failure()
+        clock.now = 31
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+        assert breaker.state == 'open'
+        clock.now = 60
+        assert breaker.state == 'open'
+        assert breaker.metrics()['opened'] == 2
+
+    def test_zero_threshold_never_opens(self):
+        """Test MAIL_BREAKER_FAILURES=0 disables the breaker"""
+        breaker = CircuitBreaker('smtp', failure_threshold=0, clock=_Clock())
+        for _ in range(20):
+            breaker.record_failure()
+        assert breaker.state == 'closed'
+
+class TestMailDelivery:
+    """Test cases for delivery against the fake SMTP server"""
+
+    def test_delivers(self, smtp):
+        """Test a message reaches a healthy server"""
+        flask_app, mailer = _mailer(smtp)
+        _send(flask_app, mailer)
+        assert len(smtp.messages) == 1
+        assert mailer.metrics()['breaker']['successes'] == 1
+
+    def test_hung_server_times_out(self, smtp):
+        """Test a server that never answers costs MAIL_TIMEOUT, not minutes"""
+        smtp.mode = 'hang'
+        flask_app, mailer = _mailer(smtp)
+        started = time.perf_counter()
+        with pytest.raises(OSError):
+            _send(flask_app, mailer)
+        assert time.perf_counter() - started < 1
+
+    def test_breaker_stops_connecting(self, smtp):
+        """Test an open breaker fails fast without touching the server"""
+        smtp.mode = 'reject'
+        flask_app, mailer = _mailer(smtp, MAIL_BREAKER_FAILURES=2)
+        for _ in range(2):
+            with pytest.raises(Exception):
+                _send(flask_app, mailer)
+        assert smtp.connections == 2
+        with pytest.raises(CircuitOpenError):
+            _send(flask_app, mailer)
+        assert smtp.connections == 2
+
+    def test_recovers_through_probe(self, smtp):
+        """Test delivery resumes once the server is back and a probe succeeds"""
+        smtp.mode = 'reset'
+        flask_app, mailer = _mailer(smtp, MAIL_BREAKER_FAILURES=1, MAIL_BREAKER_RESET=0.1)
+        with pytest.raises(Exception):
+            _send(flask_app, mailer)
+        smtp.mode = 'ok'
+        with pytest.raises(CircuitOpenError):
+            _send(flask_app, mailer)
+        time.sleep(0.15)
+        _send(flask_app, mailer)
+        assert mailer.breaker.state == 'closed'
+        assert len(smtp.messages) == 1
+
+    def test_queued_messages_turned_away_once_open(self, smtp):
+        """Test the pool skips messages queued before the breaker opened"""
+        smtp.mode = 'hang'
+        flask_app, mailer = _mailer(smtp, MAIL_ASYNC=True, MAIL_SEND_WORKERS=1, MAIL_BREAKER_FAILURES=1)
+        with flask_app.app_context():
+            futures = [mailer.send(mailer.message(subject='Order', recipients=['a@example.com'], body='x'))
+                       for _ in range(3)]
+        assert isinstance(futures[0].exception(timeout=5), OSError)
+        assert all(isinstance(future.exception(timeout=5), CircuitOpenError) for future in futures[1:])
+        assert smtp.connections == 1
+
+@pytest.fixture(scope='module')
+def seed():
+    """One product with plenty of stock"""
+    return lambda: db.session.add(Product(name='Widget', price=20.0, stock=100))
+
+@pytest.fixture
+def outage(transactional_client):
+    """The app's mailer sending inline to a hung SMTP server"""
+    saved = {key: app.config.get(key) for key in ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_TLS',
+                                              'MAIL_SUPPRESS_SEND', 'MAIL_DEFAULT_SENDER')}
+    saved_state = mailer.mail, mailer.enabled, mailer.breaker, app.extensions.get('mail')
+    with FakeSMTPServer(mode='hang') as smtp:
+        app.config.update(MAIL_SERVER=smtp.host, MAIL_PORT=smtp.port, MAIL_USE_TLS=False,
+                          MAIL_SUPPRESS_SEND=False, MAIL_DEFAULT_SENDER='shop@example.com')
+        mailer.mail = timeout_mail(app, 0.3)
+        mailer.enabled = False
+        mailer.breaker = CircuitBreaker('smtp', failure_threshold=2, reset_timeout=60)
+        yield transactional_client, smtp
+    app.config.update(saved)
+    mailer.mail, mailer.enabled, mailer.breaker, app.extensions['mail'] = saved_state
+    if saved_state[3] is None:
+        del app.extensions['mail']
+
+class TestCheckoutDuringOutage:
+    """Test cases for checkout while SMTP is down"""
+
+    def _checkout(self, client, index):
+        session_id = f'outage-{index}'
+        client.post('/api/cart/add', json={'session_id': session_id, 'product_id': 1, 'quantity': 1})
+        started = time.perf_counter()
+        response = client.post('/api/checkout', json={
+            'session_id': session_id, 'email': 'buyer@example.com', 'payment_method': 'paypal',
+        })
+        return response.status_code, time.perf_counter() - started
+
+    def test_checkout_latency_flat_once_open(self, outage):
+        """Test only the checkouts before the breaker opens wait on SMTP"""
+        client, smtp = outage
+        results = [self._checkout(client, i) for i in range(8)]
+        assert [status for status, _ in results] == [201] * 8
+        assert all(elapsed >= 0.3 for _, elapsed in results[:2])
+        assert max(elapsed for _, elapsed in results[2:]) < 0.25
+        assert smtp.connections == 2
+
+    def test_state_in_health_and_metrics(self, outage):
+        """Test the breaker state is reported"""
+        client, _ = outage
+        assert json.loads(client.get('/api/health').data)['mail'] == 'closed'
+        for i in range(3):
+            self._checkout(client, i)
+        assert json.loads(client.get('/api/health').data)['mail'] == 'open'
+        breaker = json.loads(client.get('/api/metrics').data)['mail']['breaker']
+        assert breaker['state'] == 'open'
+        assert breaker['failures'] == 2 and breaker['rejected'] == 1
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
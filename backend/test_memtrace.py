@@ -0,0 +1,151 @@
+"""
+Test cases for tracemalloc snapshots
+Covers the tracer's bounds, diffs by line and the admin endpoints
+"""
+import pytest
+import json
+import os
+import tracemalloc
+from flask import Flask
+from app import app, memtrace
+from memtrace import MemoryTracer
+
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+# Grown between snapshots so the diff has something to find
+_retained = []
+
+def _allocate():
+    _retained.append([bytearray(1024) for _ in range(200)])
+
+@pytest.fixture
+def tracer():
+    """A tracer on a bare app, stopped afterwards"""
+    test_app = Flask(__name__)
+    test_app.config['MEMTRACE_MAX_SNAPSHOTS'] = 2
+    tracer = MemoryTracer(test_app)
+    yield tracer
+    tracer.stop()
+    _retained.clear()
+
+@pytest.fixture
+def client():
+    """Create test client with memory tracing allowed"""
+    app.config['TESTING'] = True
+    app.config['MEMTRACE_ENABLED'] = True
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    with app.test_client() as client:
+        yield client
+    memtrace.stop()
+    _retained.clear()
+    app.config['MEMTRACE_ENABLED'] = False
+    app.config['ADMIN_API_TOKEN'] = None
+
+class TestMemoryTracer:
+    """Test cases for the tracer itself"""
+
+    def test_snapshot_needs_tracing(self, tracer):
+        """Test nothing is captured until tracing starts"""
+        assert tracer.snapshot() is None
+        assert tracer.status()['tracing'] is False
+
+    def test_diff_finds_growth_by_line(self, tracer):
+        """Test the allocating line tops the diff"""
+        tracer.start()
+        before = tracer.snapshot()
+        _allocate()
+        after = tracer.snapshot()
+        top = tracer.diff(before, after)[0]
+        assert top['location'].startswith(__file__)
+        assert top['size_diff_kb'] >= 200
+        assert top['count_diff'] >= 200
+
+    def test_group_by_filename_and_traceback(self, tracer):
+        """Test other groupings and the traceback depth"""
+        tracer.start(frames=3)
+        before = tracer.snapshot()
+        _allocate()
+        after = tracer.snapshot()
+        assert tracer.diff(before, after, 'filename')[0]['location'].startswith(__file__)
+        assert len(tracer.diff(before, after, 'traceback')[0]['traceback']) > 1
+
+    def test_snapshots_bounded(self, tracer):
+        """Test only the newest MEMTRACE_MAX_SNAPSHOTS are kept"""
+        tracer.start()
+        ids = [tracer.snapshot() for _ in range(3)]
+        assert sorted(tracer.snapshots) == ids[1:]
+
+    def test_stop_drops_snapshots(self, tracer):
+        """Test stopping ends tracing and frees the snapshots"""
+        tracer.start()
+        tracer.snapshot()
+        status = tracer.stop()
+        assert status['tracing'] is False
+        assert status['snapshots'] == []
+        assert not tracemalloc.is_tracing()
+
+    def test_stops_itself_after_max_seconds(self, tracer):
+        """Test tracing cannot be left on indefinitely"""
+        tracer.app.config['MEMTRACE_MAX_SECONDS'] = 0.05
+        tracer.start()
+        tracer._timer.join(1)
+        assert not tracemalloc.is_tracing()
+
+class TestMemoryEndpoints:
+    """Test cases for /api/admin/memory"""
+
+    def test_admin_token_required(self, client):
+        """Test every memory endpoint needs the admin token"""
+        assert client.get('/api/admin/memory').status_code == 401
+        assert client.post('/api/admin/memory/start').status_code == 401
+        assert client.post('/api/admin/memory/snapshots').status_code == 401
+
+    def test_start_refused_when_disabled(self, client):
+        """Test tracing stays off unless MEMTRACE_ENABLED is set"""
+        app.config['MEMTRACE_ENABLED'] = False
+        assert client.post('/api/admin/memory/start', headers=ADMIN).status_code == 403
+        assert not tracemalloc.is_tracing()
+
+    def test_snapshot_and_diff(self, client):
+        """Test a snapshot then a diff against a fresh one"""
+        response = client.post('/api/admin/memory/start', json={'frames': 2}, headers=ADMIN)
+        assert json.loads(response.data)['frames'] == 2
+        response = client.post('/api/admin/memory/snapshots', headers=ADMIN)
+        assert response.status_code == 201
+        first = json.loads(response.data)['id']
+        _allocate()
+
+        response = client.get('/api/admin/memory/diff', headers=ADMIN)
+        data = json.loads(response.data)
+        assert response.status_code == 200
+        assert data['pid'] == os.getpid()
+        assert data['from'] == first and data['to'] > first
+        assert any(stat['location'].startswith(__file__) for stat in data['stats'])
+        status = json.loads(client.get('/api/admin/memory', headers=ADMIN).data)
+        assert [snapshot['id'] for snapshot in status['snapshots']] == [first, data['to']]
+
+    def test_diff_errors(self, client):
+        """Test diffing without tracing, unknown ids and bad grouping"""
+        assert client.get('/api/admin/memory/diff', headers=ADMIN).status_code == 409
+        client.post('/api/admin/memory/start', headers=ADMIN)
+        assert client.get('/api/admin/memory/diff?from=999', headers=ADMIN).status_code == 404
+        assert client.get('/api/admin/memory/diff?group_by=module', headers=ADMIN).status_code == 400
+        assert client.get('/api/admin/memory/diff?from=x', headers=ADMIN).status_code == 400
+
+    def test_pinned_to_worker(self, client):
+        """Test ?pid= for another worker is refused with this worker's pid"""
+        response = client.get('/api/admin/memory?pid=1', headers=ADMIN)
+        assert response.status_code == 409
+        assert json.loads(response.data)['pid'] == os.getpid()
+        response = client.get(f'/api/admin/memory?pid={os.getpid()}', headers=ADMIN)
+        assert response.status_code == 200
+
+    def test_stop(self, client):
+        """Test stopping through the API"""
+        client.post('/api/admin/memory/start', headers=ADMIN)
+        response = client.post('/api/admin/memory/stop', headers=ADMIN)
+        assert json.loads(response.data)['tracing'] is False
+        assert not tracemalloc.is_tracing()
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
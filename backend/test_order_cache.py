@@ -0,0 +1,178 @@
+"""
+Test cases for cached order lookups
+Covers the read cache, ETag revalidation and invalidation on status changes
+"""
+import pytest
+import json
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import app, db, order_cache, Product, Order
+from order_cache import OrderReadCache
+
+@pytest.fixture(scope='module')
+def seed():
+    """One product with plenty of stock"""
+    return lambda: db.session.add(Product(name='Plenty', price=10.0, stock=100))
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
+
+def _place_order(client, session_id='buyer'):
+    client.post('/api/cart/add', json={'session_id': session_id, 'product_id': 1, 'quantity': 1})
+    response = client.post('/api/checkout', json={
+        'session_id': session_id,
+        'email': 'test@example.com',
+        'payment_method': 'paypal',
+        'shipping_address': '123 Test St'
+    })
+    return json.loads(response.data)['order_number']
+
+def _set_status(order_number, status):
+    with app.app_context():
+        Order.query.filter_by(order_number=order_number).one().status = status
+        db.session.commit()
+
+def _set_status_elsewhere(order_number, status):
+    # A bulk UPDATE skips the mapper events, like a commit in another worker
+    with app.app_context():
+        db.session.execute(db.update(Order).where(Order.order_number == order_number).values(status=status))
+        db.session.commit()
+
+@contextmanager
+def _count_queries():
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+class TestOrderReadCache:
+    """Test cases for the cache on its own"""
+
+    def test_entries_expire(self):
+        """Test cached orders are dropped after the TTL"""
+        cache = OrderReadCache(ttl=60)
+        cache.put('ORD-1', {'status': 'confirmed'}, now=1000)
+        assert cache.get('ORD-1', now=1059).payload == {'status': 'confirmed'}
+        assert cache.get('ORD-1', now=1061) is None
+
+    def test_etag_follows_content(self):
+        """Test the ETag changes exactly when the payload does"""
+        cache = OrderReadCache()
+        first = cache.put('ORD-1', {'status': 'confirmed', 'total_amount': 10.0})
+        same = cache.put('ORD-1', {'total_amount': 10.0, 'status': 'confirmed'})
+        shipped = cache.put('ORD-1', {'status': 'shipped', 'total_amount': 10.0})
+        assert first.etag == same.etag != shipped.etag
+
+    def test_confirm_evicts_changed_status(self):
+        """Test an entry is kept only while the order still has its status"""
+        cache = OrderReadCache()
+        entry = cache.put('ORD-1', {'status': 'confirmed'})
+        assert cache.confirm('ORD-1', entry, 'confirmed') is entry
+        assert cache.confirm('ORD-1', entry, 'shipped') is None
+        assert cache.get('ORD-1') is None
+        assert cache.metrics()['stale'] == 1
+
+    def test_status_checked_once_per_status_ttl(self):
+        """Test an entry is due for a status check only after status_ttl"""
+        cache = OrderReadCache(status_ttl=5)
+        entry = cache.put('ORD-1', {'status': 'confirmed'}, now=1000)
+        assert not cache.needs_check('ORD-1', entry, now=1004)
+        assert cache.needs_check('ORD-1', entry, now=1005)
+        assert cache.confirm('ORD-1', entry, 'confirmed', now=1005) is entry
+        assert not cache.needs_check('ORD-1', entry, now=1009)
+
+    def test_final_statuses(self):
+        """Test only the configured final statuses skip the status check"""
+        cache = OrderReadCache(final_statuses=['delivered', 'cancelled'])
+        assert cache.is_final(cache.put('ORD-1', {'status': 'delivered'}))
+        assert not cache.is_final(cache.put('ORD-2', {'status': 'confirmed'}))
+
+class TestCachedOrderLookup:
+    """Test cases for GET /api/orders/<order_number> through the cache"""
+
+    def test_repeat_lookups_skip_database(self, client):
+        """Test polling a confirmed order is served from the cache without a query"""
+        order_number = _place_order(client)
+        client.get(f'/api/orders/{order_number}')
+        before = order_cache.metrics()
+        with _count_queries() as statements:
+            for _ in range(5):
+                assert client.get(f'/api/orders/{order_number}').status_code == 200
+        after = order_cache.metrics()
+        assert statements == []
+        assert after['hits'] - before['hits'] == 5
+        assert after['misses'] == before['misses']
+
+    def test_caching_headers(self, client):
+        """Test responses carry an ETag and a private Cache-Control"""
+        order_number = _place_order(client)
+        response = client.get(f'/api/orders/{order_number}')
+        assert response.headers['ETag'].startswith('"')
+        assert response.headers['Cache-Control'] == f"private, max-age={app.config['ORDER_CACHE_MAX_AGE']}"
+
+    def test_if_none_match_returns_304(self, client):
+        """Test a client holding the current ETag gets an empty 304"""
+        order_number = _place_order(client)
+        etag = client.get(f'/api/orders/{order_number}').headers['ETag']
+        response = client.get(f'/api/orders/{order_number}', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+    def test_status_change_invalidates(self, client):
+        """Test a committed status transition is visible on the next lookup"""
+        order_number = _place_order(client)
+        etag = client.get(f'/api/orders/{order_number}').headers['ETag']
+        _set_status(order_number, 'shipped')
+        response = client.get(f'/api/orders/{order_number}', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['status'] == 'shipped'
+        assert response.headers['ETag'] != etag
+
+    def test_change_in_another_worker_not_served_stale(self, client, monkeypatch):
+        """Test a status changed without evicting this worker's entry is seen once checked"""
+        monkeypatch.setattr(order_cache, 'status_ttl', 0)
+        order_number = _place_order(client)
+        etag = client.get(f'/api/orders/{order_number}').headers['ETag']
+        _set_status_elsewhere(order_number, 'shipped')
+        response = client.get(f'/api/orders/{order_number}', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert json.loads(response.data)['status'] == 'shipped'
+        assert response.headers['ETag'] != etag
+
+    def test_final_status_served_without_check(self, client, monkeypatch):
+        """Test an order in a final status is answered from the cache alone"""
+        monkeypatch.setattr(order_cache, 'status_ttl', 0)
+        order_number = _place_order(client)
+        _set_status(order_number, 'refunded')
+        client.get(f'/api/orders/{order_number}')
+        # Not a real transition; only shows that the status is not read back
+        _set_status_elsewhere(order_number, 'cancelled')
+        response = client.get(f'/api/orders/{order_number}')
+        assert json.loads(response.data)['status'] == 'refunded'
+
+    def test_rolled_back_change_keeps_entry(self, client):
+        """Test an uncommitted status change does not evict the order"""
+        order_number = _place_order(client)
+        client.get(f'/api/orders/{order_number}')
+        with app.app_context():
+            Order.query.filter_by(order_number=order_number).one().status = 'cancelled'
+            db.session.flush()
+            db.session.rollback()
+        assert order_cache.get(order_number) is not None
+
+    def test_missing_orders_not_cached(self, client):
+        """Test 404s always reach the database"""
+        assert client.get('/api/orders/ORD-MISSING').status_code == 404
+        assert order_cache.get('ORD-MISSING') is None
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
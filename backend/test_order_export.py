@@ -0,0 +1,93 @@
+"""
+Test cases for the streaming order export
+Covers formats, filters, gzip and batched fetching
+"""
+import pytest
+import csv
+import gzip
+import io
+import json
+from app import app, db, export_rows, Order
+from datetime import datetime, timedelta
+
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+def seed_database():
+    """A few dozen orders"""
+    for i in range(25):
+        db.session.add(Order(
+            order_number=f'ORD-{i:04d}',
+            session_id=f'session-{i}',
+            total_amount=10.0 + i,
+            status='confirmed',
+            email='test@example.com',
+            payment_method='paypal',
+            shipping_address=f'{i} Comma, Street "Quoted"',
+            created_at=datetime(2024, 3, 1) + timedelta(days=i),
+        ))
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    yield transactional_client
+    app.config['ADMIN_API_TOKEN'] = None
+
+class TestOrderExport:
+    """Test cases for GET /api/orders/export"""
+
+    def test_requires_admin(self, client):
+        """Test the export is refused without the admin token"""
+        assert client.get('/api/orders/export').status_code == 401
+
+    def test_csv_export(self, client):
+        """Test CSV has a header and every order, oldest first, with quoting intact"""
+        response = client.get('/api/orders/export', headers=ADMIN)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert response.is_streamed
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert len(rows) == 25
+        assert rows[0]['order_number'] == 'ORD-0000'
+        assert rows[3]['shipping_address'] == '3 Comma, Street "Quoted"'
+        assert rows[0]['created_at'] == '2024-03-01T00:00:00'
+
+    def test_ndjson_export_with_date_range(self, client):
+        """Test NDJSON lines respect start_date and end_date"""
+        response = client.get('/api/orders/export', headers=ADMIN, query_string={
+            'format': 'ndjson', 'start_date': '2024-03-05', 'end_date': '2024-03-07'
+        })
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [line['order_number'] for line in lines] == ['ORD-0004', 'ORD-0005', 'ORD-0006']
+        assert lines[0]['total_amount'] == 14.0
+
+    def test_gzip_when_accepted(self, client):
+        """Test the stream is gzip-compressed for clients that accept it"""
+        response = client.get('/api/orders/export', headers={**ADMIN, 'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        text = gzip.decompress(response.data).decode()
+        assert len(text.splitlines()) == 26
+
+    def test_invalid_format_rejected(self, client):
+        """Test unknown formats are a 400"""
+        assert client.get('/api/orders/export?format=xml', headers=ADMIN).status_code == 400
+
+    def test_rows_fetched_in_batches(self, client):
+        """Test rows arrive in ORDER_EXPORT_BATCH-sized plain tuples"""
+        app.config['ORDER_EXPORT_BATCH'] = 10
+        try:
+            with app.app_context():
+                sizes = [len(batch) for batch in export_rows()]
+                assert len(db.session.identity_map) == 0
+        finally:
+            app.config['ORDER_EXPORT_BATCH'] = 1000
+        assert sizes == [10, 10, 5]
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
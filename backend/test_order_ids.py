@@ -0,0 +1,107 @@
+"""
+Test cases for the monotonic order number generator
+Covers ordering, encoding, slot leasing and multi-process uniqueness
+"""
+import pytest
+import multiprocessing
+import os
+import time
+from order_ids import OrderNumberGenerator, encode, decode, split_id, MAX_SLOT
+
+IDS_PER_PROCESS = 20000
+
+def _generate_in_child(slot_dir, queue):
+    generator = OrderNumberGenerator(node_id=3, slot_dir=slot_dir)
+    started = time.perf_counter()
+    numbers = [generator.next_order_number() for _ in range(IDS_PER_PROCESS)]
+    queue.put((numbers, IDS_PER_PROCESS / (time.perf_counter() - started)))
+
+def _lease_after_fork(generator, leased, release):
+    generator.slot
+    leased.set()
+    release.wait(10)
+
+class TestOrderNumberFormat:
+    """Test cases for the ID layout and its string form"""
+
+    def test_encoding_round_trip_and_order(self):
+        """Test fixed-width base32 preserves numeric order"""
+        values = [0, 1, 31, 32, 2 ** 40, 2 ** 62 + 12345, 2 ** 63 - 1]
+        encoded = [encode(v) for v in values]
+        assert all(len(e) == 13 for e in encoded)
+        assert encoded == sorted(encoded)
+        assert [decode(e) for e in encoded] == values
+
+    def test_ids_carry_time_node_and_slot(self, tmp_path):
+        """Test generated IDs decode back to their components"""
+        generator = OrderNumberGenerator(node_id=5, slot_dir=str(tmp_path))
+        before = int(time.time() * 1000)
+        timestamp, node, slot, _ = split_id(generator.next_id())
+        assert before <= timestamp <= int(time.time() * 1000)
+        assert node == 5
+        assert slot == 0
+
+    def test_order_numbers_short_and_increasing(self, tmp_path):
+        """Test numbers are compact and sort in generation order"""
+        generator = OrderNumberGenerator(slot_dir=str(tmp_path))
+        numbers = [generator.next_order_number() for _ in range(5000)]
+        assert all(n.startswith('ORD-') and len(n) == 17 for n in numbers)
+        assert numbers == sorted(numbers)
+        assert len(set(numbers)) == len(numbers)
+
+    def test_invalid_node_rejected(self):
+        """Test node IDs outside the 6-bit range are refused"""
+        with pytest.raises(ValueError):
+            OrderNumberGenerator(node_id=64)
+
+class TestSlotLeasing:
+    """Test cases for per-process slot allocation"""
+
+    def test_generators_lease_distinct_slots(self, tmp_path):
+        """Test two live generators on one node never share a slot"""
+        first = OrderNumberGenerator(slot_dir=str(tmp_path))
+        second = OrderNumberGenerator(slot_dir=str(tmp_path))
+        assert first.slot != second.slot
+
+    def test_exhausted_slots_raise(self, tmp_path):
+        """Test a clear error once every slot on the node is taken"""
+        generators = [OrderNumberGenerator(slot_dir=str(tmp_path)) for _ in range(MAX_SLOT + 1)]
+        assert sorted(g.slot for g in generators) == list(range(MAX_SLOT + 1))
+        with pytest.raises(RuntimeError):
+            OrderNumberGenerator(slot_dir=str(tmp_path)).next_id()
+
+    def test_forked_child_drops_parent_slot(self, tmp_path):
+        """Test a forked worker's slot file does not keep the parent's slot held"""
+        parent = OrderNumberGenerator(slot_dir=str(tmp_path))
+        parent_slot = parent.slot
+        ctx = multiprocessing.get_context('fork')
+        leased, release = ctx.Event(), ctx.Event()
+        child = ctx.Process(target=_lease_after_fork, args=(parent, leased, release))
+        child.start()
+        try:
+            assert leased.wait(10)
+            os.close(parent._slot_fd)  # the parent exits
+            assert OrderNumberGenerator(slot_dir=str(tmp_path)).slot == parent_slot
+        finally:
+            release.set()
+            child.join()
+
+    def test_unique_and_fast_across_processes(self, tmp_path):
+        """Test worker processes generating concurrently never collide"""
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        workers = [ctx.Process(target=_generate_in_child, args=(str(tmp_path), queue)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        results = [queue.get(timeout=60) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        all_numbers = [n for numbers, _ in results for n in numbers]
+        assert len(set(all_numbers)) == 4 * IDS_PER_PROCESS
+        for numbers, rate in results:
+            assert numbers == sorted(numbers)
+            assert rate > 10000  # IDs per second per process, no DB round trip
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,129 @@
+"""
+Test cases for the paginated order listing
+Covers access, filters, keyset pagination and index usage
+"""
+import pytest
+import json
+from app import app, db, order_listing_query, Order
+from datetime import datetime, timedelta
+
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+def seed_database():
+    """Orders spread over two months"""
+    start = datetime(2024, 5, 1, 12, 0)
+    for i in range(30):
+        db.session.add(Order(
+            order_number=f'ORD-{i:04d}',
+            session_id='alice' if i % 2 == 0 else 'bob',
+            total_amount=10.0 + i,
+            status='shipped' if i % 3 == 0 else 'confirmed',
+            email='test@example.com',
+            payment_method='paypal',
+            # Pairs share a timestamp so pagination must break ties on id
+            created_at=start + timedelta(days=i // 2),
+        ))
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    yield transactional_client
+    app.config['ADMIN_API_TOKEN'] = None
+
+def _list(client, headers=None, **params):
+    response = client.get('/api/orders', query_string=params, headers=headers)
+    return response.status_code, json.loads(response.data)
+
+def _numbers(data):
+    return [order['order_number'] for order in data['orders']]
+
+class TestOrderListingAccess:
+    """Test cases for who may list which orders"""
+
+    def test_requires_session_or_admin(self, client):
+        """Test anonymous store-wide listing is refused"""
+        status, _ = _list(client)
+        assert status == 401
+        status, _ = _list(client, headers={'Authorization': 'Bearer wrong'})
+        assert status == 401
+
+    def test_session_sees_only_its_orders(self, client):
+        """Test a session lists its own orders, newest first"""
+        status, data = _list(client, session_id='alice', limit=100)
+        assert status == 200
+        assert len(data['orders']) == 15
+        assert _numbers(data)[0] == 'ORD-0028'
+        assert data['next_cursor'] is None
+
+    def test_admin_sees_all_orders(self, client):
+        """Test the admin token lists orders from every session"""
+        status, data = _list(client, headers=ADMIN, limit=100)
+        assert status == 200
+        assert len(data['orders']) == 30
+
+class TestOrderListingFilters:
+    """Test cases for status and date filters"""
+
+    def test_status_filter(self, client):
+        """Test only orders in the requested status are returned"""
+        _, data = _list(client, headers=ADMIN, status='shipped', limit=100)
+        assert len(data['orders']) == 10
+        assert all(order['status'] == 'shipped' for order in data['orders'])
+
+    def test_date_range_inclusive(self, client):
+        """Test start_date and end_date both include their whole day"""
+        _, data = _list(client, headers=ADMIN, start_date='2024-05-02', end_date='2024-05-03', limit=100)
+        assert sorted(_numbers(data)) == ['ORD-0002', 'ORD-0003', 'ORD-0004', 'ORD-0005']
+
+    def test_invalid_parameters_rejected(self, client):
+        """Test malformed dates and cursors are a 400"""
+        assert _list(client, headers=ADMIN, start_date='yesterday')[0] == 400
+        assert _list(client, headers=ADMIN, cursor='not-a-cursor')[0] == 400
+
+class TestKeysetPagination:
+    """Test cases for cursor-based paging"""
+
+    def test_pages_cover_every_order_once(self, client):
+        """Test walking the cursor returns each order exactly once in order"""
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 7, 'status': 'confirmed'}
+            if cursor:
+                params['cursor'] = cursor
+            _, data = _list(client, headers=ADMIN, **params)
+            seen.extend(_numbers(data))
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = [f'ORD-{i:04d}' for i in reversed(range(30)) if i % 3 != 0]
+        assert seen == expected
+
+    def test_limit_clamped(self, client):
+        """Test page size cannot exceed ORDER_PAGE_SIZE_MAX"""
+        _, data = _list(client, headers=ADMIN, limit=10000)
+        assert data['limit'] == app.config['ORDER_PAGE_SIZE_MAX']
+
+    def test_queries_use_listing_indexes(self, client):
+        """Test every filter combination seeks an index with no sort step"""
+        cursor = (datetime(2024, 5, 10), 20)
+        combinations = [
+            {}, {'status': 'shipped'}, {'session_id': 'alice'},
+            {'start': datetime(2024, 5, 1), 'end': datetime(2024, 6, 1)},
+            {'status': 'confirmed', 'after': cursor}, {'session_id': 'bob', 'after': cursor},
+        ]
+        with app.app_context():
+            for filters in combinations:
+                statement = order_listing_query(**filters).limit(21).statement
+                sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+                plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+                assert 'USING INDEX ix_order_' in plan, (filters, plan)
+                assert 'TEMP B-TREE' not in plan, (filters, plan)
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,57 @@
+"""
+Test cases for per-worker test databases
+Covers building the template, cloning it per worker and cleaning up
+"""
+import pytest
+import os
+from sqlalchemy import create_engine, inspect, text
+from app import db
+import testdb
+
+@pytest.fixture
+def template():
+    """Build a SQLite template with the app's schema"""
+    url = testdb.build_template(db.metadata)
+    yield url
+    testdb.discard(url)
+
+def _count(url, table):
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+    finally:
+        engine.dispose()
+
+class TestWorkerDatabases:
+    """Test cases for cloning a template per xdist worker"""
+
+    def test_template_has_schema(self, template):
+        """Test the template holds every table of the app"""
+        engine = create_engine(template)
+        try:
+            assert set(inspect(engine).get_table_names()) == set(db.metadata.tables)
+        finally:
+            engine.dispose()
+
+    def test_workers_get_independent_copies(self, template):
+        """Test a write in one worker's database is invisible to another"""
+        first = testdb.clone_for_worker(template, 'gw0')
+        second = testdb.clone_for_worker(template, 'gw1')
+        engine = create_engine(first)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO product (name, price, stock) VALUES ('Only gw0', 1, 1)"))
+        engine.dispose()
+        assert _count(first, 'product') == 1
+        assert _count(second, 'product') == 0
+
+    def test_discard_removes_files(self, template):
+        """Test worker files and the template directory are cleaned up"""
+        clone = testdb.clone_for_worker(template, 'gw0')
+        testdb.discard(clone)
+        assert not os.path.exists(clone[len('sqlite:///'):])
+        testdb.discard(template)
+        assert not os.path.exists(os.path.dirname(template[len('sqlite:///'):]))
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
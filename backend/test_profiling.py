@@ -0,0 +1,151 @@
+"""
+Test cases for on-demand request profiling
+Covers signed header selection, sampling, output files and the aggregate views
+"""
+import pytest
+import json
+import os
+import time
+from flask import Flask
+from app import app, profiler
+from profiling import RequestProfiler, sign_profile_token, verify_profile_token
+
+SECRET = 'profile-secret'
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def _make_app(tmp_path, **config):
+    flask_app = Flask(__name__)
+    flask_app.config.update(PROFILE_ENABLED=True, PROFILE_SECRET=SECRET, PROFILE_DIR=str(tmp_path), **config)
+
+    @flask_app.route('/work')
+    def work():
+        _busy(0.02)
+        return 'done'
+
+    return flask_app, RequestProfiler(flask_app)
+
+@pytest.fixture
+def admin_client(tmp_path):
+    """Client for the shop app reading profiles from a temporary directory"""
+    app.config['TESTING'] = True
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    saved_dir = app.config['PROFILE_DIR']
+    app.config['PROFILE_DIR'] = str(tmp_path)
+    with app.test_client() as client:
+        yield client
+    app.config['PROFILE_DIR'] = saved_dir
+    app.config['ADMIN_API_TOKEN'] = None
+
+class TestTokens:
+    """Test cases for the signed X-Profile header"""
+
+    def test_valid_token_accepted(self):
+        """Test a freshly signed token verifies"""
+        assert verify_profile_token(SECRET, sign_profile_token(SECRET, ttl=60))
+
+    def test_expired_or_forged_tokens_rejected(self):
+        """Test expired, tampered and unsigned tokens are refused"""
+        expired = sign_profile_token(SECRET, ttl=60, now=time.time() - 120)
+        assert not verify_profile_token(SECRET, expired)
+        assert not verify_profile_token('other-secret', sign_profile_token(SECRET))
+        assert not verify_profile_token(SECRET, '9999999999:deadbeef')
+        assert not verify_profile_token(None, sign_profile_token(SECRET))
+
+class TestRequestProfiler:
+    """Test cases for selecting and recording requests"""
+
+    def test_disabled_registers_no_hooks(self):
+        """Test a disabled profiler adds nothing to the request path"""
+        flask_app = Flask(__name__)
+        RequestProfiler(flask_app)
+        assert not flask_app.before_request_funcs
+        assert not flask_app.teardown_request_funcs
+
+    def test_unsigned_request_not_profiled(self, tmp_path):
+        """Test requests without a token are left alone at sample rate 0"""
+        flask_app, _ = _make_app(tmp_path)
+        response = flask_app.test_client().get('/work')
+        assert 'X-Profile-Id' not in response.headers
+        assert os.listdir(tmp_path) == []
+
+    def test_signed_request_writes_collapsed_stacks(self, tmp_path):
+        """Test a signed request produces a flamegraph-ready file"""
+        flask_app, _ = _make_app(tmp_path)
+        response = flask_app.test_client().get('/work', headers={'X-Profile': sign_profile_token(SECRET)})
+        profile_id = response.headers['X-Profile-Id']
+        assert profile_id.startswith('work/')
+        with open(tmp_path / f'{profile_id}.collapsed') as f:
+            lines = f.read().splitlines()
+        assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+        assert any('_busy' in line for line in lines)
+
+    def test_pstats_format(self, tmp_path):
+        """Test cProfile output is written and merged across requests"""
+        flask_app, recorder = _make_app(tmp_path, PROFILE_FORMAT='pstats')
+        client = flask_app.test_client()
+        for _ in range(2):
+            client.get('/work', headers={'X-Profile': sign_profile_token(SECRET)})
+        assert recorder.summary() == {'work': {'collapsed': 0, 'pstats': 2}}
+        assert '_busy' in recorder.aggregate_pstats('work')
+
+    def test_sampling_rate(self, tmp_path):
+        """Test a sample rate of 1 profiles every request without a header"""
+        flask_app, recorder = _make_app(tmp_path, PROFILE_SAMPLE_RATE=1.0)
+        client = flask_app.test_client()
+        for _ in range(3):
+            client.get('/work')
+        assert recorder.summary()['work']['collapsed'] == 3
+
+    def test_old_profiles_pruned(self, tmp_path):
+        """Test each endpoint keeps at most PROFILE_MAX_FILES profiles"""
+        flask_app, recorder = _make_app(tmp_path, PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_FILES=2)
+        client = flask_app.test_client()
+        for _ in range(4):
+            client.get('/work')
+        assert recorder.summary()['work']['collapsed'] == 2
+
+    def test_unknown_format_rejected(self, tmp_path):
+        """Test a typo in PROFILE_FORMAT fails at startup"""
+        with pytest.raises(ValueError):
+            _make_app(tmp_path, PROFILE_FORMAT='flame')
+
+class TestAggregateEndpoints:
+    """Test cases for the admin views over stored profiles"""
+
+    def _store(self, tmp_path, *lines):
+        directory = tmp_path / 'checkout'
+        directory.mkdir(exist_ok=True)
+        for index, text in enumerate(lines):
+            (directory / f'{index}-1-0.collapsed').write_text(text)
+
+    def test_admin_token_required(self, admin_client):
+        """Test profiles are not public"""
+        assert admin_client.get('/api/admin/profiles', headers={}).status_code == 401
+
+    def test_collapsed_stacks_summed(self, admin_client, tmp_path):
+        """Test stacks from several requests and workers are merged"""
+        self._store(tmp_path, 'main;checkout;commit 3\nmain;checkout 1\n', 'main;checkout;commit 2\n')
+        listing = json.loads(admin_client.get('/api/admin/profiles', headers=ADMIN).data)
+        assert listing['endpoints'] == {'checkout': {'collapsed': 2, 'pstats': 0}}
+        response = admin_client.get('/api/admin/profiles/checkout', headers=ADMIN)
+        assert response.data.decode().splitlines() == ['main;checkout;commit 5', 'main;checkout 1']
+
+    def test_unknown_endpoint_and_format(self, admin_client, tmp_path):
+        """Test missing endpoints are 404 and unknown formats 400"""
+        self._store(tmp_path, 'main 1\n')
+        assert admin_client.get('/api/admin/profiles/get_products', headers=ADMIN).status_code == 404
+        assert admin_client.get('/api/admin/profiles/..', headers=ADMIN).status_code == 404
+        response = admin_client.get('/api/admin/profiles/checkout?format=svg', headers=ADMIN)
+        assert response.status_code == 400
+
+    def test_profiling_off_by_default(self):
+        """Test the shop app registers no profiling hooks unless enabled"""
+        assert profiler._start not in app.before_request_funcs.get(None, [])
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
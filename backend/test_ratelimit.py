@@ -0,0 +1,144 @@
+"""
+Test cases for token-bucket rate limiting
+Covers bucket math, shared-memory storage across processes and HTTP behaviour
+"""
+import pytest
+import json
+import multiprocessing
+import time
+from flask import Flask, jsonify
+from ratelimit import RateLimiter, MemoryStorage, SharedMemoryStorage, parse_rate
+
+def _limited_app(**config):
+    """Build a minimal app guarded by the limiter"""
+    app = Flask(__name__)
+    app.config.update(
+        RATELIMIT_DEFAULT='5/minute',
+        RATELIMIT_ROUTES={'/api/checkout': '2/minute'},
+        **config
+    )
+    RateLimiter(app)
+
+    @app.route('/api/products')
+    def products():
+        return jsonify([])
+
+    @app.route('/api/checkout', methods=['POST'])
+    def checkout():
+        return jsonify({'status': 'confirmed'}), 201
+
+    @app.route('/api/health')
+    def health():
+        return jsonify({'status': 'healthy'})
+
+    return app
+
+def _consume_in_child(path, count, queue):
+    storage = SharedMemoryStorage(path, slots=64)
+    allowed = sum(storage.consume('shared', 10, 0.0001, time.time())[0] for _ in range(count))
+    queue.put(allowed)
+
+class TestTokenBucket:
+    """Test cases for bucket arithmetic and storage backends"""
+
+    def test_parse_rate(self):
+        """Test rate strings convert to capacity and refill per second"""
+        assert parse_rate('10/minute') == (10, 10 / 60)
+        assert parse_rate('2/second') == (2, 2.0)
+        with pytest.raises(ValueError):
+            parse_rate('10/fortnight')
+
+    def test_bucket_refills_over_time(self):
+        """Test an empty bucket regains tokens at the refill rate"""
+        storage = MemoryStorage()
+        now = 1000.0
+        assert storage.consume('k', 2, 1.0, now) == (True, 1.0)
+        assert storage.consume('k', 2, 1.0, now) == (True, 0.0)
+        assert storage.consume('k', 2, 1.0, now)[0] is False
+        assert storage.consume('k', 2, 1.0, now + 1.0)[0] is True
+
+    def test_shared_memory_storage_persists_between_instances(self, tmp_path):
+        """Test two handles on the same file see one bucket"""
+        path = str(tmp_path / 'buckets')
+        first = SharedMemoryStorage(path, slots=64)
+        second = SharedMemoryStorage(path, slots=64)
+        now = time.time()
+        first.consume('client', 2, 0.0001, now)
+        first.consume('client', 2, 0.0001, now)
+        assert second.consume('client', 2, 0.0001, now)[0] is False
+        assert second.consume('other', 2, 0.0001, now)[0] is True
+
+    def test_shared_memory_storage_across_processes(self, tmp_path):
+        """Test concurrent worker processes never hand out more than capacity"""
+        path = str(tmp_path / 'buckets')
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        workers = [ctx.Process(target=_consume_in_child, args=(path, 10, queue)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert sum(queue.get() for _ in workers) == 10
+
+    def test_shared_memory_storage_evicts_when_full(self, tmp_path):
+        """Test the slot table never grows past its fixed size"""
+        storage = SharedMemoryStorage(str(tmp_path / 'buckets'), slots=8)
+        now = time.time()
+        for i in range(100):
+            assert storage.consume(f'client-{i}', 1, 0.0001, now)[0] is True
+
+class TestRateLimitedRoutes:
+    """Test cases for 429 responses and rate limit headers"""
+
+    def test_rate_limit_headers(self):
+        """Test X-RateLimit-* headers on allowed responses"""
+        client = _limited_app().test_client()
+        response = client.get('/api/products')
+        assert response.status_code == 200
+        assert response.headers['X-RateLimit-Limit'] == '5'
+        assert response.headers['X-RateLimit-Remaining'] == '4'
+        assert int(response.headers['X-RateLimit-Reset']) >= int(time.time())
+
+    def test_rate_limit_exceeded(self):
+        """Test requests beyond the budget get 429 with Retry-After"""
+        client = _limited_app().test_client()
+        statuses = [client.get('/api/products').status_code for _ in range(6)]
+        assert statuses == [200] * 5 + [429]
+        response = client.get('/api/products')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert 'rate limit' in json.loads(response.data)['error'].lower()
+
+    def test_checkout_has_stricter_budget(self):
+        """Test per-route budgets apply independently of the default"""
+        client = _limited_app().test_client()
+        statuses = [client.post('/api/checkout', json={'session_id': 's1'}).status_code for _ in range(3)]
+        assert statuses == [201, 201, 429]
+        assert client.get('/api/products').status_code == 200
+
+    def test_session_bucket_limits_across_addresses(self):
+        """Test one session is limited even when it rotates IP addresses"""
+        client = _limited_app().test_client()
+        for i in range(2):
+            response = client.post('/api/checkout', json={'session_id': 'abuser'},
+                                   environ_base={'REMOTE_ADDR': f'10.0.0.{i}'})
+            assert response.status_code == 201
+        response = client.post('/api/checkout', json={'session_id': 'abuser'},
+                               environ_base={'REMOTE_ADDR': '10.0.0.9'})
+        assert response.status_code == 429
+
+    def test_health_check_is_exempt(self):
+        """Test monitoring endpoints are never rate limited"""
+        client = _limited_app().test_client()
+        statuses = [client.get('/api/health').status_code for _ in range(10)]
+        assert statuses == [200] * 10
+        assert 'X-RateLimit-Limit' not in client.get('/api/health').headers
+
+    def test_disabled_limiter_passes_everything(self):
+        """Test RATELIMIT_ENABLED=False turns the limiter off"""
+        client = _limited_app(RATELIMIT_ENABLED=False).test_client()
+        statuses = [client.get('/api/products').status_code for _ in range(10)]
+        assert statuses == [200] * 10
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
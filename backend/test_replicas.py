@@ -0,0 +1,124 @@
+"""
+Test cases for read-replica routing
+Uses two SQLite files as primary and replica; the replica is never
+written by the app, so reads that reach it see its own seed data
+"""
+import pytest
+import json
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import app, db, replicas, Product, CartItem
+
+@pytest.fixture(scope='module')
+def seed():
+    """The primary's one product"""
+    return lambda: db.session.add(Product(name='Primary Product', price=10.0, stock=5))
+
+@pytest.fixture
+def client(transactional_client, tmp_path):
+    """Create test client with a replica database beside the primary"""
+    replica_url = f'sqlite:///{tmp_path}/replica.db'
+    replica_engine = create_engine(replica_url)
+    db.metadata.create_all(replica_engine)
+    with Session(replica_engine) as session:
+        session.add(Product(name='Replica Product', price=10.0, stock=5))
+        session.commit()
+    replica_engine.dispose()
+
+    app.config['DB_REPLICA_URLS'] = [replica_url]
+    yield transactional_client
+    app.config['DB_REPLICA_URLS'] = []
+    app.config['DB_PIN_SECONDS'] = 5
+    replicas.dispose()
+    replicas.pins.reset()
+
+def _product_names(client):
+    return [p['name'] for p in json.loads(client.get('/api/products').data)]
+
+def _reads():
+    return replicas.metrics()['reads']
+
+class TestReplicaRouting:
+    """Test cases for which database serves which request"""
+
+    def test_read_routes_use_replica(self, client):
+        """Test catalog reads are answered by the replica"""
+        before = _reads()['replica']
+        assert _product_names(client) == ['Replica Product']
+        assert client.get('/api/health').status_code == 200
+        assert _reads()['replica'] == before + 2
+
+    def test_writes_go_to_primary(self, client):
+        """Test cart writes land on the primary only"""
+        response = client.post('/api/cart/add', json={'session_id': 'writer', 'product_id': 1, 'quantity': 2})
+        assert response.status_code == 201
+        with app.app_context():
+            assert CartItem.query.filter_by(session_id='writer').one().quantity == 2
+
+    def test_other_routes_stay_on_primary(self, client):
+        """Test endpoints outside DB_REPLICA_ROUTES read the primary"""
+        client.post('/api/cart/add', json={'session_id': 'lister', 'product_id': 1})
+        client.post('/api/checkout', json={
+            'session_id': 'lister', 'email': 'test@example.com', 'payment_method': 'paypal'
+        })
+        data = json.loads(client.get('/api/orders?session_id=lister').data)
+        assert len(data['orders']) == 1
+
+    def test_disabled_without_replica_urls(self, client):
+        """Test everything reads the primary when no replicas are configured"""
+        app.config['DB_REPLICA_URLS'] = []
+        assert _product_names(client) == ['Primary Product']
+
+class TestReadYourWrites:
+    """Test cases for pinning a session to the primary after it writes"""
+
+    def test_cart_read_after_write_sees_write(self, client):
+        """Test a session's cart read right after adding is served by the primary"""
+        before = _reads()['pinned']
+        client.post('/api/cart/add', json={'session_id': 'shopper', 'product_id': 1, 'quantity': 3})
+        cart = json.loads(client.get('/api/cart?session_id=shopper').data)
+        assert cart['item_count'] == 1
+        assert cart['items'][0]['product_name'] == 'Primary Product'
+        assert _reads()['pinned'] == before + 1
+
+    def test_other_sessions_not_pinned(self, client):
+        """Test one session's write does not pin anybody else"""
+        client.post('/api/cart/add', json={'session_id': 'shopper', 'product_id': 1})
+        before = _reads()['replica']
+        client.get('/api/cart?session_id=someone-else')
+        assert _reads()['replica'] == before + 1
+
+    def test_pin_expires(self, client):
+        """Test reads return to the replica once the pin window passes"""
+        app.config['DB_PIN_SECONDS'] = 0.2
+        client.post('/api/cart/add', json={'session_id': 'shopper', 'product_id': 1})
+        time.sleep(0.3)
+        cart = json.loads(client.get('/api/cart?session_id=shopper').data)
+        # The stand-in replica never receives the write
+        assert cart['item_count'] == 0
+
+    def test_failed_write_does_not_pin(self, client):
+        """Test rejected requests leave the session on the replica"""
+        client.post('/api/cart/add', json={'session_id': 'shopper', 'product_id': 999})
+        assert not replicas.is_pinned('shopper')
+
+    def test_new_order_found_despite_lag(self, client):
+        """Test an order missing on the replica is read from the primary"""
+        client.post('/api/cart/add', json={'session_id': 'buyer', 'product_id': 1})
+        order = json.loads(client.post('/api/checkout', json={
+            'session_id': 'buyer', 'email': 'test@example.com', 'payment_method': 'paypal'
+        }).data)
+        before = _reads()['fallback']
+        response = client.get(f"/api/orders/{order['order_number']}")
+        assert response.status_code == 200
+        assert _reads()['fallback'] == before + 1
+
+    def test_routing_in_metrics(self, client):
+        """Test replica counters are exposed on /api/metrics"""
+        data = json.loads(client.get('/api/metrics').data)
+        assert data['replicas']['replicas'] == 1
+        assert set(data['replicas']['reads']) == {'replica', 'pinned', 'fallback', 'pins'}
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,161 @@
+"""
+Test cases for time-limited stock reservations
+Covers holds at add-to-cart, release, expiry sweeping and conversion at checkout
+"""
+import pytest
+import json
+from app import (app, db, jobs, Product, CartItem, StockReservation,
+                 release_expired_reservations)
+from datetime import datetime, timedelta
+
+def seed_database():
+    """Rows every test starts from"""
+    db.session.add_all([
+        Product(name='Limited Stock', price=75.0, stock=2),
+        Product(name='Plenty', price=10.0, stock=100),
+    ])
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
+
+def _add(client, session_id, product_id=1, quantity=1):
+    return client.post('/api/cart/add', json={
+        'session_id': session_id, 'product_id': product_id, 'quantity': quantity
+    })
+
+def _checkout(client, session_id):
+    return client.post('/api/checkout', json={
+        'session_id': session_id,
+        'email': 'test@example.com',
+        'payment_method': 'paypal',
+        'shipping_address': '123 Test St'
+    })
+
+def _product(product_id=1):
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        return product.stock, product.reserved
+
+def _expire_holds():
+    with app.app_context():
+        for hold in StockReservation.query.all():
+            hold.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+class TestReservationHolds:
+    """Test cases for holds taken and released by cart changes"""
+
+    def test_add_to_cart_reserves_stock(self, client):
+        """Test adding to cart holds the units for that session"""
+        assert _add(client, 'holder', quantity=2).status_code == 201
+        assert _product() == (2, 2)
+
+        products = json.loads(client.get('/api/products').data)
+        assert products[0]['stock'] == 2
+        assert products[0]['available'] == 0
+
+    def test_held_stock_unavailable_to_other_sessions(self, client):
+        """Test a second shopper cannot put held stock in their cart"""
+        _add(client, 'holder', quantity=2)
+        response = _add(client, 'other', quantity=1)
+        assert response.status_code == 400
+        assert 'stock' in json.loads(response.data)['error'].lower()
+
+    def test_remove_releases_hold(self, client):
+        """Test removing a cart line releases its units"""
+        _add(client, 'holder', quantity=2)
+        cart = json.loads(client.get('/api/cart?session_id=holder').data)
+        client.post('/api/cart/remove', json={'session_id': 'holder', 'item_id': cart['items'][0]['id']})
+        assert _product() == (2, 0)
+        assert _add(client, 'other', quantity=2).status_code == 201
+
+    def test_update_adjusts_hold(self, client):
+        """Test changing quantity grows and shrinks the hold"""
+        _add(client, 'holder', product_id=2, quantity=5)
+        cart = json.loads(client.get('/api/cart?session_id=holder').data)
+        item_id = cart['items'][0]['id']
+        client.post('/api/cart/update', json={'session_id': 'holder', 'item_id': item_id, 'quantity': 8})
+        assert _product(2) == (100, 8)
+        client.post('/api/cart/update', json={'session_id': 'holder', 'item_id': item_id, 'quantity': 3})
+        assert _product(2) == (100, 3)
+
+class TestReservationExpiry:
+    """Test cases for the expired-hold sweeper"""
+
+    def test_sweeper_releases_expired_holds(self, client):
+        """Test expired holds are deleted and their units made available"""
+        _add(client, 'holder', quantity=2)
+        _expire_holds()
+        with app.app_context():
+            assert release_expired_reservations() == {'released': 1}
+            assert StockReservation.query.count() == 0
+        assert _product() == (2, 0)
+        assert _add(client, 'other', quantity=2).status_code == 201
+
+    def test_sweeper_works_in_batches(self, client):
+        """Test more expired holds than one batch are all released"""
+        for i in range(5):
+            _add(client, f'shopper-{i}', product_id=2, quantity=3)
+        _expire_holds()
+        with app.app_context():
+            assert release_expired_reservations(batch_size=2) == {'released': 5}
+        assert _product(2) == (100, 0)
+
+    def test_sweeper_keeps_active_holds(self, client):
+        """Test holds that have not expired are left alone"""
+        _add(client, 'holder', quantity=1)
+        with app.app_context():
+            assert release_expired_reservations() == {'released': 0}
+        assert _product() == (2, 1)
+
+    def test_sweeper_registered_as_job(self, client):
+        """Test the sweeper runs through the periodic job runner"""
+        _add(client, 'holder', quantity=1)
+        _expire_holds()
+        assert jobs.run('release_expired_reservations') == {'released': 1}
+        assert jobs.metrics()['release_expired_reservations']['last_result'] == {'released': 1}
+
+class TestReservationCheckout:
+    """Test cases for converting holds into sales"""
+
+    def test_checkout_converts_hold(self, client):
+        """Test checkout decrements stock and clears the hold"""
+        _add(client, 'buyer', quantity=2)
+        assert _checkout(client, 'buyer').status_code == 201
+        assert _product() == (0, 0)
+        with app.app_context():
+            assert StockReservation.query.count() == 0
+
+    def test_checkout_after_expiry_when_stock_remains(self, client):
+        """Test an expired hold still converts if nobody took the stock"""
+        _add(client, 'buyer', quantity=2)
+        _expire_holds()
+        assert _checkout(client, 'buyer').status_code == 201
+        assert _product() == (0, 0)
+
+    def test_checkout_after_expiry_when_stock_taken(self, client):
+        """Test an expired hold fails cleanly once another shopper bought the stock"""
+        _add(client, 'slow', quantity=2)
+        _expire_holds()
+        with app.app_context():
+            release_expired_reservations()
+        _add(client, 'fast', quantity=2)
+        assert _checkout(client, 'fast').status_code == 201
+
+        response = _checkout(client, 'slow')
+        assert response.status_code == 400
+        assert 'insufficient stock' in json.loads(response.data)['error'].lower()
+        assert _product() == (0, 0)
+        with app.app_context():
+            # Nothing from the failed checkout was committed
+            assert CartItem.query.filter_by(session_id='slow').count() == 1
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
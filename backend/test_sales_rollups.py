@@ -0,0 +1,142 @@
+"""
+Test cases for incrementally maintained sales rollups
+Covers checkout updates, the report endpoint and the backfill command
+"""
+import pytest
+import json
+from app import (app, db, Product, DiscountCode, Order, HourlySalesRollup, DailySalesRollup,
+                 backfill_sales_rollups)
+from datetime import datetime
+
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+def seed_database():
+    """Rows every test starts from"""
+    db.session.add_all([
+        Product(name='Widget', price=100.0, stock=100),
+        Product(name='Scarce', price=10.0, stock=1),
+        DiscountCode(code='SAVE10', discount_percent=10.0, is_active=True),
+    ])
+
+@pytest.fixture(scope='module')
+def seed():
+    """Schema and seed data are built once for this module"""
+    return seed_database
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    yield transactional_client
+    app.config['ADMIN_API_TOKEN'] = None
+
+def _checkout(client, session_id, payment_method='paypal', discount_code=None, product_id=1):
+    client.post('/api/cart/add', json={'session_id': session_id, 'product_id': product_id, 'quantity': 1})
+    payload = {
+        'session_id': session_id,
+        'email': 'test@example.com',
+        'payment_method': payment_method,
+        'shipping_address': '123 Test St'
+    }
+    if payment_method == 'card':
+        payload.update({'card_number': '4111111111111111', 'cvv': '123', 'expiry_date': '12/25'})
+    if discount_code:
+        payload['discount_code'] = discount_code
+    return client.post('/api/checkout', json=payload)
+
+def _rollup_rows(model):
+    with app.app_context():
+        return sorted(
+            (r.payment_method, r.discount_code, r.orders, round(r.gross, 2), round(r.discount, 2), round(r.net, 2))
+            for r in model.query.all()
+        )
+
+class TestCheckoutRollups:
+    """Test cases for rollups written by checkout"""
+
+    def test_checkout_updates_hourly_and_daily(self, client):
+        """Test each order lands in both grains, split by method and code"""
+        _checkout(client, 'a')
+        _checkout(client, 'b', discount_code='save10')
+        _checkout(client, 'c', payment_method='card')
+        expected = [('card', '', 1, 100.0, 0.0, 100.0),
+                    ('paypal', '', 1, 100.0, 0.0, 100.0),
+                    ('paypal', 'SAVE10', 1, 100.0, 10.0, 90.0)]
+        assert _rollup_rows(HourlySalesRollup) == expected
+        assert _rollup_rows(DailySalesRollup) == expected
+
+    def test_repeat_orders_increment_bucket(self, client):
+        """Test orders in the same bucket add to one row"""
+        for session_id in ('a', 'b', 'c'):
+            _checkout(client, session_id)
+        assert _rollup_rows(DailySalesRollup) == [('paypal', '', 3, 300.0, 0.0, 300.0)]
+
+    def test_failed_checkout_not_counted(self, client):
+        """Test rollups roll back with a checkout that fails on stock"""
+        client.post('/api/cart/add', json={'session_id': 'slow', 'product_id': 2, 'quantity': 1})
+        with app.app_context():
+            db.session.get(Product, 2).stock = 0
+            db.session.commit()
+        assert _checkout(client, 'slow', product_id=2).status_code == 400
+        assert _rollup_rows(DailySalesRollup) == []
+
+class TestSalesReport:
+    """Test cases for GET /api/reports/sales"""
+
+    def test_report_reads_rollups(self, client):
+        """Test totals and per-method groups come from the rollup tables"""
+        _checkout(client, 'a')
+        _checkout(client, 'b', payment_method='card', discount_code='SAVE10')
+        response = client.get('/api/reports/sales?group_by=payment_method', headers=ADMIN)
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['totals'] == {'orders': 2, 'gross': 200.0, 'discount': 10.0, 'net': 190.0}
+        assert {r['payment_method']: r['net'] for r in data['rows']} == {'card': 90.0, 'paypal': 100.0}
+
+    def test_report_requires_admin_and_valid_grain(self, client):
+        """Test access and parameter checks"""
+        assert client.get('/api/reports/sales').status_code == 401
+        assert client.get('/api/reports/sales?grain=week', headers=ADMIN).status_code == 400
+
+class TestBackfill:
+    """Test cases for rebuilding rollups from order history"""
+
+    def _add_history(self):
+        with app.app_context():
+            for i, (day, hour) in enumerate([(1, 9), (1, 9), (1, 15), (2, 10), (3, 11)]):
+                db.session.add(Order(
+                    order_number=f'ORD-HIST{i}', session_id='history', total_amount=45.0,
+                    discount_amount=5.0, discount_code='SAVE10', status='confirmed',
+                    email='test@example.com', payment_method='card',
+                    created_at=datetime(2024, 6, day, hour, 30),
+                ))
+            db.session.commit()
+
+    def test_backfill_matches_history(self, client):
+        """Test a full rebuild produces the buckets checkout would have"""
+        self._add_history()
+        with app.app_context():
+            assert backfill_sales_rollups() == {'orders': 5, 'buckets': 7}
+            hourly = {(r.bucket_start, r.orders) for r in HourlySalesRollup.query.all()}
+            daily = {r.bucket_start: (r.orders, r.gross, r.net) for r in DailySalesRollup.query.all()}
+        assert (datetime(2024, 6, 1, 9), 2) in hourly
+        assert daily[datetime(2024, 6, 1)] == (3, 150.0, 135.0)
+
+    def test_backfill_range_is_idempotent(self, client):
+        """Test rebuilding a range twice replaces rather than doubles it"""
+        self._add_history()
+        with app.app_context():
+            backfill_sales_rollups()
+            backfill_sales_rollups(datetime(2024, 6, 2), datetime(2024, 6, 2))
+            daily = {r.bucket_start: r.orders for r in DailySalesRollup.query.all()}
+        assert daily == {datetime(2024, 6, 1): 3, datetime(2024, 6, 2): 1, datetime(2024, 6, 3): 1}
+
+    def test_cli_command(self, client):
+        """Test `flask backfill-rollups` runs the rebuild"""
+        self._add_history()
+        result = app.test_cli_runner().invoke(args=['backfill-rollups', '--start', '2024-06-01'])
+        assert result.exit_code == 0
+        assert 'from 5 orders' in result.output
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
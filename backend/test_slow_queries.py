@@ -0,0 +1,139 @@
+"""
+Test cases for the slow-query log
+Covers SQL normalization, parameter redaction, EXPLAIN capture and the admin endpoint
+"""
+import pytest
+import json
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from app import app, db, slow_queries, Product
+from slow_queries import SlowQueryLog, normalize_sql, redact_parameters
+
+ADMIN = {'Authorization': 'Bearer test-admin-token'}
+
+@pytest.fixture(scope='module')
+def seed():
+    """One product to query"""
+    return lambda: db.session.add(Product(name='Widget', price=10.0, stock=5))
+
+@pytest.fixture
+def client(transactional_client):
+    """Test client with every statement counted as slow; changes are rolled back"""
+    app.config['ADMIN_API_TOKEN'] = 'test-admin-token'
+    with app.app_context():
+        slow_queries.threshold = 0
+        slow_queries.enable(db.engine)
+    yield transactional_client
+    slow_queries.disable()
+    slow_queries.reset()
+    slow_queries.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+    app.config['ADMIN_API_TOKEN'] = None
+
+def _report(client, **params):
+    response = client.get('/api/admin/slow-queries', query_string=params, headers=ADMIN)
+    assert response.status_code == 200
+    return json.loads(response.data)
+
+class TestNormalization:
+    """Test cases for grouping statements by shape"""
+
+    def test_literals_and_placeholders_collapse(self):
+        """Test statements differing only in values normalize alike"""
+        assert normalize_sql("SELECT *  FROM product\n WHERE id = 7 AND name = 'x'") == \
+            normalize_sql('SELECT * FROM product WHERE id = ? AND name = ?')
+        assert normalize_sql('SELECT * FROM t WHERE a = %(a_1)s AND b = :b') == \
+            'SELECT * FROM t WHERE a = ? AND b = ?'
+
+    def test_in_lists_collapse(self):
+        """Test IN lists of any length share one entry"""
+        assert normalize_sql('SELECT * FROM t WHERE id IN (?, ?, ?)') == \
+            normalize_sql('SELECT * FROM t WHERE id IN (?, ?)') == 'SELECT * FROM t WHERE id IN (...)'
+
+    def test_identifiers_and_casts_kept(self):
+        """Test digits inside names and PostgreSQL casts are not rewritten"""
+        assert normalize_sql('SELECT anon_1.x::text FROM sales_rollup_hourly AS anon_1') == \
+            'SELECT anon_1.x::text FROM sales_rollup_hourly AS anon_1'
+
+    def test_strings_redacted(self):
+        """Test parameter strings are replaced by their type"""
+        assert redact_parameters(('a@b.co', 3, None, 2.5)) == ['<str>', 3, None, 2.5]
+        assert redact_parameters({'email': 'a@b.co', 'id': 1}) == {'email': '<str>', 'id': 1}
+        assert redact_parameters([('x',), ('y',)], executemany=True) == {'rows': 2, 'first': ['<str>']}
+
+class TestRecorder:
+    """Test cases for recording and ranking slow statements"""
+
+    def test_disabled_registers_nothing(self):
+        """Test a disabled log adds no engine listeners"""
+        log = SlowQueryLog()
+        assert not log.enabled
+        assert not event.contains(Engine, 'before_cursor_execute', log._before)
+
+    def test_route_statements_recorded_with_plan(self, client):
+        """Test a request's statements are attributed to its endpoint and explained"""
+        client.get('/api/products')
+        client.get('/api/products')
+        queries = _report(client)['queries']
+        product_query = next(q for q in queries if 'FROM product' in q['statement'])
+        assert product_query['endpoints'] == {'get_products': 2}
+        assert product_query['count'] == 2
+        assert any('product' in line for line in product_query['explain'])
+
+    def test_parameters_redacted_in_report(self, client):
+        """Test customer data never reaches the report"""
+        client.post('/api/cart/add', json={'session_id': 'secret-session', 'product_id': 1})
+        assert 'secret-session' not in json.dumps(_report(client))
+
+    def test_top_limited_and_sorted(self, client):
+        """Test the report is ordered by total time and honours limit"""
+        for _ in range(3):
+            client.get('/api/products')
+        client.get('/api/cart?session_id=abc')
+        queries = _report(client, limit=2)['queries']
+        assert len(queries) == 2
+        assert queries[0]['total_ms'] >= queries[1]['total_ms']
+
+    def test_failed_statements_leave_nothing_behind(self, client):
+        """Test statements that raise are not timed or kept on the connection"""
+        with app.app_context(), db.engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(DBAPIError):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+                connection.rollback()
+            connection.execute(text('SELECT count(*) FROM product'))
+            assert 'slow_query_started' not in connection.info
+        statements = [q['statement'] for q in _report(client)['queries']]
+        assert 'SELECT count(*) FROM product' in statements
+        assert not any('no_such_table' in statement for statement in statements)
+
+    def test_least_costly_statement_evicted(self):
+        """Test the table keeps a bounded number of statements"""
+        log = SlowQueryLog()
+        log.max_statements, log.explain = 2, False
+        log.record(None, 'SELECT 1 FROM a', (), 0.5)
+        log.record(None, 'SELECT 1 FROM b', (), 0.1)
+        log.record(None, 'SELECT 1 FROM c', (), 0.3)
+        assert [q['statement'] for q in log.top()] == ['SELECT ? FROM a', 'SELECT ? FROM c']
+
+class TestEndpoint:
+    """Test cases for the admin endpoint"""
+
+    def test_admin_token_required(self, client):
+        """Test the report is not public"""
+        assert client.get('/api/admin/slow-queries').status_code == 401
+
+    def test_delete_resets(self, client):
+        """Test DELETE clears this worker's table"""
+        client.get('/api/products')
+        assert client.delete('/api/admin/slow-queries', headers=ADMIN).status_code == 204
+        statements = [q['statement'] for q in _report(client)['queries']]
+        assert not any('FROM product' in statement for statement in statements)
+
+    def test_bad_limit_rejected(self, client):
+        """Test a non-numeric limit is a client error"""
+        response = client.get('/api/admin/slow-queries?limit=all', headers=ADMIN)
+        assert response.status_code == 400
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
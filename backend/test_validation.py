@@ -0,0 +1,138 @@
+"""
+Test cases for the compiled request validation layer
+Covers field checks, sanitizing, structured errors and the route schemas
+"""
+import pytest
+import json
+from app import app, db, sanitize_input, validate_email, CHECKOUT_SCHEMA, Product
+from validation import Field, Schema, ValidationError, strip_sql
+
+HOSTILE_INPUTS = [
+    "'; DROP TABLE orders; --",
+    "1 OR 1=1; SELECT * FROM users",
+    "SEL;ECT name FROM products",
+    "50% off -- select 'everything'",
+    "robert'); delete from carts;--",
+    "  ExEcUtE xp_cmdshell  ",
+    "normal-session_id.123",
+    "-SELECT-",
+    "-DROP-TABLE",
+    "x-Delete-;-y",
+]
+
+@pytest.fixture(scope='module')
+def seed():
+    """One product with plenty of stock"""
+    return lambda: db.session.add(Product(name='Plenty', price=10.0, stock=100))
+
+@pytest.fixture
+def client(transactional_client):
+    """Create test client; each test's changes are rolled back"""
+    return transactional_client
+
+def _card_checkout(**overrides):
+    payload = {
+        'session_id': 'buyer',
+        'email': 'test@example.com',
+        'payment_method': 'card',
+        'card_number': '4111 1111 1111 1111',
+        'cvv': '123',
+        'expiry_date': '12/25',
+        'shipping_address': '123 Test St',
+    }
+    payload.update(overrides)
+    return payload
+
+class TestSchema:
+    """Test cases for compiled schemas"""
+
+    def test_sanitize_matches_legacy_helper(self):
+        """Test the precompiled patterns strip exactly what sanitize_input did"""
+        schema = Schema(value=Field(sanitize=True))
+        for value in HOSTILE_INPUTS:
+            assert strip_sql(value) == sanitize_input(value)
+            assert schema.validate({'value': value})['value'] == (sanitize_input(value) or None)
+
+    def test_valid_body_cleaned(self):
+        """Test a valid checkout body is normalized in one call"""
+        values = CHECKOUT_SCHEMA.validate(_card_checkout(email='  test@example.com '))
+        assert values['email'] == 'test@example.com'
+        assert values['card_number'] == '4111111111111111'
+        assert values['discount_code'] == ''
+
+    def test_all_errors_collected(self):
+        """Test every failing field is reported with a code"""
+        with pytest.raises(ValidationError) as excinfo:
+            CHECKOUT_SCHEMA.validate(_card_checkout(email='nope', cvv='12', session_id=7))
+        errors = {e['field']: e['code'] for e in excinfo.value.errors}
+        assert errors == {'session_id': 'type', 'email': 'format', 'cvv': 'format'}
+        assert excinfo.value.to_dict()['error'] == 'Invalid session_id'
+
+    def test_card_fields_only_checked_for_card_payments(self):
+        """Test card details are ignored unless paying by card"""
+        values = CHECKOUT_SCHEMA.validate(_card_checkout(payment_method='paypal', cvv='x'))
+        assert values['cvv'] is None
+        with pytest.raises(ValidationError):
+            CHECKOUT_SCHEMA.validate(_card_checkout(cvv='x'))
+
+    def test_length_limit_checked_before_sanitizing(self):
+        """Test oversized strings are rejected as too long"""
+        schema = Schema(name=Field(max_length=10, sanitize=True))
+        with pytest.raises(ValidationError) as excinfo:
+            schema.validate({'name': "'" * 1000})
+        assert excinfo.value.errors[0]['code'] == 'max_length'
+
+    def test_int_fields_reject_bools_and_strings(self):
+        """Test integer fields accept only real integers"""
+        schema = Schema(quantity=Field(int, min_value=1))
+        for value in (True, '2', 1.5, 0):
+            with pytest.raises(ValidationError):
+                schema.validate({'quantity': value})
+        assert schema.validate({'quantity': 2}) == {'quantity': 2}
+
+    def test_email_format_matches_legacy_helper(self):
+        """Test the compiled email check agrees with validate_email"""
+        schema = Schema(email=Field(format='email'))
+        for email in ['a@b.co', 'test..x@example.com', '.a@b.com', 'a@b', 'a b@c.com', 'x@y.org.']:
+            try:
+                schema.validate({'email': email})
+                valid = True
+            except ValidationError:
+                valid = False
+            assert valid == validate_email(email)
+
+class TestRouteValidation:
+    """Test cases for schema errors returned by the routes"""
+
+    def test_structured_errors_returned(self, client):
+        """Test a bad body returns the legacy error plus per-field errors"""
+        response = client.post('/api/cart/add', json={'session_id': 'buyer', 'product_id': 'one'})
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        assert data['error'] == 'Invalid product_id'
+        assert data['errors'] == [{'field': 'product_id', 'code': 'type', 'message': 'Invalid product_id'}]
+
+    def test_non_object_body_rejected(self, client):
+        """Test non-JSON and non-object bodies get a 400 instead of a 500"""
+        assert client.post('/api/cart/add', data='not json').status_code == 400
+        assert client.post('/api/checkout', json=['a', 'list']).status_code == 400
+
+    def test_wrong_types_rejected(self, client):
+        """Test non-string values in string fields are a client error"""
+        response = client.post('/api/checkout', json=_card_checkout(email=12345))
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'Invalid email address'
+
+    def test_invalid_card_rejected_before_cart_lookup(self, client):
+        """Test card format errors are reported even with an empty cart"""
+        response = client.post('/api/checkout', json=_card_checkout(card_number='1234'))
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'Invalid card number'
+
+    def test_card_with_separators_accepted(self, client):
+        """Test spaced card numbers still check out"""
+        client.post('/api/cart/add', json={'session_id': 'buyer', 'product_id': 1, 'quantity': 1})
+        assert client.post('/api/checkout', json=_card_checkout()).status_code == 201
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
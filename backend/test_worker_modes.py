@@ -0,0 +1,192 @@
+"""
+Test cases for threaded/greenlet worker safety
+Covers per-thread session scoping, gunicorn mode selection and background mail
+"""
+import pytest
+import gc
+import os
+import runpy
+import subprocess
+import sys
+import threading
+from flask import Flask
+from app import app, db, create_app, request_logs
+from mailer import AsyncMailer
+
+class _RecordingMail:
+    """Stands in for Flask-Mail and records which thread delivered"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def send(self, message):
+        if self.fail:
+            raise ConnectionError('SMTP unavailable')
+        self.sent.append((message, threading.current_thread().name))
+
+class TestSessionScoping:
+    """Test cases for SQLAlchemy session isolation between threads"""
+
+    def test_session_is_per_thread(self):
+        """Test each concurrently running app context gets its own session"""
+        sessions = []
+        barrier = threading.Barrier(4)
+
+        def handle_request():
+            with app.app_context():
+                barrier.wait()
+                session = db.session()
+                assert db.session() is session
+                sessions.append(session)
+
+        threads = [threading.Thread(target=handle_request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(s) for s in sessions}) == 4
+
+    def test_session_removed_after_context(self):
+        """Test a new app context on the same thread never reuses a session"""
+        with app.app_context():
+            first = db.session()
+        with app.app_context():
+            second = db.session()
+        assert first is not second
+
+class TestGunicornConfig:
+    """Test cases for worker mode selection"""
+
+    def _load(self, monkeypatch, **env):
+        monkeypatch.delenv('WORKER_CONCURRENCY', raising=False)
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        path = os.path.join(os.path.dirname(__file__), 'gunicorn.conf.py')
+        return runpy.run_path(path)
+
+    def test_sync_is_default(self, monkeypatch):
+        """Test the default keeps one request per process"""
+        config = self._load(monkeypatch)
+        assert config['worker_class'] == 'sync'
+        assert os.environ['WORKER_CONCURRENCY'] == '1'
+
+    def test_gthread_exports_thread_count(self, monkeypatch):
+        """Test gthread mode sizes the pool to its thread count"""
+        config = self._load(monkeypatch, GUNICORN_WORKER_MODE='gthread', GUNICORN_THREADS='16')
+        assert config['worker_class'] == 'gthread'
+        assert config['threads'] == 16
+        assert os.environ['WORKER_CONCURRENCY'] == '16'
+
+    def test_unknown_mode_rejected(self, monkeypatch):
+        """Test a typo in the mode fails fast instead of silently using sync"""
+        with pytest.raises(SystemExit):
+            self._load(monkeypatch, GUNICORN_WORKER_MODE='eventlet-ish')
+
+class TestAsyncMailer:
+    """Test cases for background mail delivery"""
+
+    def test_send_runs_off_request_thread(self):
+        """Test messages are delivered on the mail pool"""
+        mail = _RecordingMail()
+        mailer = AsyncMailer(mail, Flask(__name__))
+        mailer.send('hello').result(timeout=5)
+        assert mail.sent[0][0] == 'hello'
+        assert mail.sent[0][1].startswith('mail')
+
+    def test_send_inline_when_disabled(self):
+        """Test MAIL_ASYNC=False delivers on the calling thread"""
+        flask_app = Flask(__name__)
+        flask_app.config['MAIL_ASYNC'] = False
+        mail = _RecordingMail()
+        assert AsyncMailer(mail, flask_app).send('hello') is None
+        assert mail.sent[0][1] == threading.current_thread().name
+
+    def test_failed_delivery_does_not_raise_in_caller(self):
+        """Test SMTP errors stay on the mail thread"""
+        mailer = AsyncMailer(_RecordingMail(fail=True), Flask(__name__))
+        future = mailer.send('hello')
+        assert isinstance(future.exception(timeout=5), ConnectionError)
+
+class TestStartup:
+    """Test cases for preload-friendly startup"""
+
+    def test_import_skips_mail(self):
+        """Test importing the app does not load Flask-Mail"""
+        result = subprocess.run(
+            [sys.executable, '-c', "import sys, app; print('flask_mail' in sys.modules)"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        assert result.stdout.strip() == 'False'
+
+    def test_mail_created_on_first_send(self):
+        """Test Flask-Mail is set up when the first message goes out"""
+        flask_app = Flask(__name__)
+        flask_app.config.update(MAIL_ASYNC=False, MAIL_SUPPRESS_SEND=True)
+        mailer = AsyncMailer(app=flask_app)
+        assert mailer.mail is None
+        with flask_app.app_context():
+            mailer.send(mailer.message(subject='Hi', recipients=['a@b.co'], body='x', sender='s@b.co'))
+        assert mailer.mail is not None
+        assert 'mail' in flask_app.extensions
+
+    def test_message_without_sender_before_first_send(self):
+        """Test building a message falls back to MAIL_DEFAULT_SENDER on a cold mailer"""
+        flask_app = Flask(__name__)
+        flask_app.config['MAIL_DEFAULT_SENDER'] = 'shop@example.com'
+        mailer = AsyncMailer(app=flask_app)
+        with flask_app.app_context():
+            message = mailer.message(subject='Hi', recipients=['a@b.co'], body='x', sender='')
+        assert message.sender == 'shop@example.com'
+
+    def test_create_app_leaves_no_open_connections(self):
+        """Test the factory closes what startup opened before workers fork"""
+        with app.app_context():
+            db.session.execute(db.text('SELECT 1'))
+            db.session.remove()
+            try:
+                assert create_app() is app
+            finally:
+                gc.unfreeze()
+                request_logs.shutdown()
+            assert db.engine.pool.checkedin() == 0
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+    def test_forked_child_gets_fresh_pool(self):
+        """Test a forked worker never reuses the parent's pooled connections"""
+        with app.app_context():
+            db.session.execute(db.text('SELECT 1'))
+            db.session.remove()
+            parent_pool = db.engine.pool
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if db.engine.pool is not parent_pool else 1)
+            _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+    def test_fork_while_replica_lock_held(self):
+        """Test the child hook does not wait on a lock held by a parent thread"""
+        replicas = app.extensions['replicas']
+        held, done = threading.Event(), threading.Event()
+
+        def hold():
+            with replicas._lock:
+                held.set()
+                done.wait(10)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait(5)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if replicas._lock.acquire(timeout=2) else 1)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            done.set()
+            holder.join()
+        assert os.WEXITSTATUS(status) == 0
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
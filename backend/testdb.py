@@ -0,0 +1,159 @@
+"""
+Isolated databases for parallel test runs (``pytest -n auto``).
+
+app.py binds its engine to DATABASE_URL at import, so pytest-xdist
+workers would otherwise share one database and drop each other's tables
+mid-test. The controller builds a template with the current schema
+once, and every worker clones it before importing the app:
+
+* SQLite - the template file is copied to one file per worker
+* PostgreSQL - ``CREATE DATABASE <name>_<worker> TEMPLATE <name>_template``
+
+Both are fast: a file copy, or a server-side copy of the template's
+pages. conftest.py wires this up, and runs without ``-n`` keep using
+DATABASE_URL unchanged.
+
+Seed data is copied the same way. The first worker to need a module's
+seed fills its own database from the template, seeds it and saves it as
+a seeded copy of the template (under a lock, so it happens once per
+run); every other worker, and every later module with the same seed,
+just copies that in.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+TEMPLATE_ENV = 'TEST_DATABASE_TEMPLATE'
+_TEMPLATE_SUFFIX = '_template'
+
+
+def _is_sqlite(url):
+    return url.get_backend_name() == 'sqlite'
+
+
+def _render(url):
+    return url.render_as_string(hide_password=False)
+
+
+def _server_command(url, *statements):
+    # CREATE/DROP DATABASE cannot run inside a transaction
+    engine = create_engine(url.set(database='postgres'), isolation_level='AUTOCOMMIT')
+    try:
+        with engine.connect() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+    finally:
+        engine.dispose()
+
+
+def build_template(metadata, base_url=None):
+    """Create a database holding metadata's schema; returns its URL"""
+    url = make_url(base_url) if base_url else None
+    if url is None or _is_sqlite(url):
+        directory = tempfile.mkdtemp(prefix='pytest-db-')
+        template = make_url(f"sqlite:///{os.path.join(directory, 'template.db')}")
+    else:
+        template = url.set(database=url.database + _TEMPLATE_SUFFIX)
+        _server_command(url, f'DROP DATABASE IF EXISTS "{template.database}"',
+                        f'CREATE DATABASE "{template.database}"')
+    engine = create_engine(template)
+    try:
+        metadata.create_all(engine)
+    finally:
+        # PostgreSQL refuses to copy a template that has open connections
+        engine.dispose()
+    return _render(template)
+
+
+def clone_for_worker(template_url, worker):
+    """Give `worker` (e.g. 'gw0') its own copy of the template; returns its URL"""
+    template = make_url(template_url)
+    if _is_sqlite(template):
+        target = f"sqlite:///{os.path.join(os.path.dirname(template.database), f'{worker}.db')}"
+    else:
+        name = template.database[:-len(_TEMPLATE_SUFFIX)] + f'_{worker}'
+        target = _render(template.set(database=name))
+    copy(template_url, target)
+    return target
+
+
+def seeded_url(template_url, seed_name):
+    """URL for the template's copy with `seed_name`'s rows (may not exist yet)"""
+    template = make_url(template_url)
+    digest = hashlib.blake2b(seed_name.encode(), digest_size=4).hexdigest()
+    if _is_sqlite(template):
+        return f"sqlite:///{os.path.join(os.path.dirname(template.database), f'seed-{digest}.db')}"
+    return _render(template.set(database=f'{template.database}_{digest}'))
+
+
+def exists(database_url):
+    url = make_url(database_url)
+    if _is_sqlite(url):
+        return os.path.exists(url.database)
+    engine = create_engine(url.set(database='postgres'))
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                                      {'name': url.database}).first() is not None
+    finally:
+        engine.dispose()
+
+
+def copy(source_url, target_url):
+    """Replace the target database with a copy of the source.
+
+    Nothing may be connected to either one (dispose the app's engines first).
+    """
+    source, target = make_url(source_url), make_url(target_url)
+    if _is_sqlite(source):
+        # Copy aside and rename, so no reader ever sees a half-written file
+        shutil.copyfile(source.database, target.database + '.tmp')
+        os.replace(target.database + '.tmp', target.database)
+        return
+    _server_command(source, f'DROP DATABASE IF EXISTS "{target.database}"',
+                    f'CREATE DATABASE "{target.database}" TEMPLATE "{source.database}"')
+
+
+def _lock_path(url):
+    if _is_sqlite(url):
+        return url.database + '.lock'
+    return os.path.join(tempfile.gettempdir(), f'{url.database}.lock')
+
+
+@contextmanager
+def locked(database_url):
+    """Hold an exclusive lock on a database name across local processes"""
+    with open(_lock_path(make_url(database_url)), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def discard(database_url):
+    """Remove a template or worker database created here"""
+    url = make_url(database_url)
+    if _is_sqlite(url):
+        if os.path.basename(url.database) == 'template.db':
+            shutil.rmtree(os.path.dirname(url.database), ignore_errors=True)
+        elif os.path.exists(url.database):
+            os.remove(url.database)
+        return
+    if url.database.endswith(_TEMPLATE_SUFFIX):
+        # Its seeded copies go with it
+        engine = create_engine(url.set(database='postgres'))
+        try:
+            with engine.connect() as connection:
+                seeded = connection.execute(text('SELECT datname FROM pg_database WHERE datname LIKE :prefix'),
+                                            {'prefix': url.database + '\\_%'}).scalars().all()
+        finally:
+            engine.dispose()
+        for name in seeded:
+            discard(_render(url.set(database=name)))
+    _server_command(url, f'DROP DATABASE IF EXISTS "{url.database}"')
+    if os.path.exists(_lock_path(url)):
+        os.remove(_lock_path(url))
@@ -45,7 +45,7 @@ echo -e "  API: $API_URL"
 echo ""
 
 # Test scenarios
-SCENARIOS=("load-test" "stress-test")
+SCENARIOS=("load-test" "stress-test" "overload-test")
 
 for SCENARIO in "${SCENARIOS[@]}"; do
     echo -e "${BLUE}Running $SCENARIO...${NC}"
@@ -66,7 +66,7 @@ import os
 from datetime import datetime
 
 reports_dir = "$REPORTS_DIR"
-scenarios = ["load-test", "stress-test"]
+scenarios = ["load-test", "stress-test", "overload-test"]
 
 html = '''<!DOCTYPE html>
 <html>
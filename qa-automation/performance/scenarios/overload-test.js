@@ -0,0 +1,77 @@
+import http from 'k6/http';
+import { check, sleep } from 'k6';
+import { Counter, Trend } from 'k6/metrics';
+
+// Overload test - push well past saturation and check that admission
+// control keeps latency bounded by shedding instead of queueing
+export const options = {
+  stages: [
+    { duration: '1m', target: 50 },   // Below saturation
+    { duration: '2m', target: 200 },  // Saturate 4 sync workers
+    { duration: '2m', target: 400 },  // Well past saturation
+    { duration: '1m', target: 0 },    // Recover
+  ],
+  thresholds: {
+    http_req_duration: ['p(95)<2000', 'p(99)<5000'], // Bounded even when overloaded
+    shed_response_time: ['p(95)<50'],                // 503s answered in milliseconds
+    'checks{priority:critical}': ['rate>0.90'],      // Checkout keeps working
+  },
+};
+
+// Run the API with RATELIMIT_ENABLED=false: every VU shares one client IP
+const API_URL = __ENV.API_URL || 'http://localhost:5001';
+const shedResponseTime = new Trend('shed_response_time', true);
+const shedRequests = new Counter('shed_requests');
+
+function requestHeaders() {
+  // Lets the API measure time spent queued in the listen backlog
+  return {
+    'Content-Type': 'application/json',
+    'X-Request-Start': `t=${(Date.now() / 1000).toFixed(3)}`,
+  };
+}
+
+function record(response, priority) {
+  if (response.status === 503) {
+    shedRequests.add(1, { priority });
+    shedResponseTime.add(response.timings.duration, { priority });
+    check(response, { 'shed with Retry-After': (r) => r.headers['Retry-After'] !== undefined });
+  }
+}
+
+export default function () {
+  const sessionId = `overload-${__VU}-${__ITER}`;
+
+  // Catalog browsing is low priority and shed first
+  const products = http.get(`${API_URL}/api/products`, { headers: requestHeaders() });
+  record(products, 'low');
+  sleep(0.5);
+
+  const added = http.post(
+    `${API_URL}/api/cart/add`,
+    JSON.stringify({
+      session_id: sessionId,
+      product_id: Math.floor(Math.random() * 4) + 1,
+      quantity: 1,
+    }),
+    { headers: requestHeaders() }
+  );
+  record(added, 'normal');
+  sleep(0.5);
+
+  if (added.status === 201) {
+    const order = http.post(
+      `${API_URL}/api/checkout`,
+      JSON.stringify({
+        session_id: sessionId,
+        email: 'loadtest@example.com',
+        payment_method: 'paypal',
+        shipping_address: '123 Load Test St',
+      }),
+      { headers: requestHeaders(), tags: { priority: 'critical' } }
+    );
+    record(order, 'critical');
+    check(order, { 'checkout not shed': (r) => r.status !== 503 }, { priority: 'critical' });
+  }
+  sleep(1);
+}